@@ -67,6 +67,11 @@ class AlarmGnocchiThresholdRule(base.AlarmRule):
         minimum=1, maximum=3600 * 24 * 365), default=60)
     "The time range in seconds over which query"
 
+    exclude_outliers = wsme.wsattr(bool)
+    ("Whether the datapoints further than 2 standard deviations from the "
+     "mean of the window are excluded from the evaluation, the window "
+     "being doubled")
+
     cache = cachetools.TTLCache(maxsize=1, ttl=3600)
     lock = threading.RLock()
 
@@ -111,6 +116,7 @@ class MetricOfResourceRule(AlarmGnocchiThresholdRule):
         rule = self.as_dict_from_keys(['granularity', 'comparison_operator',
                                        'threshold', 'aggregation_method',
                                        'evaluation_periods',
+                                       'exclude_outliers',
                                        'metric',
                                        'resource_id',
                                        'resource_type'])
@@ -134,6 +140,7 @@ class AggregationMetricByResourcesLookupRule(AlarmGnocchiThresholdRule):
         rule = self.as_dict_from_keys(['granularity', 'comparison_operator',
                                        'threshold', 'aggregation_method',
                                        'evaluation_periods',
+                                       'exclude_outliers',
                                        'metric',
                                        'query',
                                        'resource_type'])
@@ -236,5 +243,6 @@ class AggregationMetricsByIdLookupRule(AlarmGnocchiThresholdRule):
         rule = self.as_dict_from_keys(['granularity', 'comparison_operator',
                                        'threshold', 'aggregation_method',
                                        'evaluation_periods',
+                                       'exclude_outliers',
                                        'metrics'])
         return rule
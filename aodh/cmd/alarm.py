@@ -17,6 +17,8 @@
 import cotyledon
 from cotyledon import oslo_config_glue
 from oslo_log import log
+from oslo_utils import encodeutils
+from oslo_utils import uuidutils
 
 from aodh import evaluator as evaluator_svc
 from aodh import event as event_svc
@@ -39,8 +41,11 @@ def evaluator():
     sm = cotyledon.ServiceManager()
     conf = service.prepare_service()
     oslo_config_glue.setup(sm, conf)
+    # NOTE: the workers share the member ID of the service when they split
+    # the alarms between them.
+    member_id = encodeutils.safe_encode(uuidutils.generate_uuid())
     sm.add(evaluator_svc.AlarmEvaluationService,
-           workers=conf.evaluator.workers, args=(conf,))
+           workers=conf.evaluator.workers, args=(conf, member_id))
     sm.run()
 
 
@@ -12,9 +12,12 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import abc
 import bisect
 import hashlib
+import math
 import struct
+import time
 
 from oslo_config import cfg
 from oslo_log import log
@@ -37,6 +40,12 @@ OPTS = [
                  default=1.0,
                  help='Number of seconds between heartbeats for distributed '
                       'coordination.'),
+    cfg.FloatOpt('group_refresh_interval',
+                 default=60.0,
+                 min=1.0,
+                 help='Number of seconds between reads of the members of '
+                      'the partitioning groups, correcting the members '
+                      'cached from the group watchers.'),
     cfg.IntOpt('retry_backoff',
                default=1,
                help='Retry backoff factor when retrying to connect with'
@@ -44,7 +53,37 @@ OPTS = [
     cfg.IntOpt('max_retry_interval',
                default=30,
                help='Maximum number of seconds between retry to join '
-                    'partitioning group')
+                    'partitioning group'),
+    cfg.StrOpt('partitioner',
+               default='ring',
+               choices=[('ring', 'consistent hash ring with 100 virtual '
+                                 'nodes per member'),
+                        ('jump', 'jump consistent hash, evenly balanced '
+                                 'but moving more alarms when members in '
+                                 'the middle of the sorted member IDs '
+                                 'change'),
+                        ('rendezvous', 'rendezvous hashing, only moving '
+                                       'the alarms of the joining or '
+                                       'leaving member'),
+                        ('weighted', 'rendezvous hashing with members '
+                                     'receiving alarms in proportion to '
+                                     'their partitioning_weight'),
+                        ('cost', 'weighted rendezvous hashing with the '
+                                 'weights of the members adjusted to '
+                                 'balance the evaluation time of their '
+                                 'alarms')],
+               help='Algorithm splitting the alarms between the members of '
+                    'the partitioning group. All the members of the group '
+                    'must use the same algorithm.'),
+    cfg.FloatOpt('partitioning_weight',
+                 default=1.0,
+                 min=0.01,
+                 help='Share of the alarms of this member relative to the '
+                      'other members of the group, when the weighted '
+                      'partitioner is used. With the cost partitioner, '
+                      'this is the initial weight of the member, adjusted '
+                      'by the leader of the group between a tenth and ten '
+                      'times this value.'),
 ]
 
 
@@ -62,13 +101,72 @@ class MemberNotInGroupError(Exception):
             {'group_id': group_id, 'members': members, 'me': my_id})
 
 
-class HashRing:
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(key):
+    return struct.unpack_from(
+        '>Q', hashlib.md5(str(key).encode(),
+                          usedforsecurity=False).digest())[0]
+
+
+def _mix64(value):
+    """Scramble a 64 bits integer with the splitmix64 finalizer."""
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return value ^ (value >> 31)
+
+
+class Partitioner(metaclass=abc.ABCMeta):
+    """Assignment of keys to the members of a group.
+
+    The node of each key is memoized, so that the keys of a partitioner
+    kept between evaluation cycles are only hashed once.
+    """
+
+    # Whether the partitioner uses the weights of the members.
+    weighted = False
+    # Whether the weights of the members balance their evaluation cost.
+    balanced = False
+
+    def __init__(self, nodes, weights=None):
+        self._nodes = list(nodes)
+        self._memo = {}
 
-    def __init__(self, nodes, replicas=100):
+    @abc.abstractmethod
+    def _get_node(self, key):
+        """Return the node of a key, the partitioner having nodes."""
+
+    def get_node(self, key):
+        if not self._nodes:
+            return None
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        node = self._memo[key] = self._get_node(key)
+        return node
+
+    def retain(self, keys):
+        """Forget the memoized nodes of the keys no longer looked up.
+
+        The memo is only rebuilt once it holds twice as many keys, to not
+        copy it at every lookup of a slowly changing set of keys.
+        """
+        if len(self._memo) > 2 * len(keys):
+            self._memo = {key: self._memo[key] for key in keys
+                          if key in self._memo}
+
+
+class HashRing(Partitioner):
+    """Consistent hash ring with virtual nodes."""
+
+    def __init__(self, nodes, replicas=100, weights=None):
+        super().__init__(nodes)
         self._ring = dict()
         self._sorted_keys = []
 
-        for node in nodes:
+        for node in self._nodes:
             for r in range(replicas):
                 hashed_key = self._hash(f'{node}-{r}')
                 self._ring[hashed_key] = node
@@ -86,11 +184,92 @@ class HashRing:
         position = bisect.bisect(self._sorted_keys, hashed_key)
         return position if position < len(self._sorted_keys) else 0
 
-    def get_node(self, key):
-        if not self._ring:
-            return None
-        pos = self._get_position_on_ring(key)
-        return self._ring[self._sorted_keys[pos]]
+    def _get_node(self, key):
+        return self._ring[self._sorted_keys[self._get_position_on_ring(key)]]
+
+
+class JumpHash(Partitioner):
+    """Jump consistent hash of Lamping and Veach.
+
+    The keys are evenly spread without any per node state, but the nodes
+    are numbered in their sorted order: only the keys of the joining or
+    leaving node move when it is the last one, while more keys move when
+    the members in the middle of the order change.
+    """
+
+    def __init__(self, nodes, weights=None):
+        super().__init__(sorted(nodes))
+
+    def _get_node(self, key):
+        hashed_key = _hash64(key)
+        bucket, j = -1, 0
+        while j < len(self._nodes):
+            bucket = j
+            hashed_key = (hashed_key * 2862933555777941757 + 1) & _MASK64
+            j = int((bucket + 1) * (float(1 << 31) /
+                                    float((hashed_key >> 33) + 1)))
+        return self._nodes[bucket]
+
+
+class RendezvousHash(Partitioner):
+    """Highest random weight hashing.
+
+    Each key goes to the node with the highest score for this key, so only
+    the keys of the joining or leaving node move.
+    """
+
+    def __init__(self, nodes, weights=None):
+        super().__init__(nodes)
+        self._seeds = [_hash64(node) for node in self._nodes]
+
+    def _get_node(self, key):
+        hashed_key = _hash64(key)
+        scores = [_mix64(seed ^ hashed_key) for seed in self._seeds]
+        return self._nodes[scores.index(max(scores))]
+
+
+class WeightedRendezvousHash(RendezvousHash):
+    """Rendezvous hashing with nodes receiving keys in proportion to weights.
+
+    Nodes without a weight have a weight of 1.
+    """
+
+    weighted = True
+
+    def __init__(self, nodes, weights=None):
+        super().__init__(nodes)
+        weights = weights or {}
+        self._weights = [weights.get(node, 1.0) for node in self._nodes]
+
+    def _get_node(self, key):
+        hashed_key = _hash64(key)
+        scores = [
+            -weight / math.log((_mix64(seed ^ hashed_key) + 0.5) / 2 ** 64)
+            for seed, weight in zip(self._seeds, self._weights)]
+        return self._nodes[scores.index(max(scores))]
+
+
+class CostRendezvousHash(WeightedRendezvousHash):
+    """Weighted rendezvous hashing balancing the evaluation cost.
+
+    The leader of the group adjusts the weights of the members from the
+    evaluation load they publish, see PartitionCoordinator.publish_load().
+    """
+
+    balanced = True
+
+
+PARTITIONERS = {
+    'ring': HashRing,
+    'jump': JumpHash,
+    'rendezvous': RendezvousHash,
+    'weighted': WeightedRendezvousHash,
+    'cost': CostRendezvousHash,
+}
+
+# Relative difference between the load of a member and the mean load of the
+# group from which the cost partitioner adjusts the weight of the member.
+COST_TOLERANCE = 0.1
 
 
 class PartitionCoordinator:
@@ -105,21 +284,52 @@ class PartitionCoordinator:
     service using the partition coordinator need not care whether the
     coordination backend is down. The `extract_my_subset` will simply return an
     empty iterable in this case.
+
+    A passive coordinator shares the member ID of another coordinator, which
+    joins the groups and sends the heartbeats on its behalf, and only reads
+    the group membership to extract its subset. This allows the workers of a
+    service to be a single member of a group.
     """
 
-    def __init__(self, conf, my_id=None):
+    def __init__(self, conf, my_id=None, passive=False):
         self.conf = conf
         self.backend_url = self.conf.coordination.backend_url
         self._coordinator = None
         self._groups = set()
         self._my_id = my_id or \
             encodeutils.safe_encode(uuidutils.generate_uuid())
+        self._passive = passive
+        self._partitioner = PARTITIONERS[
+            self.conf.coordination.partitioner]
+        # group_id -> (members, weights, partitioner, generation), the
+        # partitioner of a group is only rebuilt when its membership or
+        # the generation of its weights changes.
+        self._partitioners = {}
+        # group_id -> {member_id: capabilities}, read by the weighted
+        # partitioners, then updated by the membership watchers.
+        self._capabilities = {}
+        # group_id -> (generation, weights), the last weights published by
+        # the leader of the group with the cost partitioner.
+        self._generations = {}
+        # group_id -> members, kept up to date by the membership watchers
+        self._members = {}
+        # groups whose membership cannot be watched by the backend
+        self._polled_groups = set()
+        self._members_refreshed = None
 
     def start(self):
         if self.backend_url:
+            # NOTE: a passive coordinator connects with its own ID, the
+            # member ID belongs to the coordinator it observes for.
+            member_id = self._my_id
+            if self._passive:
+                member_id = encodeutils.safe_encode(
+                    uuidutils.generate_uuid())
+            # NOTE: the watchers are registered with the previous connection.
+            self._members = {}
             try:
                 self._coordinator = tooz.coordination.get_coordinator(
-                    self.backend_url, self._my_id)
+                    self.backend_url, member_id)
                 self._coordinator.start()
                 LOG.info('Coordination backend started successfully.')
             except tooz.coordination.ToozError:
@@ -147,15 +357,124 @@ class PartitionCoordinator:
             if not self._coordinator.is_started:
                 # re-connect
                 self.start()
+            if not self._passive:
+                try:
+                    self._coordinator.heartbeat()
+                except tooz.coordination.ToozError:
+                    LOG.exception('Error sending a heartbeat to coordination '
+                                  'backend.')
+            self._run_watchers()
+            self._refresh_members()
+
+    def _refresh_members(self):
+        """Read again the members of the watched groups.
+
+        This corrects the cached members of a group, and the capabilities
+        of its members, when a member joined or left between the read of
+        the members and the first run of the watchers.
+        """
+        now = time.monotonic()
+        if (self._members_refreshed is not None and
+                now - self._members_refreshed <
+                self.conf.coordination.group_refresh_interval):
+            return
+        self._members_refreshed = now
+        for group_id in list(self._members):
             try:
-                self._coordinator.heartbeat()
+                members = self._coordinator.get_members(group_id).get()
             except tooz.coordination.ToozError:
-                LOG.exception('Error sending a heartbeat to coordination '
-                              'backend.')
+                LOG.warning('Cannot refresh the members of group %s',
+                            group_id)
+                continue
+            if group_id not in self._members:
+                continue
+            members = self._members[group_id] = frozenset(members)
+            capabilities = self._capabilities.get(group_id)
+            if capabilities is not None:
+                joined = members.difference(capabilities)
+                self._capabilities[group_id] = {
+                    **{member: c for member, c in capabilities.items()
+                       if member in members},
+                    **(self._get_capabilities(group_id, joined)
+                       if joined else {})}
+
+    def _run_watchers(self):
+        if not self._members:
+            return
+        try:
+            self._coordinator.run_watchers()
+        except tooz.coordination.ToozError:
+            LOG.exception('Error running the group membership watchers, '
+                          'polling the group membership until they are '
+                          'registered again.')
+            for group_id in list(self._members):
+                self._unwatch_members(group_id)
+
+    def _watch_members(self, group_id):
+        """Watch the membership of a group, whose members can be cached."""
+        try:
+            self._coordinator.watch_join_group(group_id,
+                                               self._on_member_joined)
+            self._coordinator.watch_leave_group(group_id,
+                                                self._on_member_left)
+        except tooz.NotImplemented:
+            LOG.info('The coordination backend cannot watch the membership '
+                     'of group %s, polling it', group_id)
+            self._polled_groups.add(group_id)
+            return False
+        except tooz.coordination.GroupNotCreated:
+            # NOTE: the group is watched once it is joined.
+            return False
+        except tooz.coordination.ToozError:
+            LOG.exception('Error watching the membership of group %s',
+                          group_id)
+            return False
+        return True
+
+    def _unwatch_members(self, group_id):
+        if self._members.pop(group_id, None) is not None:
+            self._unwatch(group_id)
+
+    def _unwatch(self, group_id):
+        for unwatch, callback in (
+                (self._coordinator.unwatch_join_group,
+                 self._on_member_joined),
+                (self._coordinator.unwatch_leave_group,
+                 self._on_member_left)):
+            try:
+                unwatch(group_id, callback)
+            except (tooz.coordination.ToozError, ValueError):
+                pass
+
+    def _on_member_joined(self, event):
+        # NOTE: the cached members are replaced rather than updated, they
+        # are read by other threads.
+        members = self._members.get(event.group_id)
+        if members is not None:
+            LOG.info('Member %s joined group %s', event.member_id,
+                     event.group_id)
+            self._members[event.group_id] = members | {event.member_id}
+        capabilities = self._capabilities.get(event.group_id)
+        if capabilities is not None:
+            self._capabilities[event.group_id] = {
+                **capabilities,
+                **self._get_capabilities(event.group_id, [event.member_id])}
+
+    def _on_member_left(self, event):
+        members = self._members.get(event.group_id)
+        if members is not None:
+            LOG.info('Member %s left group %s', event.member_id,
+                     event.group_id)
+            self._members[event.group_id] = members - {event.member_id}
+        capabilities = self._capabilities.get(event.group_id)
+        if capabilities is not None:
+            self._capabilities[event.group_id] = {
+                member: c for member, c in capabilities.items()
+                if member != event.member_id}
 
     def join_group(self, group_id):
         if (not self._coordinator or not self._coordinator.is_started
-                or not group_id):
+                or not group_id or self._passive):
             return
 
         @tenacity.retry(
@@ -166,7 +485,12 @@ class PartitionCoordinator:
                 ErrorJoiningPartitioningGroup))
         def _inner():
             try:
-                join_req = self._coordinator.join_group(group_id)
+                capabilities = b''
+                if self._partitioner.weighted:
+                    capabilities = {
+                        'weight': self.conf.coordination.partitioning_weight}
+                join_req = self._coordinator.join_group(group_id,
+                                                        capabilities)
                 join_req.get()
                 LOG.info('Joined partitioning group %s', group_id)
             except tooz.coordination.MemberAlreadyExist:
@@ -190,20 +514,210 @@ class PartitionCoordinator:
         if group_id not in self._groups:
             return
         if self._coordinator:
+            self._unwatch_members(group_id)
             self._coordinator.leave_group(group_id)
             self._groups.remove(group_id)
             LOG.info('Left partitioning group %s', group_id)
 
-    def _get_members(self, group_id):
+    def _get_members(self, group_id, refresh=False):
+        """Return the members of a group.
+
+        The members are read from the backend the first time, then from
+        the cache updated by the membership watchers, unless refresh is
+        set or the backend cannot watch the group membership.
+        """
         if not self._coordinator:
             return [self._my_id]
 
-        while True:
-            get_members_req = self._coordinator.get_members(group_id)
+        members = self._members.get(group_id)
+        if members is not None and not refresh:
+            return members
+
+        # NOTE: the watchers are registered before reading the members, so
+        # that they see the members joining or leaving after the read.
+        watched = group_id in self._members
+        watching = (not watched and group_id not in self._polled_groups
+                    and self._watch_members(group_id))
+        try:
+            while True:
+                get_members_req = self._coordinator.get_members(group_id)
+                try:
+                    members = get_members_req.get()
+                    break
+                except tooz.coordination.GroupNotCreated:
+                    if self._passive:
+                        raise
+                    self.join_group(group_id)
+        except tooz.coordination.GroupNotCreated:
+            if watching:
+                self._unwatch(group_id)
+            return []
+        except tooz.coordination.ToozError:
+            if watching:
+                self._unwatch(group_id)
+            raise
+
+        if watched or watching:
+            self._members[group_id] = frozenset(members)
+        return members
+
+    def _get_capabilities(self, group_id, members):
+        """Return the capabilities of some members of a group.
+
+        The capabilities of several members are read with a single request
+        when the coordination backend supports it, member by member
+        otherwise.
+        """
+        if len(members) > 1:
             try:
-                return get_members_req.get()
-            except tooz.coordination.GroupNotCreated:
-                self.join_group(group_id)
+                capabilities = (
+                    self._coordinator.get_members_with_capabilities(
+                        group_id).get())
+            except (AttributeError, tooz.NotImplemented):
+                # NOTE: older tooz releases and some backends cannot read
+                # the capabilities of the whole group.
+                pass
+            except tooz.coordination.ToozError:
+                LOG.warning('Cannot get the capabilities of the members of '
+                            'group %s', group_id)
+                return {}
+            else:
+                return {member: c for member, c in capabilities.items()
+                        if member in members and isinstance(c, dict)}
+        result = {}
+        for member in members:
+            try:
+                capabilities = self._coordinator.get_member_capabilities(
+                    group_id, member).get()
+            except tooz.coordination.ToozError:
+                LOG.warning('Cannot get the capabilities of member %s',
+                            member)
+                continue
+            if isinstance(capabilities, dict):
+                result[member] = capabilities
+        return result
+
+    def _get_partitioner(self, group_id, members):
+        members = tuple(sorted(members))
+        cached = self._partitioners.get(group_id)
+        weights = None
+        generation = None
+        if self._partitioner.weighted:
+            # NOTE: the capabilities are read once, then updated by the
+            # membership watchers.
+            capabilities = self._capabilities.get(group_id)
+            if capabilities is None:
+                capabilities = self._get_capabilities(group_id, members)
+                self._capabilities[group_id] = capabilities
+            weights = {member: c.get('weight', 1.0)
+                       for member, c in capabilities.items()
+                       if member in members}
+            if self._partitioner.balanced and members:
+                generation, balanced = self._get_generation(group_id,
+                                                            members)
+                weights = {member: balanced.get(member, weight)
+                           for member, weight in weights.items()}
+        if (cached and cached[0] == members and cached[1] == weights and
+                cached[3] == generation):
+            return cached[2]
+        LOG.debug('Building the partitioner of members: %s, weights: %s',
+                  members, weights)
+        partitioner = self._partitioner(members, weights=weights)
+        self._partitioners[group_id] = (members, weights, partitioner,
+                                        generation)
+        return partitioner
+
+    def _get_generation(self, group_id, members):
+        """Return the generation and the weights of the group leader.
+
+        The leader of a group is its member with the lowest ID. The
+        partitioner of the members only changes with the membership of the
+        group or the generation of the weights published by its leader, so
+        that all the members partition the alarms with the same weights.
+        """
+        leader = min(members)
+        if leader != self._my_id or self._passive:
+            try:
+                capabilities = self._coordinator.get_member_capabilities(
+                    group_id, leader).get()
+            except tooz.coordination.ToozError:
+                LOG.warning('Cannot get the weights of the leader of group '
+                            '%s', group_id)
+                capabilities = None
+            # NOTE: the weights of the previous leader are kept until the
+            # new leader publishes its own.
+            if isinstance(capabilities, dict) and 'generation' in capabilities:
+                self._generations[group_id] = (capabilities['generation'],
+                                               capabilities['weights'])
+        return self._generations.get(group_id, (0, {}))
+
+    def publish_load(self, group_id, load):
+        """Publish the evaluation load of this member to the group.
+
+        With the cost partitioner, each member publishes the load of the
+        alarms it partitioned with the current generation of the weights.
+        The leader of the group then adjusts the weights, see _balance().
+
+        :param group_id: The partitioning group.
+        :param load: Evaluation time of the alarms of this member during
+                     an evaluation cycle.
+        """
+        if (not self._partitioner.balanced or self._passive or
+                not self._coordinator or group_id not in self._groups):
+            return
+        partitioned = self._partitioners.get(group_id)
+        capabilities = {
+            'weight': self.conf.coordination.partitioning_weight,
+            'load': load,
+            'load_generation': partitioned[3] if partitioned else None}
+        try:
+            members = self._get_members(group_id)
+            if members and min(members) == self._my_id:
+                capabilities.update(self._balance(group_id, members,
+                                                  capabilities))
+            self._coordinator.update_capabilities(
+                group_id, capabilities).get()
+        except tooz.coordination.ToozError:
+            LOG.exception('Error publishing the load to the coordination '
+                          'backend.')
+
+    def _balance(self, group_id, members, capabilities):
+        """Adjust the weights of the members of a group, as its leader.
+
+        The weight of a member more loaded than the mean of the group
+        decreases, so that the next partitioning gives it less alarms. The
+        weights only change, with their generation, once every member
+        published a load measured with the current weights, so that a
+        member is not adjusted again before its load reflects the last
+        adjustment.
+
+        :returns: the generation and the weights to publish.
+        """
+        generation, weights = self._generations.get(group_id, (0, {}))
+        group = self._get_capabilities(group_id, members)
+        group[self._my_id] = capabilities
+        self._capabilities[group_id] = group
+        current = {member: weights.get(member, c.get('weight', 1.0))
+                   for member, c in group.items()}
+        if any(c.get('load_generation') != generation or 'load' not in c
+               for c in group.values()):
+            return {'generation': generation, 'weights': current}
+        mean = sum(c['load'] for c in group.values()) / len(group)
+        balanced = {}
+        for member, c in group.items():
+            base = c.get('weight', 1.0)
+            weight, load = current[member], c['load']
+            if load > 0 and abs(1 - mean / load) > COST_TOLERANCE:
+                weight = min(max(weight * math.sqrt(mean / load),
+                                 base / 10), base * 10)
+            balanced[member] = weight
+        if balanced != current:
+            generation += 1
+            LOG.info('Adjusted the partitioning weights of group %s to '
+                     '%s, generation %d, for a mean load of %f',
+                     group_id, balanced, generation, mean)
+        self._generations[group_id] = (generation, balanced)
+        return {'generation': generation, 'weights': balanced}
 
     @tenacity.retry(
         wait=tenacity.wait_random(max=2),
@@ -226,18 +740,24 @@ class PartitionCoordinator:
         try:
             members = self._get_members(group_id)
             LOG.debug('Members of group: %s, Me: %s', members, self._my_id)
+            if self._passive and self._my_id not in members:
+                LOG.debug('Cannot extract tasks until %s joins the group',
+                          self._my_id)
+                return []
             if self._my_id not in members:
                 LOG.warning('Cannot extract tasks because agent failed to '
                             'join group properly. Rejoining group.')
                 self.join_group(group_id)
-                members = self._get_members(group_id)
+                members = self._get_members(group_id, refresh=True)
                 if self._my_id not in members:
                     raise MemberNotInGroupError(group_id, members, self._my_id)
                 LOG.debug('Members of group: %s, Me: %s', members, self._my_id)
-            hr = HashRing(members)
+            partitioner = self._get_partitioner(group_id, members)
             LOG.debug('Universal set: %s', universal_set)
-            my_subset = [v for v in universal_set
-                         if hr.get_node(str(v)) == self._my_id]
+            keyed = [(str(v), v) for v in universal_set]
+            my_subset = [v for key, v in keyed
+                         if partitioner.get_node(key) == self._my_id]
+            partitioner.retain([key for key, v in keyed])
             LOG.debug('My subset: %s', my_subset)
             return my_subset
         except tooz.coordination.ToozError:
@@ -15,9 +15,16 @@
 
 
 import abc
+import asyncio
+import collections
+import contextlib
 import datetime
+import functools
+import hashlib
 import json
+import struct
 import threading
+import time
 import zoneinfo
 
 from concurrent import futures
@@ -32,6 +39,10 @@ from stevedore import extension
 
 import aodh
 from aodh import coordination
+from aodh.evaluator import batch
+from aodh.evaluator import inventory
+from aodh.evaluator import memo
+from aodh.evaluator import metrics
 from aodh import keystone_client
 from aodh import messaging
 from aodh import queue
@@ -45,6 +56,15 @@ UNKNOWN = 'insufficient data'
 OK = 'ok'
 ALARM = 'alarm'
 
+# Fraction of the evaluation interval over which the evaluations are spread,
+# the remainder leaves time to the last dispatched evaluations to complete
+# before the next cycle.
+SPREAD_WINDOW = 0.9
+
+# Smoothing factor of the exponentially weighted moving average of the
+# evaluation time of each alarm.
+COST_SMOOTHING = 0.2
+
 
 OPTS = [
     cfg.BoolOpt('record_history',
@@ -54,9 +74,183 @@ OPTS = [
 ]
 
 
+class BackendUnavailable(Exception):
+    """The circuit breaker of a metric backend is open."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        super().__init__('the %s backend is unavailable' % backend)
+
+
+class CircuitBreaker:
+    """Circuit breaker of the requests to a metric backend.
+
+    Closed, the breaker lets the requests through and records the outcome of
+    the last window requests, the requests slower than slow_call seconds
+    counting as failures. It opens when the ratio of failures reaches
+    failure_ratio, the requests then fail immediately with
+    BackendUnavailable. After open_duration seconds, a single probe request
+    is let through: its success closes the breaker, its failure opens it
+    again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, backend, failure_ratio, window, slow_call,
+                 open_duration):
+        self.backend = backend
+        self.failure_ratio = failure_ratio
+        self.slow_call = slow_call
+        self.open_duration = open_duration
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = collections.deque(maxlen=window)
+        self._opened_at = None
+
+    def _acquire(self):
+        """Check whether a request can be sent to the backend.
+
+        :returns: whether the request is the probe of a half-open breaker.
+        :raises BackendUnavailable: if the breaker is open.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if (self.state == self.OPEN and
+                    time.monotonic() - self._opened_at >=
+                    self.open_duration):
+                self.state = self.HALF_OPEN
+                LOG.info('probing the %s backend', self.backend)
+                return True
+            raise BackendUnavailable(self.backend)
+
+    def _record(self, failed, probe):
+        with self._lock:
+            if probe:
+                if failed:
+                    self._open()
+                else:
+                    LOG.info('the %s backend is available again',
+                             self.backend)
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+            elif self.state == self.CLOSED:
+                self._outcomes.append(failed)
+                if (len(self._outcomes) == self._outcomes.maxlen and
+                        sum(self._outcomes) >=
+                        self.failure_ratio * len(self._outcomes)):
+                    self._open()
+
+    def _open(self):
+        LOG.warning('the requests to the %s backend fail or are slow, they '
+                    'are suspended for %d seconds', self.backend,
+                    self.open_duration)
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def call(self, is_failure, func, *args, **kwargs):
+        """Send a request to the backend through the breaker.
+
+        :param is_failure: tells whether an exception raised by the request
+                           means that the backend is failing.
+        """
+        probe = self._acquire()
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record(is_failure(e), probe)
+            raise
+        self._record(bool(self.slow_call and
+                          time.monotonic() - start > self.slow_call), probe)
+        return result
+
+
+class CircuitBreakers:
+    """Circuit breakers of the metric backends, created on first use."""
+
+    def __init__(self, failure_ratio, window, slow_call, open_duration):
+        self._args = (failure_ratio, window, slow_call, open_duration)
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, backend):
+        with self._lock:
+            breaker = self._breakers.get(backend)
+            if breaker is None:
+                breaker = self._breakers[backend] = CircuitBreaker(
+                    backend, *self._args)
+            return breaker
+
+
+class BackendLimits:
+    """Limits of the requests to the metric backends.
+
+    Used by the asyncio evaluation engine to bound the number of concurrent
+    requests to each backend and the time spent waiting for them. The
+    requests to each backend are run in a dedicated pool of concurrency
+    threads, so a request abandoned after the timeout keeps its thread until
+    it completes, and the requests to a slow backend do not hold the threads
+    of the other backends.
+    """
+
+    def __init__(self, concurrency, timeout):
+        self.concurrency = concurrency
+        self.timeout = timeout or None
+        self._lock = threading.Lock()
+        self._executors = {}
+
+    def _executor(self, backend):
+        with self._lock:
+            executor = self._executors.get(backend)
+            if executor is None:
+                executor = self._executors[backend] = (
+                    futures.ThreadPoolExecutor(
+                        max_workers=self.concurrency,
+                        thread_name_prefix='aodh-%s' % backend))
+            return executor
+
+    async def call(self, backend, func, *args):
+        """Run a blocking backend call in the thread pool of the backend.
+
+        :raises TimeoutError: if the call did not return in time, including
+                              the time waiting for a thread. A call already
+                              running is left to complete on its own.
+        """
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(
+                self._executor(backend), func, *args),
+            self.timeout)
+
+    def shutdown(self):
+        """Stop the thread pools, dropping the calls not started."""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors = {}
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
 class Evaluator(metaclass=abc.ABCMeta):
     """Base class for alarm rule evaluator plugins."""
 
+    # Name of the metric backend queried by the evaluator, the requests to a
+    # backend are limited by the backend_limits of the asyncio evaluation
+    # engine.
+    backend = None
+    backend_limits = None
+    # The results of the evaluations are written by the evaluation service
+    # when a write-behind buffer is set.
+    write_buffer = None
+    # The backend queries of an evaluation cycle are shared between its
+    # evaluations when a query memo is set.
+    query_memo = None
+    # The requests to the backend go through its circuit breaker when the
+    # circuit breakers are set.
+    circuit_breakers = None
+
     def __init__(self, conf):
         self.conf = conf
         self.notifier = queue.AlarmNotifier(self.conf)
@@ -84,7 +278,8 @@ class Evaluator(metaclass=abc.ABCMeta):
                 transport, publisher_id="aodh.evaluator")
         return self._alarm_change_notifier
 
-    def _record_change(self, alarm, reason):
+    def _alarm_change(self, alarm, reason):
+        """Return the state transition event of an alarm, if recorded."""
         if not self.conf.record_history:
             return
         type = models.AlarmChange.STATE_TRANSITION
@@ -94,15 +289,20 @@ class Evaluator(metaclass=abc.ABCMeta):
         on_behalf_of = alarm.project_id
         now = timeutils.utcnow()
         severity = alarm.severity
-        payload = dict(event_id=uuidutils.generate_uuid(),
-                       alarm_id=alarm.alarm_id,
-                       type=type,
-                       detail=detail,
-                       user_id=user_id,
-                       project_id=project_id,
-                       on_behalf_of=on_behalf_of,
-                       timestamp=now,
-                       severity=severity)
+        return dict(event_id=uuidutils.generate_uuid(),
+                    alarm_id=alarm.alarm_id,
+                    type=type,
+                    detail=detail,
+                    user_id=user_id,
+                    project_id=project_id,
+                    on_behalf_of=on_behalf_of,
+                    timestamp=now,
+                    severity=severity)
+
+    def _record_change(self, alarm, reason):
+        payload = self._alarm_change(alarm, reason)
+        if not payload:
+            return
 
         try:
             self._storage_conn.record_alarm_change(payload)
@@ -113,32 +313,80 @@ class Evaluator(metaclass=abc.ABCMeta):
                                         notification, payload)
 
     def _increment_evaluation_result(self, alarm_id, project_id, state):
-        if self.conf.enable_evaluation_results_metrics:
+        if not self.conf.enable_evaluation_results_metrics:
+            return
+        if self.write_buffer is not None:
+            self.write_buffer.add_counter(alarm_id, project_id, state)
+        else:
             self._storage_conn.increment_alarm_counter(
                 alarm_id, project_id, state)
 
+    def _load_alarm(self, alarm):
+        """Return the complete alarm of an alarm evaluation view.
+
+        The state, state reason and state timestamp set by the evaluation
+        are kept.
+        """
+        if not isinstance(alarm, models.AlarmEvaluationView):
+            return alarm
+        alarms = list(self._storage_conn.get_alarms(alarm_id=alarm.alarm_id))
+        if not alarms:
+            raise storage.AlarmNotFound(alarm.alarm_id)
+        loaded = alarms[0]
+        loaded.state = alarm.state
+        loaded.state_reason = alarm.state_reason
+        loaded.state_timestamp = alarm.state_timestamp
+        return loaded
+
     def _refresh(self, alarm, state, reason, reason_data, always_record=False):
         """Refresh alarm state."""
+        evaluated = alarm
+        previous_reason = getattr(alarm, 'state_reason', None)
+        previous_timestamp = alarm.state_timestamp
         try:
             previous = alarm.state
             alarm.state = state
             alarm.state_reason = reason
+            if previous != state:
+                # NOTE: the alarm inventories of the other evaluators see
+                # the alarms whose state_timestamp changed.
+                alarm.state_timestamp = timeutils.utcnow()
             if previous != state or always_record:
                 LOG.info('alarm %(id)s transitioning to %(state)s because '
                          '%(reason)s', {'id': alarm.alarm_id,
                                         'state': state,
                                         'reason': reason})
+                if self.write_buffer is not None:
+                    self.write_buffer.add_transition(
+                        self, alarm, previous, reason, reason_data,
+                        previous_reason, previous_timestamp)
+                    return
                 try:
+                    alarm = self._load_alarm(alarm)
                     self._storage_conn.update_alarm(alarm)
                 except storage.AlarmNotFound:
                     LOG.warning("Skip updating this alarm's state, the"
                                 "alarm: %s has been deleted",
                                 alarm.alarm_id)
+                    if isinstance(alarm, models.AlarmEvaluationView):
+                        return
+                except Exception:
+                    # NOTE: the evaluated alarms may be kept in memory
+                    # between cycles, revert their state so that the
+                    # transition is detected again.
+                    evaluated.state = previous
+                    evaluated.state_reason = previous_reason
+                    evaluated.state_timestamp = previous_timestamp
+                    raise
                 else:
                     self._record_change(alarm, reason)
                 self.notifier.notify(alarm, previous, reason, reason_data)
+            elif alarm.repeat_actions and self.write_buffer is not None:
+                self.write_buffer.add_notification(
+                    self, alarm, previous, reason, reason_data)
             elif alarm.repeat_actions:
-                self.notifier.notify(alarm, previous, reason, reason_data)
+                self.notifier.notify(self._load_alarm(alarm), previous,
+                                     reason, reason_data)
         except Exception:
             # retry will occur naturally on the next evaluation
             # cycle (unless alarm state reverts in the meantime)
@@ -183,6 +431,22 @@ class Evaluator(metaclass=abc.ABCMeta):
         diff = (ts - cron.get_next(datetime.datetime)).total_seconds()
         return abs(diff) < 60  # minute precision
 
+    def evaluation_period(self, alarm_rule):
+        """Return the period in seconds at which the alarm data changes.
+
+        None means that the alarm has to be evaluated at every evaluation
+        cycle.
+        """
+        return None
+
+    def prefetch(self, alarms):
+        """Prepare the evaluation of the alarms of an evaluation cycle.
+
+        Called by the evaluation service with the alarms of the evaluator
+        type about to be evaluated, so that their data can be retrieved with
+        a few requests instead of one request per alarm.
+        """
+
     @abc.abstractmethod
     def evaluate(self, alarm):
         """Interface definition.
@@ -191,29 +455,148 @@ class Evaluator(metaclass=abc.ABCMeta):
         alarm Alarm: an instance of the Alarm
         """
 
+    def _memoized(self, key, func, *args):
+        """Run a backend query, shared within the evaluation cycle.
+
+        A None key means that the query is not shared.
+        """
+        if self.query_memo is None or key is None:
+            return func(*args)
+        return self.query_memo.call(key, func, *args)
+
+    @staticmethod
+    def _is_backend_failure(exc):
+        """Tell whether a request error means that the backend fails."""
+        return True
+
+    def _request(self, func, *args, **kwargs):
+        """Send a request to the backend through its circuit breaker.
+
+        :raises BackendUnavailable: if the circuit breaker is open.
+        """
+        if self.circuit_breakers is None or self.backend is None:
+            return func(*args, **kwargs)
+        return self.circuit_breakers.get(self.backend).call(
+            self._is_backend_failure, func, *args, **kwargs)
+
+    async def _call_backend(self, func, *args):
+        """Run a blocking call to the backend from the asyncio engine."""
+        if self.backend is None or self.backend_limits is None:
+            return await asyncio.to_thread(func, *args)
+        return await self.backend_limits.call(self.backend, func, *args)
+
+    async def evaluate_async(self, alarm):
+        """Evaluate an alarm from the asyncio evaluation engine.
+
+        The whole blocking evaluation is run in the thread pool of the event
+        loop by default.
+        """
+        await self._call_backend(self.evaluate, alarm)
+
 
 class AlarmEvaluationService(cotyledon.Service):
 
     PARTITIONING_GROUP_NAME = "alarm_evaluator"
     EVALUATOR_EXTENSIONS_NAMESPACE = "aodh.evaluator"
 
-    def __init__(self, worker_id, conf):
+    def __init__(self, worker_id, conf, member_id=None):
         super().__init__(worker_id)
         self.conf = conf
+        self.worker_id = worker_id
+        # NOTE: the workers can only share the member ID of the service if
+        # it has been generated before they have been forked.
+        self.worker_sharding = (self.conf.evaluator.worker_sharding and
+                                self.conf.evaluator.workers > 1 and
+                                member_id is not None)
 
         ef = lambda: futures.ThreadPoolExecutor(max_workers=10)  # noqa: E731
         self.periodic = periodics.PeriodicWorker.create(
             [], executor_factory=ef)
 
+        # NOTE: the periodic worker never runs two evaluation cycles at the
+        # same time, alarms of a cycle are spread on a dedicated pool.
+        self.evaluation_executor = None
+        self.evaluation_loop = None
+        self.storage_executor = None
+        if self.conf.evaluator.evaluation_engine == 'asyncio':
+            # NOTE: the database requests of the coroutines are run in the
+            # default executor of the event loop.
+            self.storage_executor = futures.ThreadPoolExecutor(
+                max_workers=self.conf.evaluator.storage_concurrency,
+                thread_name_prefix='aodh-storage')
+            self.evaluation_loop = asyncio.new_event_loop()
+            self.evaluation_loop.set_default_executor(self.storage_executor)
+            t = threading.Thread(target=self.evaluation_loop.run_forever)
+            t.daemon = True
+            t.start()
+        elif self.conf.evaluator.evaluation_threads > 1:
+            self.evaluation_executor = futures.ThreadPoolExecutor(
+                max_workers=self.conf.evaluator.evaluation_threads)
+        self._terminating = threading.Event()
+        self._claim_owner = uuidutils.generate_uuid()
+        # alarm_id -> (next evaluation timestamp, alarm version)
+        self._schedule = {}
+        # alarm_id -> smoothed evaluation time
+        self._costs = {}
+        self.metrics = metrics.EvaluationMetrics()
+        metrics.report('Alarm Evaluation', self.metrics)
+        self.metrics_server = None
+        if self.conf.evaluator.metrics_port:
+            # NOTE: each worker listens on its own port.
+            self.metrics_server = metrics.MetricsServer(
+                self.metrics, self.conf.evaluator.metrics_host,
+                self.conf.evaluator.metrics_port + worker_id)
+            self.metrics_server.start()
+
         self.evaluators = extension.ExtensionManager(
             namespace=self.EVALUATOR_EXTENSIONS_NAMESPACE,
             invoke_on_load=True,
             invoke_args=(self.conf,)
         )
+        self.backend_limits = None
+        if self.evaluation_loop:
+            self.backend_limits = BackendLimits(
+                self.conf.evaluator.backend_concurrency,
+                self.conf.evaluator.backend_timeout)
+            for ext in self.evaluators:
+                ext.obj.backend_limits = self.backend_limits
         self.storage_conn = storage.get_connection_from_config(self.conf)
+        self.write_buffer = None
+        if self.conf.evaluator.write_behind:
+            self.write_buffer = batch.WriteBehindBuffer(
+                self.storage_conn, self.conf.evaluator.write_behind_max_size,
+                self.conf.evaluator.write_behind_max_delay / 1000.0)
+            for ext in self.evaluators:
+                ext.obj.write_buffer = self.write_buffer
+        if self.conf.evaluator.circuit_breaker_failure_ratio:
+            breakers = CircuitBreakers(
+                self.conf.evaluator.circuit_breaker_failure_ratio,
+                self.conf.evaluator.circuit_breaker_window,
+                self.conf.evaluator.circuit_breaker_slow_call,
+                self.conf.evaluator.circuit_breaker_open_duration)
+            for ext in self.evaluators:
+                ext.obj.circuit_breakers = breakers
+        self.query_memo = None
+        if (self.conf.evaluator.query_memo and
+                not self.conf.evaluator.spread_evaluations):
+            self.query_memo = memo.QueryMemo()
+            for ext in self.evaluators:
+                ext.obj.query_memo = self.query_memo
+        self.alarm_inventory = None
+        if self.conf.evaluator.inventory_resync_interval:
+            self.alarm_inventory = inventory.AlarmInventory(
+                self.storage_conn,
+                self.conf.evaluator.inventory_resync_interval,
+                type=self._evaluated_types())
 
-        self.partition_coordinator = coordination.PartitionCoordinator(
-            self.conf)
+        if self.worker_sharding:
+            # The first worker is the member of the partitioning group for
+            # the whole service.
+            self.partition_coordinator = coordination.PartitionCoordinator(
+                self.conf, member_id, passive=worker_id != 0)
+        else:
+            self.partition_coordinator = coordination.PartitionCoordinator(
+                self.conf)
         self.partition_coordinator.start()
         self.partition_coordinator.join_group(self.PARTITIONING_GROUP_NAME)
 
@@ -246,32 +629,283 @@ class AlarmEvaluationService(cotyledon.Service):
         t.start()
 
     def terminate(self):
+        self._terminating.set()
         self.periodic.stop()
+        if self.evaluation_executor:
+            self.evaluation_executor.shutdown(cancel_futures=True)
+        if self.evaluation_loop:
+            self.evaluation_loop.call_soon_threadsafe(
+                self._cancel_async_evaluations)
         self.partition_coordinator.stop()
         self.periodic.wait()
+        if self.write_buffer:
+            self.write_buffer.flush()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.evaluation_loop:
+            self.evaluation_loop.call_soon_threadsafe(
+                self.evaluation_loop.stop)
+        if self.backend_limits:
+            self.backend_limits.shutdown()
+        if self.storage_executor:
+            self.storage_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _cancel_async_evaluations(self):
+        for task in asyncio.all_tasks(self.evaluation_loop):
+            task.cancel()
+
+    def _evaluated_types(self):
+        """Return the filter on the alarm types having an evaluator."""
+        return {'in': sorted(self.evaluators.names())}
 
     def _evaluate_assigned_alarms(self):
         try:
-            alarms = self._assigned_alarms()
-            LOG.info('initiating evaluation cycle on %d alarms',
-                     len(alarms))
+            cycle_start = time.monotonic()
+            if self.query_memo:
+                self.query_memo.reset()
+            if (self.conf.evaluator.alarm_claim_batch_size and
+                    not self.partition_coordinator.is_active()):
+                self._evaluate_claimed_alarms()
+            else:
+                assigned = alarms = self._assigned_alarms()
+                if self.conf.evaluator.schedule_by_rule_period:
+                    alarms = self._scheduled_alarms(alarms)
+                LOG.info('initiating evaluation cycle on %d alarms',
+                         len(alarms))
+                self.metrics.cycle_alarms.set(len(alarms))
 
-            for alarm in alarms:
-                self._evaluate_alarm(alarm)
+                if self.conf.evaluator.spread_evaluations:
+                    self._evaluate_spread(alarms, cycle_start)
+                else:
+                    self._evaluate_alarms(alarms)
+                self._publish_load(assigned)
+            if self.write_buffer:
+                self.write_buffer.flush()
+            if self.query_memo:
+                self.query_memo.reset()
+            self._record_cycle_duration(time.monotonic() - cycle_start)
         except Exception:
+            self.metrics.cycle_failures.inc()
             LOG.exception('alarm evaluation cycle failed')
 
-    def _evaluate_alarm(self, alarm):
+    def _evaluate_alarms(self, alarms, claimed=False):
+        self._prefetch(alarms)
+        evaluate = functools.partial(self._evaluate_alarm, claimed=claimed)
+        if self.evaluation_loop:
+            futures.wait([self._submit_async(alarm, claimed)
+                          for alarm in alarms])
+        elif self.evaluation_executor:
+            # _evaluate_alarm() never raises, wait for all the alarms to be
+            # evaluated before returning to the periodic worker.
+            list(self.evaluation_executor.map(evaluate, alarms))
+        else:
+            for alarm in alarms:
+                evaluate(alarm)
+
+    def _prefetch(self, alarms):
+        """Let the evaluators prepare the evaluation of their alarms."""
+        by_type = collections.defaultdict(list)
+        for alarm in alarms:
+            by_type[alarm.type].append(alarm)
+        for ext in self.evaluators:
+            try:
+                ext.obj.prefetch(by_type[ext.name])
+            except Exception:
+                LOG.exception('failed to prefetch the data of the %s alarms',
+                              ext.name)
+
+    def _evaluate_claimed_alarms(self):
+        """Claim blocks of alarms and evaluate them until none is left.
+
+        The evaluators racing for the alarms claim them block by block, so
+        the alarms are shared between them without a conditional update for
+        each alarm.
+        """
+        half_interval = datetime.timedelta(
+            seconds=self.conf.evaluator.evaluation_interval / 2)
+        evaluated = 0
+        while not self._terminating.is_set():
+            now = timeutils.utcnow()
+            alarms = self.storage_conn.claim_alarms(
+                self._claim_owner, now, now - half_interval,
+                self.conf.evaluator.alarm_claim_batch_size,
+                enabled=True, type=self._evaluated_types())
+            if not alarms:
+                break
+            LOG.debug('Claimed a block of %d alarms', len(alarms))
+            self._evaluate_alarms(alarms, claimed=True)
+            evaluated += len(alarms)
+        LOG.info('evaluation cycle evaluated %d claimed alarms', evaluated)
+        self.metrics.cycle_alarms.set(evaluated)
+
+    def _scheduled_alarms(self, alarms):
+        """Return the alarms whose data may have changed.
+
+        An alarm whose rule period is longer than the evaluation interval is
+        evaluated by every cycle during schedule_ingestion_margin seconds
+        after the end of a period, then scheduled right after the end of its
+        current period, and skipped by the evaluation cycles until then
+        unless the alarm is updated.
+        """
+        now = timeutils.utcnow_ts()
+        interval = self.conf.evaluator.evaluation_interval
+        lag = self.conf.additional_ingestion_lag
+        margin = self.conf.evaluator.schedule_ingestion_margin
+        schedule = {}
+        due = []
+        for alarm in alarms:
+            version = (alarm.timestamp, alarm.state_timestamp)
+            next_run, scheduled_version = self._schedule.get(
+                alarm.alarm_id, (None, None))
+            if (next_run is not None and now < next_run and
+                    version == scheduled_version):
+                schedule[alarm.alarm_id] = (next_run, version)
+                continue
+            due.append(alarm)
+            if alarm.type not in self.evaluators:
+                continue
+            period = self.evaluators[alarm.type].obj.evaluation_period(
+                alarm.rule)
+            if period and period > interval:
+                closed = (now - lag) // period * period + lag
+                if now < closed + margin:
+                    # NOTE: the last measures of the closed period may not
+                    # be ingested yet, check the alarm again next cycle.
+                    continue
+                schedule[alarm.alarm_id] = (closed + period, version)
+        self._schedule = schedule
+        LOG.debug('%d alarms are not due for evaluation',
+                  len(alarms) - len(due))
+        self.metrics.skipped.inc(len(alarms) - len(due), reason='not_due')
+        return due
+
+    def _record_cycle_duration(self, duration):
+        self.metrics.cycles.inc()
+        self.metrics.cycle_duration.observe(duration)
+        overrun = duration - self.conf.evaluator.evaluation_interval
+        if overrun > 0:
+            self.metrics.cycle_overruns.inc()
+            self.metrics.last_cycle_overrun.set(overrun)
+            LOG.warning('evaluation cycle took %(duration).1fs and overran '
+                        'the evaluation interval by %(overrun).1fs',
+                        {'duration': duration, 'overrun': overrun})
+        else:
+            self.metrics.last_cycle_overrun.set(0.0)
+
+    def _evaluation_offset(self, alarm_id):
+        """Return the stable offset of an alarm within the interval."""
+        hashed = struct.unpack_from(
+            '>I',
+            hashlib.md5(str(alarm_id).encode(),
+                        usedforsecurity=False).digest())[0]
+        window = self.conf.evaluator.evaluation_interval * SPREAD_WINDOW
+        return window * hashed / 2 ** 32
+
+    def _evaluate_spread(self, alarms, cycle_start):
+        """Evaluate each alarm at its own offset within the interval."""
+        scheduled = sorted(
+            ((self._evaluation_offset(alarm.alarm_id), alarm)
+             for alarm in alarms), key=lambda s: s[0])
+        pending = []
+        for offset, alarm in scheduled:
+            delay = cycle_start + offset - time.monotonic()
+            if delay > 0 and self._terminating.wait(delay):
+                break
+            if self.evaluation_loop:
+                pending.append(self._submit_async(alarm))
+            elif self.evaluation_executor:
+                pending.append(self.evaluation_executor.submit(
+                    self._evaluate_alarm, alarm))
+            else:
+                self._evaluate_alarm(alarm)
+        futures.wait(pending)
+
+    def _submit_async(self, alarm, claimed=False):
+        """Schedule an evaluation on the event loop of the asyncio engine.
+
+        :returns: A concurrent.futures.Future of the evaluation.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._evaluate_alarm_async(alarm, claimed), self.evaluation_loop)
+
+    async def _evaluate_alarm_async(self, alarm, claimed=False):
+        if await asyncio.to_thread(self._reserve_alarm, alarm, claimed):
+            with self._evaluation(alarm):
+                await self.evaluators[alarm.type].obj.evaluate_async(alarm)
+
+    def _evaluate_alarm(self, alarm, claimed=False):
         """Evaluate the alarms assigned to this evaluator."""
+        if self._reserve_alarm(alarm, claimed):
+            with self._evaluation(alarm):
+                self.evaluators[alarm.type].obj.evaluate(alarm)
+
+    @contextlib.contextmanager
+    def _evaluation(self, alarm):
+        """Record the evaluation of an alarm, which never raises."""
+        LOG.debug('Evaluating alarm %s', alarm.alarm_id)
+        start = time.monotonic()
+        try:
+            yield
+        except BackendUnavailable as e:
+            self._skip_unavailable(alarm, e)
+            return
+        except Exception:
+            self.metrics.errors.inc(type=alarm.type)
+            LOG.exception('Failed to evaluate alarm %s', alarm.alarm_id)
+        self._record_evaluation(alarm, time.monotonic() - start)
+
+    def _skip_unavailable(self, alarm, exc):
+        """Keep the state of an alarm whose backend is unavailable."""
+        LOG.debug('Skipping alarm %s, %s', alarm.alarm_id, exc)
+        self.metrics.skipped.inc(reason='backend_unavailable')
+
+    def _record_evaluation(self, alarm, duration):
+        self.metrics.evaluated.inc(type=alarm.type)
+        self.metrics.evaluation_duration.observe(duration, type=alarm.type)
+        cost = self._costs.get(alarm.alarm_id)
+        self._costs[alarm.alarm_id] = (
+            duration if cost is None
+            else cost + COST_SMOOTHING * (duration - cost))
+
+    def _publish_load(self, alarms):
+        """Publish the evaluation cost of the alarms of this evaluator.
+
+        The cost of an alarm is its smoothed evaluation time, the alarms
+        not evaluated yet cost the mean of the others.
+        """
+        self._costs = {alarm.alarm_id: self._costs[alarm.alarm_id]
+                       for alarm in alarms if alarm.alarm_id in self._costs}
+        default = 0.0
+        if self._costs:
+            default = sum(self._costs.values()) / len(self._costs)
+        load = sum(self._costs.get(alarm.alarm_id, default)
+                   for alarm in alarms)
+        self.metrics.partition_cost.set(load)
+        if self.worker_sharding:
+            # NOTE: the first worker publishes the load of the service
+            # member, estimated from its own share of the alarms.
+            load *= self.conf.evaluator.workers
+        self.partition_coordinator.publish_load(
+            self.PARTITIONING_GROUP_NAME, load)
+
+    def _reserve_alarm(self, alarm, claimed):
+        """Check whether this evaluator has to evaluate the alarm now."""
         if alarm.type not in self.evaluators:
             LOG.warning('Skipping alarm %s, unsupported type: %s',
                         alarm.alarm_id, alarm.type)
-            return
+            self.metrics.skipped.inc(reason='unsupported_type')
+            return False
 
         # If the coordinator is not available, fallback to database non-locking
         # mechanism in order to support aodh-evaluator active/active
-        # deployment.
-        if not self.partition_coordinator.is_active():
+        # deployment. Alarms claimed by block are already reserved.
+        if not claimed and not self.partition_coordinator.is_active():
+            if (self.conf.evaluator.spread_evaluations and
+                    not self._is_evaluation_due(alarm)):
+                LOG.debug('Alarm %s has been recently evaluated by another '
+                          'evaluator', alarm.alarm_id)
+                self.metrics.skipped.inc(reason='evaluated_elsewhere')
+                return False
             modified = self.storage_conn.conditional_update(
                 sql_models.Alarm,
                 {'evaluate_timestamp': timeutils.utcnow()},
@@ -285,22 +919,43 @@ class AlarmEvaluationService(cotyledon.Service):
                     'Alarm %s has been already handled by another evaluator',
                     alarm.alarm_id
                 )
-                return
+                self.metrics.skipped.inc(reason='evaluated_elsewhere')
+                return False
+        return True
 
-        LOG.debug('Evaluating alarm %s', alarm.alarm_id)
-        try:
-            self.evaluators[alarm.type].obj.evaluate(alarm)
-        except Exception:
-            LOG.exception('Failed to evaluate alarm %s', alarm.alarm_id)
-
-    def _assigned_alarms(self):
+    def _is_evaluation_due(self, alarm):
         before = (timeutils.utcnow() - datetime.timedelta(
             seconds=self.conf.evaluator.evaluation_interval / 2))
-        selected = self.storage_conn.get_alarms(
-            enabled=True,
-            type={'ne': 'event'},
-            evaluate_timestamp={'lt': before},
-        )
+        return (alarm.evaluate_timestamp is None or
+                alarm.evaluate_timestamp < before)
+
+    def _assigned_alarms(self):
+        half_interval = datetime.timedelta(
+            seconds=self.conf.evaluator.evaluation_interval / 2)
+        if self.conf.evaluator.spread_evaluations:
+            # NOTE: the alarms are evaluated up to an interval after the
+            # beginning of the cycle, _is_evaluation_due() checks the exact
+            # deadline when the alarm is about to be evaluated.
+            before = timeutils.utcnow() + half_interval
+        else:
+            before = timeutils.utcnow() - half_interval
+
+        # NOTE: the evaluate_timestamp of the alarms is updated at each
+        # evaluation when there is no coordinator, so the inventory would be
+        # outdated at every cycle.
+        if self.conf.evaluator.partition_by_bucket:
+            return self._assigned_bucket_alarms(before)
+
+        if self.alarm_inventory and self.partition_coordinator.is_active():
+            selected = [a for a in self.alarm_inventory.sync()
+                        if a.evaluate_timestamp is not None and
+                        a.evaluate_timestamp < before]
+        else:
+            selected = self.storage_conn.get_alarms_for_evaluation(
+                enabled=True,
+                type=self._evaluated_types(),
+                evaluate_timestamp={'lt': before},
+            )
 
         if self.partition_coordinator.is_active():
             all_alarm_ids = [a.alarm_id for a in selected]
@@ -309,4 +964,64 @@ class AlarmEvaluationService(cotyledon.Service):
             )
             selected = [a for a in selected if a.alarm_id in selected_ids]
 
+        if self.worker_sharding:
+            selected = [a for a in selected
+                        if self._worker_shard(a.alarm_id) == self.worker_id]
+
         return selected
+
+    def _assigned_buckets(self):
+        """Return the partition buckets of this evaluator.
+
+        None is returned when the evaluator has all the buckets.
+        """
+        buckets = list(range(models.PARTITION_BUCKETS))
+        if self.partition_coordinator.is_active():
+            buckets = self.partition_coordinator.extract_my_subset(
+                self.PARTITIONING_GROUP_NAME, buckets)
+        if self.worker_sharding:
+            buckets = buckets[self.worker_id::self.conf.evaluator.workers]
+        if len(buckets) == models.PARTITION_BUCKETS:
+            return None
+        return set(buckets)
+
+    def _assigned_bucket_alarms(self, before):
+        """Return the alarms of the partition buckets of this evaluator.
+
+        The alarms created before the partition bucket column are assigned
+        by computing their bucket.
+        """
+        buckets = self._assigned_buckets()
+        if self.alarm_inventory and self.partition_coordinator.is_active():
+            return [a for a in self.alarm_inventory.sync()
+                    if a.evaluate_timestamp is not None and
+                    a.evaluate_timestamp < before and
+                    (buckets is None or self._bucket(a) in buckets)]
+
+        filters = dict(enabled=True, type=self._evaluated_types(),
+                       evaluate_timestamp={'lt': before})
+        if buckets is None:
+            return self.storage_conn.get_alarms_for_evaluation(**filters)
+        if not buckets:
+            return []
+        selected = self.storage_conn.get_alarms_for_evaluation(
+            partition_bucket={'in': sorted(buckets)}, **filters)
+        selected.extend(
+            a for a in self.storage_conn.get_alarms_for_evaluation(
+                partition_bucket=None, **filters)
+            if self._bucket(a) in buckets)
+        return selected
+
+    @staticmethod
+    def _bucket(alarm):
+        if alarm.partition_bucket is None:
+            return models.partition_bucket(alarm.alarm_id)
+        return alarm.partition_bucket
+
+    def _worker_shard(self, alarm_id):
+        """Return the worker of the service evaluating an alarm."""
+        hashed = struct.unpack_from(
+            '>I',
+            hashlib.sha1(str(alarm_id).encode(),
+                         usedforsecurity=False).digest())[0]
+        return hashed % self.conf.evaluator.workers
@@ -0,0 +1,190 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Write-behind buffer of the alarm evaluation results.
+
+The state transitions, alarm history and evaluation counters produced by the
+evaluators are gathered and written with a single transaction per flush,
+instead of several transactions per state transition.
+
+Failure semantics:
+
+* the notifications of the buffered transitions are only sent once the
+  flush transaction has been committed;
+* when the transaction fails, nothing is written or notified, the state of
+  the evaluated alarms is reverted in memory and the transitions are
+  detected again by the next evaluation of the alarms. The buffered counter
+  increments are lost;
+* the transitions of the alarms deleted since their evaluation are dropped
+  for the evaluation views, as they are when written one by one.
+"""
+
+import threading
+import time
+
+from oslo_log import log
+
+from aodh.storage import models
+
+LOG = log.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Buffer of alarm state transitions, notifications and counters.
+
+    The buffer is flushed by the evaluation service at the end of each
+    evaluation cycle, and by the evaluators adding entries once it holds
+    max_size entries or its oldest entry is older than max_delay seconds.
+    """
+
+    def __init__(self, storage_conn, max_size, max_delay):
+        self.storage_conn = storage_conn
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._transitions = []
+        self._notifications = []
+        self._counters = []
+        self._since = None
+
+    def __len__(self):
+        return (len(self._transitions) + len(self._notifications) +
+                len(self._counters))
+
+    def add_transition(self, evaluator, alarm, previous, reason,
+                       reason_data, previous_reason=None,
+                       previous_timestamp=None):
+        """Buffer the state transition of an evaluated alarm.
+
+        The previous state, state reason and state timestamp of the alarm
+        are restored if the transition fails to be written.
+        """
+        self._add(self._transitions,
+                  (evaluator, alarm, previous, reason, reason_data,
+                   previous_reason, previous_timestamp))
+
+    def add_notification(self, evaluator, alarm, previous, reason,
+                         reason_data):
+        """Buffer the repeated notification of an alarm."""
+        self._add(self._notifications,
+                  (evaluator, alarm, previous, reason, reason_data))
+
+    def add_counter(self, alarm_id, project_id, state):
+        """Buffer the increment of an evaluation result counter."""
+        self._add(self._counters, (alarm_id, project_id, state))
+
+    def _add(self, entries, entry):
+        with self._lock:
+            entries.append(entry)
+            now = time.monotonic()
+            if self._since is None:
+                self._since = now
+            due = (len(self) >= self.max_size or
+                   now - self._since >= self.max_delay)
+        if due:
+            self.flush()
+
+    def _load_alarms(self, entries):
+        """Return the complete alarms of the buffered evaluated alarms.
+
+        The evaluation views are replaced by the complete alarms, loaded
+        with a single query, keeping the state set by the evaluation. The
+        entries of the deleted alarms are dropped.
+        """
+        ids = [entry[1].alarm_id for entry in entries
+               if isinstance(entry[1], models.AlarmEvaluationView)]
+        loaded = {}
+        if ids:
+            loaded = {alarm.alarm_id: alarm for alarm in
+                      self.storage_conn.get_alarms(alarm_id={'in': ids})}
+        result = []
+        for evaluator, alarm, previous, reason, reason_data, *_ in entries:
+            if isinstance(alarm, models.AlarmEvaluationView):
+                full = loaded.get(alarm.alarm_id)
+                if full is None:
+                    LOG.warning("Skip updating this alarm's state, the "
+                                "alarm: %s has been deleted", alarm.alarm_id)
+                    continue
+                full.state = alarm.state
+                full.state_reason = alarm.state_reason
+                full.state_timestamp = alarm.state_timestamp
+            else:
+                full = alarm
+            result.append((evaluator, alarm, full, previous, reason,
+                           reason_data))
+        return result
+
+    def flush(self):
+        """Write the buffered entries, then send their notifications."""
+        with self._lock:
+            transitions = self._transitions
+            notifications = self._notifications
+            counters = self._counters
+            self._reset()
+        if not (transitions or notifications or counters):
+            return
+
+        try:
+            loaded = self._load_alarms(transitions)
+            notifications = self._load_alarms(notifications)
+            states = []
+            changes = {}
+            for evaluator, alarm, full, previous, reason, _ in loaded:
+                states.append(dict(alarm_id=full.alarm_id,
+                                   state=full.state,
+                                   state_reason=full.state_reason,
+                                   state_timestamp=full.state_timestamp))
+                change = evaluator._alarm_change(full, reason)
+                if change:
+                    changes[full.alarm_id] = change
+            existing = self.storage_conn.record_evaluation_results(
+                states, list(changes.values()), counters)
+        except Exception:
+            LOG.exception('failed to write %d alarm state transitions, they '
+                          'will be retried at the next evaluation',
+                          len(transitions))
+            # NOTE: the evaluated alarms may be kept in memory between
+            # cycles, revert their state so that the transitions are
+            # detected again.
+            for (evaluator, alarm, previous, reason, reason_data,
+                 previous_reason, previous_timestamp) in transitions:
+                alarm.state = previous
+                alarm.state_reason = previous_reason
+                alarm.state_timestamp = previous_timestamp
+            return
+        LOG.debug('wrote %d alarm state transitions and %d counters',
+                  len(states), len(counters))
+
+        for evaluator, alarm, full, previous, reason, reason_data in loaded:
+            if full.alarm_id not in existing:
+                LOG.warning("Skip updating this alarm's state, the "
+                            "alarm: %s has been deleted", full.alarm_id)
+            self._notify(evaluator, full, previous, reason, reason_data,
+                         changes.get(full.alarm_id)
+                         if full.alarm_id in existing else None)
+        for evaluator, alarm, full, previous, reason, reason_data in (
+                notifications):
+            self._notify(evaluator, full, previous, reason, reason_data)
+
+    @staticmethod
+    def _notify(evaluator, alarm, previous, reason, reason_data,
+                change=None):
+        try:
+            if change:
+                evaluator.alarm_change_notifier.info(
+                    {}, "alarm.state_transition", change)
+            evaluator.notifier.notify(alarm, previous, reason, reason_data)
+        except Exception:
+            LOG.exception('alarm %s notification failed', alarm.alarm_id)
@@ -0,0 +1,46 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Comparison of the datapoints of the threshold alarms to their threshold."""
+
+import itertools
+import operator
+
+from aodh import evaluator
+
+COMPARATORS = {
+    'gt': operator.gt,
+    'lt': operator.lt,
+    'ge': operator.ge,
+    'le': operator.le,
+    'eq': operator.eq,
+    'ne': operator.ne,
+}
+
+
+def compare_window(statistics, comparison_operator, threshold):
+    """Compare the datapoints of an alarm to its threshold.
+
+    :returns: the state, or the trending state if the datapoints are not all
+              on the same side of the threshold, and the number of
+              datapoints outside the threshold.
+    """
+    op = COMPARATORS[comparison_operator]
+    outside = sum(map(op, statistics, itertools.repeat(threshold)))
+    if outside == len(statistics):
+        return evaluator.ALARM, None, outside
+    if not outside:
+        return evaluator.OK, None, outside
+    trending_state = (evaluator.ALARM if op(statistics[-1], threshold)
+                      else evaluator.OK)
+    return None, trending_state, outside
+
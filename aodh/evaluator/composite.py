@@ -109,9 +109,7 @@ class CompositeEvaluator(evaluator.Evaluator):
         super().__init__(conf)
         self.conf = conf
         self._threshold_evaluators = None
-        self.rule_targets = []
         self.rule_name_prefix = 'rule'
-        self.rule_num = 0
 
     @property
     def threshold_evaluators(self):
@@ -123,9 +121,14 @@ class CompositeEvaluator(evaluator.Evaluator):
             self._threshold_evaluators = stevedore.NamedExtensionManager(
                 'aodh.evaluator', threshold_types, invoke_on_load=True,
                 invoke_args=(self.conf,))
+            # NOTE: the sub-rules share the queries and circuit breakers of
+            # the threshold alarms.
+            for ext in self._threshold_evaluators:
+                ext.obj.query_memo = self.query_memo
+                ext.obj.circuit_breakers = self.circuit_breakers
         return self._threshold_evaluators
 
-    def _parse_composite_rule(self, alarm_rule):
+    def _parse_composite_rule(self, alarm_rule, rule_targets):
         """Parse the composite rule.
 
         The composite rule is assembled by sub threshold rules with 'and',
@@ -136,38 +139,54 @@ class CompositeEvaluator(evaluator.Evaluator):
                     {'or': [threshold_rule2, threshold_rule3,
                             threshold_rule4, threshold_rule5]}]
         }
+
+        The parsed sub rules are appended to rule_targets, which is local to
+        the evaluation of a single alarm so that alarms can be evaluated
+        concurrently by the same evaluator.
         """
         if (isinstance(alarm_rule, dict) and len(alarm_rule) == 1
                 and list(alarm_rule)[0] in ('and', 'or')):
             and_or_key = list(alarm_rule)[0]
             if and_or_key == 'and':
-                rules = (self._parse_composite_rule(r) for r in
-                         alarm_rule['and'])
+                rules = (self._parse_composite_rule(r, rule_targets)
+                         for r in alarm_rule['and'])
                 rules_alarm, rules_ok = zip(*rules)
                 return AndOp(rules_alarm), OrOp(rules_ok)
             else:
-                rules = (self._parse_composite_rule(r) for r in
-                         alarm_rule['or'])
+                rules = (self._parse_composite_rule(r, rule_targets)
+                         for r in alarm_rule['or'])
                 rules_alarm, rules_ok = zip(*rules)
                 return OrOp(rules_alarm), AndOp(rules_ok)
         elif alarm_rule['type'] in self.threshold_evaluators:
             rule_evaluator = self.threshold_evaluators[alarm_rule['type']].obj
-            self.rule_num += 1
-            name = self.rule_name_prefix + str(self.rule_num)
+            name = self.rule_name_prefix + str(len(rule_targets) + 1)
             rule = RuleTarget(alarm_rule, rule_evaluator, name)
-            self.rule_targets.append(rule)
+            rule_targets.append(rule)
             return AlarmEvaluation(rule), OkEvaluation(rule)
         else:
             LOG.error("Invalid rule type: %s", alarm_rule['type'])
             return False, False
 
-    def _reason(self, alarm, new_state, rule_target_alarm):
+    def evaluation_period(self, alarm_rule):
+        if (isinstance(alarm_rule, dict) and len(alarm_rule) == 1
+                and list(alarm_rule)[0] in ('and', 'or')):
+            periods = [self.evaluation_period(r)
+                       for r in list(alarm_rule.values())[0]]
+            if not periods or None in periods:
+                return None
+            return min(periods)
+        elif alarm_rule.get('type') in self.threshold_evaluators:
+            return self.threshold_evaluators[
+                alarm_rule['type']].obj.evaluation_period(alarm_rule)
+        return None
+
+    def _reason(self, alarm, new_state, rule_target_alarm, rule_targets):
         transition = alarm.state != new_state
         reason_data = {
             'type': 'composite',
             'composition_form': str(rule_target_alarm)}
         root_cause_rules = {}
-        for rule in self.rule_targets:
+        for rule in rule_targets:
             if rule.state == new_state:
                 root_cause_rules.update({rule.rule_name: rule.rule})
         reason_data.update(causative_rules=root_cause_rules)
@@ -187,9 +206,10 @@ class CompositeEvaluator(evaluator.Evaluator):
 
         return reason, reason_data
 
-    def _evaluate_sufficient(self, alarm, rule_target_alarm, rule_target_ok):
+    def _evaluate_sufficient(self, alarm, rule_target_alarm, rule_target_ok,
+                             rule_targets):
         # Some of evaluated rules are unknown states or trending states.
-        for rule in self.rule_targets:
+        for rule in rule_targets:
             if rule.trending_state is not None:
                 if alarm.state == evaluator.UNKNOWN:
                     rule.state = rule.trending_state
@@ -203,14 +223,16 @@ class CompositeEvaluator(evaluator.Evaluator):
         alarm_triggered = bool(rule_target_alarm)
         if alarm_triggered:
             reason, reason_data = self._reason(alarm, evaluator.ALARM,
-                                               rule_target_alarm)
+                                               rule_target_alarm,
+                                               rule_targets)
             self._refresh(alarm, evaluator.ALARM, reason, reason_data)
             return True
 
         ok_result = bool(rule_target_ok)
         if ok_result:
             reason, reason_data = self._reason(alarm, evaluator.OK,
-                                               rule_target_alarm)
+                                               rule_target_alarm,
+                                               rule_targets)
             self._refresh(alarm, evaluator.OK, reason, reason_data)
             return True
         return False
@@ -222,25 +244,26 @@ class CompositeEvaluator(evaluator.Evaluator):
             return
 
         LOG.debug("Evaluating composite rule alarm %s ...", alarm.alarm_id)
-        self.rule_targets = []
-        self.rule_num = 0
+        rule_targets = []
         rule_target_alarm, rule_target_ok = self._parse_composite_rule(
-            alarm.rule)
+            alarm.rule, rule_targets)
 
         sufficient = self._evaluate_sufficient(alarm, rule_target_alarm,
-                                               rule_target_ok)
+                                               rule_target_ok, rule_targets)
         if not sufficient:
-            for rule in self.rule_targets:
+            for rule in rule_targets:
                 rule.evaluate()
             sufficient = self._evaluate_sufficient(alarm, rule_target_alarm,
-                                                   rule_target_ok)
+                                                   rule_target_ok,
+                                                   rule_targets)
 
         if not sufficient:
             # The following unknown situations is like these:
             # 1. 'unknown' and 'alarm'
             # 2. 'unknown' or 'ok'
             reason, reason_data = self._reason(alarm, evaluator.UNKNOWN,
-                                               rule_target_alarm)
+                                               rule_target_alarm,
+                                               rule_targets)
             if alarm.state != evaluator.UNKNOWN:
                 self._refresh(alarm, evaluator.UNKNOWN, reason, reason_data)
             else:
@@ -12,24 +12,114 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import calendar
+import datetime
 import json
+import operator
+import threading
+import time
 
 from gnocchiclient import client
 from gnocchiclient import exceptions
 from oslo_log import log
 
+from aodh import evaluator
 from aodh.evaluator import threshold
+from aodh.evaluator import window
 from aodh import keystone_client
 
 LOG = log.getLogger(__name__)
 
 # The list of points that Gnocchi API returned is composed
 # of tuples with (timestamp, granularity, value)
+TIMESTAMP = 0
 GRANULARITY = 1
 VALUE = 2
 
+# The aggregation methods whose datapoints can be computed from the
+# datapoints of a finer granularity, and how.
+DOWNSAMPLING_METHODS = {
+    'mean': lambda values: sum(values) / len(values),
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'count': sum,
+    'first': operator.itemgetter(0),
+    'last': operator.itemgetter(-1),
+}
+
+# Number of resources per page when resolving the search of an alarm.
+SEARCH_PAGE_SIZE = 1000
+
+# The negative entries of the metric ID cache are kept up to 2 ** 5 times
+# gnocchi_metric_negative_ttl.
+NEGATIVE_BACKOFF_STEPS = 5
+
+
+class AggregationNotFound(threshold.InsufficientDataError):
+    """The aggregation of the alarm does not exist in Gnocchi."""
+
+
+class MetricIdCache:
+    """Cache of the IDs of the metrics of the Gnocchi resources.
+
+    The metrics of the missing resources are cached as negative entries, for
+    negative_ttl seconds doubled at each consecutive miss, so that the
+    deleted resources are queried less and less often.
+    """
+
+    def __init__(self, ttl, negative_ttl):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # key -> (expiration, metric ID, reason, consecutive misses)
+        self._entries = {}
+        self._pruned_size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the metric ID and the reason it is missing, or None."""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry[0]:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, key, metric_id):
+        self._put(key, (time.monotonic() + self.ttl, metric_id, None, 0))
+
+    def put_missing(self, key, reason):
+        """Cache a missing metric, with a TTL growing at each miss."""
+        entry = self._entries.get(key)
+        misses = entry[3] + 1 if entry and entry[1] is None else 1
+        ttl = self.negative_ttl * 2 ** min(misses - 1,
+                                           NEGATIVE_BACKOFF_STEPS)
+        self._put(key, (time.monotonic() + ttl, None, reason, misses))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > 2 * self._pruned_size:
+                # NOTE: the expired negative entries are kept long enough
+                # to remember the consecutive misses.
+                limit = time.monotonic() - self.negative_ttl * 2 ** (
+                    NEGATIVE_BACKOFF_STEPS + 1)
+                self._entries = {k: e for k, e in self._entries.items()
+                                 if e[0] > limit}
+                self._pruned_size = len(self._entries)
+
 
 class GnocchiBase(threshold.ThresholdEvaluator):
+    backend = 'gnocchi'
+    # Whether the datapoints already retrieved are stable enough to be
+    # cached between the evaluations.
+    window_cacheable = True
+
     def __init__(self, conf):
         super().__init__(conf)
         self._gnocchi_client = client.Client(
@@ -37,15 +127,106 @@ class GnocchiBase(threshold.ThresholdEvaluator):
             adapter_options={
                 'interface': conf.service_credentials.interface,
                 'region_name': conf.service_credentials.region_name})
+        self._window_cache = None
+        if self.window_cacheable and conf.evaluator.measure_cache_size:
+            self._window_cache = window.WindowCache(
+                conf.evaluator.measure_cache_size,
+                conf.evaluator.measure_cache_max_age)
+        # query key -> the finer granularity the datapoints of the alarms
+        # without an archive policy at their granularity are computed from.
+        self._downsampled = {}
 
     @staticmethod
-    def _sanitize(rule, statistics):
+    def _is_backend_failure(exc):
+        # NOTE: the client errors, like a missing metric, do not mean that
+        # Gnocchi is failing.
+        return not (isinstance(exc, exceptions.ClientException) and
+                    exc.code is not None and exc.code < 500)
+
+    def _downsampling(self, rule):
+        return (self.conf.evaluator.gnocchi_downsampling and
+                rule['aggregation_method'] in DOWNSAMPLING_METHODS)
+
+    @staticmethod
+    def _source_granularity(granularity, statistics):
+        """Return the coarsest granularity evenly dividing granularity."""
+        if isinstance(statistics, dict):
+            statistics = statistics['measures']['aggregated']
+        sources = [stats[GRANULARITY] for stats in statistics
+                   if stats[GRANULARITY] < granularity and
+                   granularity % stats[GRANULARITY] == 0]
+        return max(sources, default=None)
+
+    def _query_statistics(self, rule, start, end):
+        """Retrieve the datapoints of the alarm granularity.
+
+        When the aggregation does not exist at the alarm granularity and
+        gnocchi_downsampling is enabled, the datapoints of all the
+        granularities are retrieved once to find the finer granularity
+        they are computed from, only its datapoints are retrieved next.
+        """
+        key = self._query_key(rule)
+        source = self._downsampled.get(key)
+        if source:
+            try:
+                return self._cached_statistics(
+                    key + (source,), dict(rule, granularity=source),
+                    start, end)
+            except AggregationNotFound:
+                # NOTE: the archive policy of the metric changed.
+                self._downsampled.pop(key, None)
+        try:
+            return self._cached_statistics(key, rule, start, end)
+        except AggregationNotFound:
+            if not self._downsampling(rule):
+                raise
+            statistics = self._statistics(dict(rule, granularity=None),
+                                          start, end)
+            source = self._source_granularity(rule['granularity'],
+                                              statistics)
+            if source is None:
+                raise
+            LOG.debug('datapoints of granularity %s computed from the '
+                      'granularity %s', rule['granularity'], source)
+            if key is not None:
+                self._downsampled[key] = source
+            return statistics
+
+    def _cached_statistics(self, key, rule, start, end):
+        """Retrieve the datapoints missing from the window cache."""
+        if self._window_cache is None or key is None:
+            return self._statistics(rule, start, end)
+
+        window_start = datetime.datetime.fromisoformat(start)
+        cached = self._window_cache.get(key)
+        if cached and cached[1]:
+            loaded_at, points = cached
+            # NOTE: the last datapoints may still be aggregated, or
+            # completed by late measures.
+            margin = datetime.timedelta(
+                seconds=rule['granularity'] +
+                self.conf.additional_ingestion_lag)
+            start = max(window_start, points[-1][0] - margin).isoformat()
+        else:
+            loaded_at, points = time.monotonic(), []
+
+        statistics = self._statistics(rule, start, end)
+        if isinstance(statistics, dict):
+            statistics = statistics['measures']['aggregated']
+        try:
+            points = window.merge(
+                points, statistics,
+                window_start - datetime.timedelta(
+                    seconds=rule['granularity']))
+        except (TypeError, ValueError, IndexError):
+            LOG.debug('datapoints not cached, unexpected statistics: %s',
+                      statistics)
+            return statistics
+        self._window_cache.put(key, loaded_at, points)
+        return [point for _, point in points]
+
+    def _sanitize(self, rule, statistics):
         """Return the datapoints that correspond to the alarm granularity"""
-        # TODO(sileht): if there's no direct match, but there is an archive
-        # policy with granularity that's an even divisor or the period,
-        # we could potentially do a mean-of-means (or max-of-maxes or whatever,
-        # but not a stddev-of-stddevs).
-        # TODO(sileht): support alarm['exclude_outliers']
         LOG.debug('sanitize stats %s', statistics)
         # NOTE(jamespage)
         # Dynamic Aggregates are returned in a dict struct so
@@ -53,26 +234,197 @@ class GnocchiBase(threshold.ThresholdEvaluator):
         if isinstance(statistics, dict):
             # Pop array of measures from aggregated subdict
             statistics = statistics['measures']['aggregated']
-        statistics = [stats[VALUE] for stats in statistics
-                      if stats[GRANULARITY] == rule['granularity']]
+        values = [stats[VALUE] for stats in statistics
+                  if stats[GRANULARITY] == rule['granularity']]
+        if not values and self._downsampling(rule):
+            values = self._downsample(rule, statistics)
+        statistics = values
         if not statistics:
             raise threshold.InsufficientDataError(
                 "No datapoint for granularity %s" % rule['granularity'], [])
+        if rule.get('exclude_outliers'):
+            statistics = self._exclude_outliers(statistics)
         statistics = statistics[-rule['evaluation_periods']:]
         LOG.debug('pruned statistics to %d', len(statistics))
         return statistics
 
+    def _downsample(self, rule, statistics):
+        """Aggregate the datapoints of a finer granularity.
+
+        The datapoints of the coarsest granularity evenly dividing the alarm
+        granularity are grouped by period of the alarm granularity, and
+        aggregated with the aggregation method of the alarm. The means are
+        averaged without weighting them by their number of measures.
+        """
+        granularity = rule['granularity']
+        source = self._source_granularity(granularity, statistics)
+        if source is None:
+            return []
+        periods = {}
+        for stats in statistics:
+            if stats[GRANULARITY] != source:
+                continue
+            timestamp = window.parse_timestamp(stats[TIMESTAMP])
+            period = calendar.timegm(timestamp.timetuple()) // granularity
+            periods.setdefault(period, []).append(stats[VALUE])
+        aggregate = DOWNSAMPLING_METHODS[rule['aggregation_method']]
+        LOG.debug('downsampled the datapoints of granularity %s to %s',
+                  source, granularity)
+        return [aggregate(periods[period]) for period in sorted(periods)]
+
 
 class GnocchiResourceThresholdEvaluator(GnocchiBase):
+    query_fields = ('resource_type', 'resource_id', 'metric',
+                    'aggregation_method', 'granularity')
+
+    def __init__(self, conf):
+        super().__init__(conf)
+        # The measures retrieved in batches for the alarms of the current
+        # evaluation cycle, by batch key and resource.
+        self._prefetched = {}
+        self._metric_ids = None
+        if conf.evaluator.gnocchi_metric_cache_ttl:
+            self._metric_ids = MetricIdCache(
+                conf.evaluator.gnocchi_metric_cache_ttl,
+                conf.evaluator.gnocchi_metric_negative_ttl)
+
+    @staticmethod
+    def _batch_key(rule):
+        """Return the key of the alarms whose measures can be batched."""
+        return (rule['resource_type'], rule['metric'],
+                rule['aggregation_method'], rule['granularity'],
+                rule['evaluation_periods'], rule.get('period'),
+                bool(rule.get('exclude_outliers')))
+
+    def prefetch(self, alarms):
+        """Retrieve the measures of the alarms in batches of resources.
+
+        The alarms sharing the same metric, aggregation method, granularity
+        and evaluation window get the measures of all their resources with a
+        single request. The measures of the resources missing from the
+        response are retrieved alarm by alarm, as without batches.
+        """
+        batch_size = self.conf.evaluator.gnocchi_batch_size
+        prefetched = {}
+        if batch_size:
+            batches = {}
+            for alarm in alarms:
+                if not self.within_time_constraint(alarm):
+                    continue
+                if self._query_key(alarm.rule) in self._downsampled:
+                    # NOTE: their datapoints are not retrieved at the
+                    # granularity of the alarm.
+                    continue
+                rule, resource_ids = batches.setdefault(
+                    self._batch_key(alarm.rule), (alarm.rule, set()))
+                resource_ids.add(alarm.rule['resource_id'])
+            for key, (rule, resource_ids) in batches.items():
+                if len(resource_ids) < 2:
+                    continue
+                resource_ids = sorted(resource_ids)
+                for i in range(0, len(resource_ids), batch_size):
+                    prefetched.update(self._fetch_batch(
+                        key, rule, resource_ids[i:i + batch_size]))
+        self._prefetched = prefetched
+
+    def _fetch_batch(self, key, rule, resource_ids):
+        start, end = self._bound_duration(rule)
+        try:
+            result = self._request(
+                self._gnocchi_client.aggregates.fetch,
+                operations=['metric', rule['metric'],
+                            rule['aggregation_method']],
+                granularity=rule['granularity'],
+                search={'in': {'id': resource_ids}},
+                resource_type=rule['resource_type'],
+                start=start, stop=end)
+        except evaluator.BackendUnavailable:
+            return {}
+        except Exception as e:
+            LOG.warning('batched retrieval of the measures of %d resources '
+                        'failed: %s', len(resource_ids), e)
+            return {}
+        measures = result.get('measures') or {}
+        fetched = {}
+        for resource_id in resource_ids:
+            statistics = measures.get(resource_id, {}).get(
+                rule['metric'], {}).get(rule['aggregation_method'])
+            if statistics is not None:
+                fetched[key + (resource_id,)] = statistics
+        LOG.debug('retrieved the measures of %d resources out of %d with a '
+                  'single request', len(fetched), len(resource_ids))
+        return fetched
+
+    def _metric_id(self, rule):
+        """Return the ID of the metric of the alarm.
+
+        None is returned when the metric ID cache is disabled or the metric
+        could not be resolved, the metric is then retrieved by name.
+
+        :raises InsufficientDataError: if the resource or its metric are
+                                       missing.
+        """
+        if self._metric_ids is None:
+            return None
+        key = (rule['resource_type'], rule['resource_id'], rule['metric'])
+        cached = self._metric_ids.get(key)
+        if cached is None:
+            cached = self._resolve_metric_id(key)
+        metric_id, reason = cached
+        if reason:
+            raise threshold.InsufficientDataError(reason, [])
+        return metric_id
+
+    def _resolve_metric_id(self, key):
+        resource_type, resource_id, metric = key
+        try:
+            resource = self._request(self._gnocchi_client.resource.get,
+                                     resource_type, resource_id)
+        except exceptions.ResourceNotFound:
+            self._metric_ids.put_missing(
+                key, 'resource %s does not exists' % resource_id)
+            return self._metric_ids.get(key)
+        except evaluator.BackendUnavailable:
+            raise
+        except Exception as e:
+            LOG.debug('failed to resolve the metric %s of resource %s: %s',
+                      metric, resource_id, e)
+            return None, None
+        metric_id = (resource.get('metrics') or {}).get(metric)
+        if metric_id is None:
+            self._metric_ids.put_missing(
+                key, 'metric %s for resource %s does not exists' %
+                (metric, resource_id))
+        else:
+            self._metric_ids.put(key, metric_id)
+        return self._metric_ids.get(key)
+
     def _statistics(self, rule, start, end):
+        statistics = self._prefetched.get(
+            self._batch_key(rule) + (rule['resource_id'],))
+        if statistics is not None:
+            return statistics
+        metric_id = self._metric_id(rule)
+        if metric_id:
+            # NOTE: Gnocchi does not need to look the resource up.
+            metric = dict(metric=metric_id)
+        else:
+            metric = dict(metric=rule['metric'],
+                          resource_id=rule['resource_id'])
         try:
-            return self._gnocchi_client.metric.get_measures(
-                metric=rule['metric'],
+            return self._request(
+                self._gnocchi_client.metric.get_measures,
                 granularity=rule['granularity'],
                 start=start, stop=end,
-                resource_id=rule['resource_id'],
-                aggregation=rule['aggregation_method'])
+                aggregation=rule['aggregation_method'],
+                **metric)
         except exceptions.MetricNotFound:
+            if metric_id:
+                # NOTE: the metric was deleted, it is resolved again at the
+                # next evaluation.
+                self._metric_ids.invalidate(
+                    (rule['resource_type'], rule['resource_id'],
+                     rule['metric']))
             raise threshold.InsufficientDataError(
                 'metric %s for resource %s does not exists' %
                 (rule['metric'], rule['resource_id']), [])
@@ -84,12 +436,14 @@ class GnocchiResourceThresholdEvaluator(GnocchiBase):
             # exception for AggregationNotFound, this API endpoint
             # can only raise 3 different 404, so we are safe to
             # assume this is an AggregationNotFound for now.
-            raise threshold.InsufficientDataError(
+            raise AggregationNotFound(
                 'aggregation %s does not exist for '
                 'metric %s of resource %s' % (rule['aggregation_method'],
                                               rule['metric'],
                                               rule['resource_id']),
                 [])
+        except evaluator.BackendUnavailable:
+            raise
         except Exception as e:
             msg = 'alarm statistics retrieval failed: %s'
             LOG.warning(msg, e)
@@ -97,6 +451,8 @@ class GnocchiResourceThresholdEvaluator(GnocchiBase):
 
 
 class GnocchiAggregationMetricsThresholdEvaluator(GnocchiBase):
+    query_fields = ('metrics', 'aggregation_method', 'granularity')
+
     def _statistics(self, rule, start, end):
         try:
             _operations = [
@@ -117,7 +473,8 @@ class GnocchiAggregationMetricsThresholdEvaluator(GnocchiBase):
             # So temporary set 'needed_overlap' to 0 to disable the
             # gnocchi checks about missing points. For more detail see:
             #   https://bugs.launchpad.net/gnocchi/+bug/1479429
-            return self._gnocchi_client.aggregates.fetch(
+            return self._request(
+                self._gnocchi_client.aggregates.fetch,
                 operations=_operations,
                 granularity=rule['granularity'],
                 start=start, stop=end,
@@ -131,10 +488,12 @@ class GnocchiAggregationMetricsThresholdEvaluator(GnocchiBase):
             # exception for AggregationNotFound, this API endpoint
             # can only raise 3 different 404, so we are safe to
             # assume this is an AggregationNotFound for now.
-            raise threshold.InsufficientDataError(
+            raise AggregationNotFound(
                 'aggregation %s does not exist for at least one '
                 'metrics in %s' % (rule['aggregation_method'],
                                    rule['metrics']), [])
+        except evaluator.BackendUnavailable:
+            raise
         except Exception as e:
             msg = 'alarm statistics retrieval failed: %s'
             LOG.warning(msg, e)
@@ -142,7 +501,115 @@ class GnocchiAggregationMetricsThresholdEvaluator(GnocchiBase):
 
 
 class GnocchiAggregationResourcesThresholdEvaluator(GnocchiBase):
+    window_cacheable = False
+    query_fields = ('resource_type', 'metric', 'aggregation_method',
+                    'granularity')
+
+    def __init__(self, conf):
+        super().__init__(conf)
+        self._searches_lock = threading.Lock()
+        # (resource type, search, metric) -> (expiration, metric IDs)
+        self._searches = {}
+        self._pruned_size = 0
+
+    def _query_key(self, rule):
+        # NOTE: the searches only formatted differently are shared.
+        try:
+            search = json.dumps(json.loads(rule['query']), sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return super()._query_key(rule) + (search,)
+
+    def _search_metric_ids(self, rule):
+        """Return the IDs of the metrics of the resources of the search.
+
+        The resources matching the search of the alarm are searched again
+        every gnocchi_search_refresh_interval seconds.
+        """
+        search = json.loads(rule['query'])
+        key = (rule['resource_type'], json.dumps(search, sort_keys=True),
+               rule['metric'])
+        entry = self._searches.get(key)
+        if entry and time.monotonic() < entry[0]:
+            return key, entry[1]
+
+        metric_ids = []
+        marker = None
+        while True:
+            resources = self._request(
+                self._gnocchi_client.resource.search,
+                resource_type=rule['resource_type'], query=search,
+                limit=SEARCH_PAGE_SIZE, marker=marker, sorts=['id:asc'])
+            for resource in resources:
+                metric_id = (resource.get('metrics') or {}).get(
+                    rule['metric'])
+                if metric_id:
+                    metric_ids.append(metric_id)
+            if len(resources) < SEARCH_PAGE_SIZE:
+                break
+            marker = resources[-1]['id']
+        LOG.debug('search %s resolved to %d metrics', rule['query'],
+                  len(metric_ids))
+
+        expiration = (time.monotonic() +
+                      self.conf.evaluator.gnocchi_search_refresh_interval)
+        with self._searches_lock:
+            self._searches[key] = (expiration, metric_ids)
+            if len(self._searches) > 2 * self._pruned_size:
+                now = time.monotonic()
+                self._searches = {k: e for k, e in self._searches.items()
+                                  if e[0] > now}
+                self._pruned_size = len(self._searches)
+        return key, metric_ids
+
+    def _statistics_by_metric_ids(self, rule, start, end):
+        """Aggregate the metrics of the resolved search of the alarm.
+
+        None is returned when the search could not be resolved, or when
+        one of its metrics is missing, the search is then run by Gnocchi.
+        """
+        try:
+            key, metric_ids = self._search_metric_ids(rule)
+        except evaluator.BackendUnavailable:
+            raise
+        except Exception as e:
+            LOG.debug('failed to resolve the search %s: %s', rule['query'],
+                      e)
+            return None
+        if not metric_ids:
+            return []
+        try:
+            # NOTE: see the note about needed_overlap below.
+            return self._request(
+                self._gnocchi_client.aggregates.fetch,
+                operations=[
+                    'aggregate', rule['aggregation_method']
+                ] + [
+                    [
+                        'metric', metric_id,
+                        rule['aggregation_method'].lstrip('rate:')
+                    ] for metric_id in metric_ids
+                ],
+                granularity=rule['granularity'],
+                start=start, stop=end,
+                needed_overlap=0)
+        except exceptions.NotFound:
+            # NOTE: a resource of the search was deleted, search again.
+            with self._searches_lock:
+                self._searches.pop(key, None)
+            return None
+        except evaluator.BackendUnavailable:
+            raise
+        except Exception as e:
+            msg = 'alarm statistics retrieval failed: %s'
+            LOG.warning(msg, e)
+            raise threshold.InsufficientDataError(msg % e, [])
+
     def _statistics(self, rule, start, end):
+        if self.conf.evaluator.gnocchi_search_refresh_interval:
+            statistics = self._statistics_by_metric_ids(rule, start, end)
+            if statistics is not None:
+                return statistics
         try:
             # FIXME(sileht): In case of a heat autoscaling stack decide to
             # delete an instance, the gnocchi metrics associated to this
@@ -152,7 +619,8 @@ class GnocchiAggregationResourcesThresholdEvaluator(GnocchiBase):
             # So temporary set 'needed_overlap' to 0 to disable the
             # gnocchi checks about missing points. For more detail see:
             #   https://bugs.launchpad.net/gnocchi/+bug/1479429
-            return self._gnocchi_client.aggregates.fetch(
+            return self._request(
+                self._gnocchi_client.aggregates.fetch,
                 operations=[
                     'aggregate', rule['aggregation_method'],
                     [
@@ -173,9 +641,11 @@ class GnocchiAggregationResourcesThresholdEvaluator(GnocchiBase):
             # exception for AggregationNotFound, this API endpoint
             # can only raise 3 different 404, so we are safe to
             # assume this is an AggregationNotFound for now.
-            raise threshold.InsufficientDataError(
+            raise AggregationNotFound(
                 'aggregation %s does not exist for at least one '
                 'metric of the query' % rule['aggregation_method'], [])
+        except evaluator.BackendUnavailable:
+            raise
         except Exception as e:
             msg = 'alarm statistics retrieval failed: %s'
             LOG.warning(msg, e)
@@ -0,0 +1,92 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+
+from oslo_log import log
+from oslo_utils import timeutils
+
+LOG = log.getLogger(__name__)
+
+
+class AlarmInventory:
+    """In-memory inventory of the alarms to evaluate.
+
+    The first synchronization loads all the enabled alarms matching the
+    filters, the following ones only load the alarms created, updated or
+    whose state has been set since the previous synchronization. Alarms are
+    deleted from the database rather than flagged, so deletions are detected
+    by comparing the number of alarms in the database with the size of the
+    inventory, and the alarm IDs are only listed when they differ.
+
+    The whole inventory is reloaded every resync_interval seconds to recover
+    from any change that would have been missed.
+    """
+
+    # Changes stored with a timestamp slightly older than the beginning of
+    # the previous synchronization (clock skew between API nodes, slow
+    # transactions) are caught by re-reading this window.
+    SYNC_MARGIN = datetime.timedelta(seconds=5)
+
+    def __init__(self, storage_conn, resync_interval, **filters):
+        self.storage_conn = storage_conn
+        self.resync_interval = datetime.timedelta(seconds=resync_interval)
+        self.filters = filters
+        self._alarms = {}
+        self._since = None
+        self._last_full_sync = None
+
+    def sync(self):
+        """Synchronize the inventory and return the alarms it contains."""
+        now = timeutils.utcnow()
+        if (self._last_full_sync is None or
+                now - self._last_full_sync >= self.resync_interval):
+            self._full_sync()
+            self._last_full_sync = now
+        else:
+            self._incremental_sync()
+        self._since = now - self.SYNC_MARGIN
+        return list(self._alarms.values())
+
+    def _full_sync(self):
+        alarms = self.storage_conn.get_alarms_for_evaluation(
+            enabled=True, **self.filters)
+        self._alarms = {alarm.alarm_id: alarm for alarm in alarms}
+        LOG.debug('Loaded %d alarms in the inventory', len(self._alarms))
+
+    def _incremental_sync(self):
+        changed = 0
+        for alarm in self.storage_conn.get_changed_alarms(self._since,
+                                                          **self.filters):
+            changed += 1
+            if alarm.enabled:
+                self._alarms[alarm.alarm_id] = alarm
+            else:
+                self._alarms.pop(alarm.alarm_id, None)
+
+        count = self.storage_conn.count_alarms(enabled=True, **self.filters)
+        if count != len(self._alarms):
+            self._reconcile()
+        LOG.debug('Synchronized %d changed alarms in the inventory of %d '
+                  'alarms', changed, len(self._alarms))
+
+    def _reconcile(self):
+        alarm_ids = set(self.storage_conn.get_alarm_ids(enabled=True,
+                                                        **self.filters))
+        for alarm_id in set(self._alarms) - alarm_ids:
+            del self._alarms[alarm_id]
+        missing = alarm_ids - set(self._alarms)
+        if missing:
+            for alarm in self.storage_conn.get_alarms_for_evaluation(
+                    alarm_id={'in': list(missing)}):
+                self._alarms[alarm.alarm_id] = alarm
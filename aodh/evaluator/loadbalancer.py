@@ -38,6 +38,8 @@ OPTS = [
 
 
 class LoadBalancerMemberHealthEvaluator(evaluator.Evaluator):
+    backend = 'octavia'
+
     def __init__(self, conf):
         super().__init__(conf)
         self._lb_client = None
@@ -0,0 +1,65 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Memo of the metric backend queries of an evaluation cycle.
+
+The alarms, and the sub-rules of the composite alarms, whose rules resolve to
+the same backend query share the statistics retrieved by the first
+evaluation running the query during the cycle. The evaluations running a
+query already in progress wait for its result, failures included.
+"""
+
+from concurrent import futures
+import threading
+
+from oslo_log import log
+
+LOG = log.getLogger(__name__)
+
+
+class QueryMemo:
+    """Results of the backend queries of the current evaluation cycle."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def reset(self):
+        """Forget the results of the previous evaluation cycle."""
+        with self._lock:
+            if self._results:
+                LOG.debug('%d backend queries ran for the evaluation cycle, '
+                          '%d queries were shared', len(self._results),
+                          self.hits)
+            self._results = {}
+            self.hits = 0
+
+    def call(self, key, func, *args):
+        """Return the result of func(*args), run once per key and cycle."""
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                result = self._results[key] = futures.Future()
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        if owner:
+            try:
+                result.set_result(func(*args))
+            except Exception as e:
+                result.set_exception(e)
+        return result.result()
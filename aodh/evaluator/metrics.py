@@ -0,0 +1,316 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Telemetry of the evaluation service.
+
+The metrics are kept in memory by each evaluator worker, exposed in the
+Prometheus text format by a local HTTP endpoint and summarized in the Guru
+Meditation reports.
+"""
+
+import bisect
+import http.server
+import math
+import threading
+
+from oslo_log import log
+from oslo_reports import guru_meditation_report as gmr
+from oslo_reports.models import with_default_views
+
+LOG = log.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 120.0, 300.0)
+
+# title -> ReportGenerator, the Guru Meditation report sections registered
+# by this process.
+_REPORT_SECTIONS = {}
+
+MAX_PORT = 65535
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\')
+                     .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, lock, name, description, labels=()):
+        self._lock = lock
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        for key, value in sorted(self._values.items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return ['%s%s %s' % (self.name, _format_labels(self.labels, key),
+                             _format_value(value))]
+
+    def summary(self):
+        return {self.name + _format_labels(self.labels, key): value
+                for key, value in sorted(self._values.items())}
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, lock, name, description, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(lock, name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def get(self, **labels):
+        """Return the number and sum of the observed values."""
+        counts, total = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts), total
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (
+                self.name,
+                _format_labels(self.labels, key,
+                               [('le', _format_value(bound))]),
+                cumulative))
+        labels = _format_labels(self.labels, key)
+        lines.append('%s_sum%s %s' % (self.name, labels,
+                                      _format_value(total)))
+        lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+    def summary(self):
+        result = {}
+        for key, (counts, total) in sorted(self._values.items()):
+            count = sum(counts)
+            result[self.name + _format_labels(self.labels, key)] = (
+                'count=%d sum=%.3f mean=%.3f' % (count, total,
+                                                 total / count))
+        return result
+
+
+class Registry:
+    """Set of the metrics of a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labels=()):
+        return self._add(Counter(self._lock, name, description, labels))
+
+    def gauge(self, name, description, labels=()):
+        return self._add(Gauge(self._lock, name, description, labels))
+
+    def histogram(self, name, description, labels=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self._lock, name, description, labels,
+                                   buckets))
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        summary = {}
+        with self._lock:
+            for metric in self._metrics:
+                summary.update(metric.summary())
+        return summary
+
+
+class ReportGenerator:
+    """Guru Meditation report section generator of a registry."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __call__(self):
+        return with_default_views.ModelWithDefaultViews(
+            self.registry.summary())
+
+
+def report(title, registry):
+    """Summarize a registry in the Guru Meditation reports.
+
+    The section of a title is registered once per process, and reports the
+    last registry added with this title.
+    """
+    generator = _REPORT_SECTIONS.get(title)
+    if generator is None:
+        generator = _REPORT_SECTIONS[title] = ReportGenerator(registry)
+        gmr.TextGuruMeditation.register_section(title, generator)
+    generator.registry = registry
+
+
+class MetricsServer:
+    """HTTP server exposing a registry to Prometheus scrapes.
+
+    The server listens on a port picked by the system when the port is out
+    of range or already in use.
+    """
+
+    def __init__(self, registry, host, port):
+        self.registry = registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                LOG.debug('metrics endpoint: ' + format, *args)
+
+        if port > MAX_PORT:
+            LOG.warning('The metrics port %d is out of range', port)
+            port = 0
+        try:
+            self._server = http.server.ThreadingHTTPServer((host, port),
+                                                           Handler)
+        except OSError as e:
+            if not port:
+                raise
+            LOG.warning('Cannot listen on the metrics port %(port)d: '
+                        '%(error)s', {'port': port, 'error': e})
+            self._server = http.server.ThreadingHTTPServer((host, 0),
+                                                           Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        t = threading.Thread(target=self._server.serve_forever)
+        t.daemon = True
+        t.start()
+        LOG.info('Serving the evaluator metrics on port %d', self.port)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class EvaluationMetrics(Registry):
+    """Metrics of an alarm evaluation service."""
+
+    def __init__(self):
+        super().__init__()
+        self.cycles = self.counter(
+            'aodh_evaluator_cycles_total',
+            'Number of evaluation cycles.')
+        self.cycle_failures = self.counter(
+            'aodh_evaluator_cycle_failures_total',
+            'Number of evaluation cycles which failed.')
+        self.cycle_overruns = self.counter(
+            'aodh_evaluator_cycle_overruns_total',
+            'Number of evaluation cycles longer than the evaluation '
+            'interval.')
+        self.last_cycle_overrun = self.gauge(
+            'aodh_evaluator_last_cycle_overrun_seconds',
+            'Overrun of the evaluation interval by the last cycle.')
+        self.cycle_duration = self.histogram(
+            'aodh_evaluator_cycle_duration_seconds',
+            'Duration of the evaluation cycles.')
+        self.cycle_alarms = self.gauge(
+            'aodh_evaluator_cycle_alarms',
+            'Number of alarms to evaluate in the last cycle.')
+        self.evaluated = self.counter(
+            'aodh_evaluator_alarms_evaluated_total',
+            'Number of alarm evaluations.', ['type'])
+        self.errors = self.counter(
+            'aodh_evaluator_evaluation_errors_total',
+            'Number of alarm evaluations which failed.', ['type'])
+        self.skipped = self.counter(
+            'aodh_evaluator_alarms_skipped_total',
+            'Number of alarms not evaluated by this evaluator.', ['reason'])
+        self.partition_cost = self.gauge(
+            'aodh_evaluator_partition_cost_seconds',
+            'Smoothed evaluation time of the alarms assigned to this '
+            'evaluator.')
+        self.evaluation_duration = self.histogram(
+            'aodh_evaluator_alarm_evaluation_seconds',
+            'Duration of the alarm evaluations, including the requests to '
+            'the metric backend.', ['type'])
@@ -17,6 +17,7 @@ from oslo_config import cfg
 from oslo_log import log
 
 from observabilityclient import client
+from observabilityclient import prometheus_client
 from observabilityclient import rbac as obsc_rbac
 
 from aodh.evaluator import threshold
@@ -44,6 +45,8 @@ OPTS = [
 
 
 class PrometheusBase(threshold.ThresholdEvaluator):
+    backend = 'prometheus'
+
     def __init__(self, conf):
         super().__init__(conf)
         self._set_obsclient(conf)
@@ -55,9 +58,29 @@ class PrometheusBase(threshold.ThresholdEvaluator):
                 'region_name': conf.service_credentials.region_name}
         self._prom = client.Client('1', session, adapter_options=opts)
 
+    @staticmethod
+    def _is_backend_failure(exc):
+        # NOTE: the client errors, like an invalid query, do not mean that
+        # Prometheus is failing.
+        if not isinstance(exc, prometheus_client.PrometheusAPIClientError):
+            return True
+        status = getattr(exc.resp, 'status_code', None)
+        return status is None or status >= 500
+
     def _get_metric_data(self, query):
         LOG.debug('Querying Prometheus instance on: %s', query)
-        return self._prom.query.query(query)
+        return self._request(self._prom.query.query, query)
+
+    def _fetch_metric_data(self, query):
+        return self._memoized((type(self).__name__, query),
+                              self._get_metric_data, query)
+
+    async def _get_metric_data_async(self, query):
+        try:
+            return await self._call_backend(self._fetch_metric_data, query)
+        except TimeoutError:
+            raise threshold.InsufficientDataError(
+                'Prometheus query timed out', [])
 
 
 class PrometheusEvaluator(PrometheusBase):
@@ -74,6 +97,16 @@ class PrometheusEvaluator(PrometheusBase):
         :returns: state, trending state, statistics, number of samples outside
         threshold and reason
         """
+        query = self._query(alarm_rule)
+        metrics = self._fetch_metric_data(query)
+        return self._evaluate_metrics(alarm_rule, query, metrics)
+
+    async def evaluate_rule_async(self, alarm_rule):
+        query = self._query(alarm_rule)
+        metrics = await self._get_metric_data_async(query)
+        return self._evaluate_metrics(alarm_rule, query, metrics)
+
+    def _query(self, alarm_rule):
         scope_to_project = alarm_rule.get('scope_to_project', False)
         query = alarm_rule['query']
         if scope_to_project:
@@ -83,7 +116,9 @@ class PrometheusEvaluator(PrometheusBase):
                 project_label=self.conf.prometheus_project_label_name
             )
             query = promQLRbac.modify_query(query)
-        metrics = self._get_metric_data(query)
+        return query
+
+    def _evaluate_metrics(self, alarm_rule, query, metrics):
         if not metrics:
             LOG.warning("Empty result fetched from Prometheus for query %s",
                         query)
@@ -13,25 +13,25 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import asyncio
 import datetime
-import operator
+import json
 
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import timeutils
 
 from aodh import evaluator
+from aodh.evaluator import comparison
+from aodh.evaluator import utils
 
 LOG = log.getLogger(__name__)
 
-COMPARATORS = {
-    'gt': operator.gt,
-    'lt': operator.lt,
-    'ge': operator.ge,
-    'le': operator.le,
-    'eq': operator.eq,
-    'ne': operator.ne,
-}
+COMPARATORS = comparison.COMPARATORS
+
+# The datapoints further than this number of standard deviations from the
+# mean of the window are outliers.
+OUTLIER_DEVIATIONS = 2
 
 OPTS = [
     cfg.IntOpt('additional_ingestion_lag',
@@ -57,20 +57,60 @@ class ThresholdEvaluator(evaluator.Evaluator):
     # with 'additional_ingestion_lag' seconds if needed.
     look_back = 1
 
-    def _bound_duration(self, rule):
-        """Bound the duration of the statistics query."""
-        now = timeutils.utcnow()
+    # The rule fields defining the statistics query, the queries of the
+    # rules with the same fields and window are shared by the query memo.
+    query_fields = ()
+
+    def _window(self, rule):
+        """Return the duration of the statistics query in seconds."""
         # when exclusion of weak datapoints is enabled, we extend
         # the look-back period so as to allow a clearer sample count
         # trend to be established
-        window = ((rule.get('period', None) or rule['granularity'])
-                  * (rule['evaluation_periods'] + self.look_back) +
-                  self.conf.additional_ingestion_lag)
+        look_back = (rule['evaluation_periods']
+                     if rule.get('exclude_outliers') else self.look_back)
+        return ((rule.get('period', None) or rule['granularity'])
+                * (rule['evaluation_periods'] + look_back) +
+                self.conf.additional_ingestion_lag)
+
+    def _bound_duration(self, rule):
+        """Bound the duration of the statistics query."""
+        now = timeutils.utcnow()
+        window = self._window(rule)
         start = now - datetime.timedelta(seconds=window)
         LOG.debug('query stats from %(start)s to '
                   '%(now)s', {'start': start, 'now': now})
         return start.isoformat(), now.isoformat()
 
+    def evaluation_period(self, alarm_rule):
+        return alarm_rule.get('period') or alarm_rule.get('granularity')
+
+    def _query_key(self, rule):
+        """Return the canonical fingerprint of the statistics query."""
+        if not self.query_fields:
+            return None
+        return (type(self).__name__, self._window(rule),
+                json.dumps({field: rule.get(field)
+                            for field in self.query_fields},
+                           sort_keys=True))
+
+    def _fetch_statistics(self, rule, start, end):
+        return self._memoized(self._query_key(rule), self._query_statistics,
+                              rule, start, end)
+
+    def _query_statistics(self, rule, start, end):
+        return self._statistics(rule, start, end)
+
+    @staticmethod
+    def _exclude_outliers(statistics):
+        """Drop the datapoints too far from the mean of the window."""
+        mean, stddev = utils.mean_stddev(statistics)
+        inliers, outliers = utils.anomalies(
+            statistics, lambda x: x, mean - OUTLIER_DEVIATIONS * stddev,
+            mean + OUTLIER_DEVIATIONS * stddev)
+        if outliers:
+            LOG.debug('excluded outlier datapoints %s', outliers)
+        return inliers
+
     @staticmethod
     def _reason_data(disposition, count, most_recent):
         """Create a reason data dictionary for this evaluator type."""
@@ -98,25 +138,14 @@ class ThresholdEvaluator(evaluator.Evaluator):
                 % dict(reason_data, state=state), reason_data)
 
     def _process_statistics(self, alarm_rule, statistics):
-
-        def _compare(value):
-            op = COMPARATORS[alarm_rule['comparison_operator']]
-            limit = alarm_rule['threshold']
-            LOG.debug('comparing value %(value)s against threshold'
-                      ' %(limit)s', {'value': value, 'limit': limit})
-            return op(value, limit)
-
-        compared = list(map(_compare, statistics))
-        distilled = all(compared)
-        unequivocal = distilled or not any(compared)
-        number_outside = len([c for c in compared if c])
-
-        if unequivocal:
-            state = evaluator.ALARM if distilled else evaluator.OK
-            return state, None, statistics, number_outside, None
-        else:
-            trending_state = evaluator.ALARM if compared[-1] else evaluator.OK
-            return None, trending_state, statistics, number_outside, None
+        state, trending_state, number_outside = comparison.compare_window(
+            statistics, alarm_rule['comparison_operator'],
+            alarm_rule['threshold'])
+        LOG.debug('%(outside)d datapoints out of %(count)d are outside '
+                  'the threshold %(limit)s',
+                  {'outside': number_outside, 'count': len(statistics),
+                   'limit': alarm_rule['threshold']})
+        return state, trending_state, statistics, number_outside, None
 
     def evaluate_rule(self, alarm_rule):
         """Evaluate alarm rule.
@@ -124,7 +153,25 @@ class ThresholdEvaluator(evaluator.Evaluator):
         :returns: state, trending state and statistics.
         """
         start, end = self._bound_duration(alarm_rule)
-        statistics = self._statistics(alarm_rule, start, end)
+        statistics = self._fetch_statistics(alarm_rule, start, end)
+        return self._evaluate_statistics(alarm_rule, statistics)
+
+    async def evaluate_rule_async(self, alarm_rule):
+        """Evaluate alarm rule from the asyncio evaluation engine."""
+        start, end = self._bound_duration(alarm_rule)
+        statistics = await self._statistics_async(alarm_rule, start, end)
+        return self._evaluate_statistics(alarm_rule, statistics)
+
+    async def _statistics_async(self, rule, start, end):
+        try:
+            return await self._call_backend(self._fetch_statistics, rule,
+                                            start, end)
+        except TimeoutError:
+            raise InsufficientDataError(
+                'alarm statistics retrieval from %s timed out' %
+                self.backend, [])
+
+    def _evaluate_statistics(self, alarm_rule, statistics):
         statistics = self._sanitize(alarm_rule, statistics)
         sufficient = len(statistics) >= alarm_rule['evaluation_periods']
         if not sufficient:
@@ -176,6 +223,22 @@ class ThresholdEvaluator(evaluator.Evaluator):
         except InsufficientDataError as e:
             evaluation = (evaluator.UNKNOWN, None, e.statistics, 0,
                           e.reason)
+        self._apply_evaluation(alarm, evaluation)
+
+    async def evaluate_async(self, alarm):
+        if not self.within_time_constraint(alarm):
+            LOG.debug('Attempted to evaluate alarm %s, but it is not '
+                      'within its time constraint.', alarm.alarm_id)
+            return
+
+        try:
+            evaluation = await self.evaluate_rule_async(alarm.rule)
+        except InsufficientDataError as e:
+            evaluation = (evaluator.UNKNOWN, None, e.statistics, 0,
+                          e.reason)
+        await asyncio.to_thread(self._apply_evaluation, alarm, evaluation)
+
+    def _apply_evaluation(self, alarm, evaluation):
         self._transition_alarm(alarm, *evaluation)
         if evaluation[0] is not None:
             self._increment_evaluation_result(alarm.alarm_id,
@@ -24,15 +24,38 @@ def mean(s, key=lambda x: x):
     return 0.0
 
 
+def _welford(s, key):
+    """Calculate the count, mean and sum of squared deviations in one pass.
+
+    See Welford's online algorithm, numerically stabler than summing the
+    squares.
+    """
+    count = 0
+    m = 0.0
+    m2 = 0.0
+    for i in s:
+        v = key(i)
+        count += 1
+        delta = v - m
+        m += delta / count
+        m2 += delta * (v - m)
+    return count, m, m2
+
+
 def deltas(s, key, m=None):
     """Calculate the squared distances from mean for a numeric list."""
-    m = m or mean(s, key)
-    return [(key(i) - m) ** 2 for i in s]
+    if m is None:
+        m = mean(s, key)
+    return ((key(i) - m) ** 2 for i in s)
 
 
 def variance(s, key, m=None):
     """Calculate the variance of a numeric list."""
-    return mean(deltas(s, key, m))
+    if m is None:
+        count, m, m2 = _welford(s, key)
+        return m2 / count if count else 0.0
+    count = len(s)
+    return math.fsum(deltas(s, key, m)) / count if count else 0.0
 
 
 def stddev(s, key, m=None):
@@ -40,6 +63,14 @@ def stddev(s, key, m=None):
     return math.sqrt(variance(s, key, m))
 
 
+def mean_stddev(s, key=lambda x: x):
+    """Calculate the mean and standard deviation of a numeric list."""
+    count, m, m2 = _welford(s, key)
+    if not count:
+        return 0.0, 0.0
+    return m, math.sqrt(m2 / count)
+
+
 def outside(s, key, lower=0.0, upper=0.0):
     """Determine if value falls outside upper and lower bounds."""
     v = key(s)
@@ -0,0 +1,100 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Cache of the recent datapoints of the series evaluated by the alarms.
+
+Only the datapoints newer than the last cached datapoint, minus a margin
+covering the points still being aggregated or ingested, are retrieved from
+the metric backend at each evaluation. The datapoints older than the
+evaluation window are dropped.
+"""
+
+import collections
+import datetime
+import threading
+import time
+
+from oslo_utils import timeutils
+
+# The list of points that Gnocchi API returned is composed
+# of tuples with (timestamp, granularity, value), the timestamps being
+# converted to datetimes by the client
+TIMESTAMP = 0
+
+
+def parse_timestamp(timestamp):
+    """Return the naive UTC datetime of a datapoint timestamp."""
+    if isinstance(timestamp, datetime.datetime):
+        return timeutils.normalize_time(timestamp)
+    if isinstance(timestamp, (int, float)):
+        return datetime.datetime.fromtimestamp(
+            timestamp, datetime.timezone.utc).replace(tzinfo=None)
+    try:
+        return timeutils.normalize_time(timeutils.parse_isotime(timestamp))
+    except ValueError:
+        return parse_timestamp(float(timestamp))
+
+
+def merge(cached, fetched, start):
+    """Merge the fetched datapoints into the cached ones.
+
+    The fetched datapoints replace the cached datapoints with the same
+    timestamp, the datapoints older than start are dropped.
+
+    :param cached: the cached (datetime, datapoint) tuples, sorted.
+    :param fetched: the datapoints retrieved from the backend.
+    :param start: the naive UTC datetime of the window start.
+    :returns: the merged (datetime, datapoint) tuples, sorted.
+    """
+    points = dict(cached)
+    points.update((parse_timestamp(point[TIMESTAMP]), point)
+                  for point in fetched)
+    return sorted(((timestamp, point) for timestamp, point in points.items()
+                   if timestamp >= start), key=lambda p: p[0])
+
+
+class WindowCache:
+    """LRU cache of the recent datapoints of the evaluated series.
+
+    The series not updated since max_age seconds are reloaded entirely, so
+    that the datapoints changed by a late ingestion beyond the margin are
+    eventually retrieved.
+    """
+
+    def __init__(self, max_size, max_age):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # key -> (time of the complete load, [(datetime, datapoint)])
+        self._series = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._series)
+
+    def get(self, key):
+        """Return the load time and datapoints of a series, or None."""
+        with self._lock:
+            entry = self._series.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.max_age:
+                del self._series[key]
+                return None
+            self._series.move_to_end(key)
+            return entry
+
+    def put(self, key, loaded_at, points):
+        with self._lock:
+            self._series[key] = (loaded_at, points)
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_size:
+                self._series.popitem(last=False)
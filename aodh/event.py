@@ -13,6 +13,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import hashlib
+import struct
+
 import cotyledon
 from oslo_config import cfg
 from oslo_log import log
@@ -35,9 +39,35 @@ OPTS = [
     cfg.IntOpt('batch_timeout',
                help='Number of seconds to wait before dispatching samples '
                'when batch_size is not reached (None means indefinitely).'),
+    cfg.IntOpt('event_partitions',
+               default=0,
+               min=0,
+               help='When greater than 1, the events received on '
+               'event_alarm_topic are re-routed by a hash of their project '
+               'to this number of partition topics, named after '
+               'event_alarm_topic with the partition number as suffix, with '
+               'the driver of the [oslo_messaging_notifications] section, '
+               'which must send the notifications to the bus. Each '
+               'listener worker N consumes the partitions N, N + workers, '
+               'N + 2 * workers..., and only caches and evaluates the alarms '
+               'of the projects of its partitions. All the listeners must '
+               'use the same number of partitions, and it should be a '
+               'multiple of the number of workers of each listener. 0 or 1 '
+               'means every worker evaluates the events of every project.'),
 ]
 
 
+def project_partition(project, partitions):
+    """Return the stable partition of a project."""
+    return struct.unpack_from(
+        '>I', hashlib.md5(str(project).encode(),
+                          usedforsecurity=False).digest())[0] % partitions
+
+
+def partition_topic(topic, partition):
+    return '%s.%d' % (topic, partition)
+
+
 class EventAlarmEndpoint:
 
     def __init__(self, evaluator):
@@ -49,21 +79,78 @@ class EventAlarmEndpoint:
             self.evaluator.evaluate_events(notification['payload'])
 
 
+class EventAlarmRoutingEndpoint:
+    """Re-route the events to the partition topic of their project."""
+
+    def __init__(self, notifiers):
+        self.notifiers = notifiers
+
+    def _partition(self, e):
+        try:
+            project = event.Event(e).project
+        except event.InvalidEvent:
+            # NOTE: the evaluator of any partition discards it.
+            project = ''
+        return project_partition(project, len(self.notifiers))
+
+    def sample(self, notifications):
+        LOG.debug('Routing %s messages in batch.', len(notifications))
+        for notification in notifications:
+            events = notification['payload']
+            if not isinstance(events, list):
+                events = [events]
+            partitions = collections.defaultdict(list)
+            for e in events:
+                partitions[self._partition(e)].append(e)
+            for partition, events in partitions.items():
+                self.notifiers[partition].sample(
+                    notification.get('ctxt') or {},
+                    notification['event_type'], events)
+
+
 class EventAlarmEvaluationService(cotyledon.Service):
     def __init__(self, worker_id, conf):
         super().__init__(worker_id)
         self.conf = conf
         self.storage_conn = storage.get_connection_from_config(self.conf)
         self.evaluator = event.EventAlarmEvaluator(self.conf)
-        self.listener = messaging.get_batch_notification_listener(
-            messaging.get_transport(self.conf),
-            [oslo_messaging.Target(
-                topic=self.conf.listener.event_alarm_topic)],
-            [EventAlarmEndpoint(self.evaluator)], False,
+        transport = messaging.get_transport(self.conf)
+        topic = self.conf.listener.event_alarm_topic
+        partitions = self.conf.listener.event_partitions
+        if partitions > 1:
+            # NOTE: every worker routes the events of the shared topic, but
+            # only evaluates the events of its partitions.
+            notifiers = [messaging.get_notifier(
+                transport, 'aodh.listener',
+                topics=[partition_topic(topic, partition)])
+                for partition in range(partitions)]
+            self.listener = self._get_listener(
+                transport, [topic], EventAlarmRoutingEndpoint(notifiers))
+            owned = range(worker_id, partitions, self.conf.listener.workers)
+            self.listeners = [self.listener]
+            if owned:
+                self.listeners.append(self._get_listener(
+                    transport,
+                    [partition_topic(topic, partition)
+                     for partition in owned],
+                    EventAlarmEndpoint(self.evaluator)))
+        else:
+            self.listener = self._get_listener(
+                transport, [topic], EventAlarmEndpoint(self.evaluator))
+            self.listeners = [self.listener]
+        for listener in self.listeners:
+            listener.start()
+
+    def _get_listener(self, transport, topics, endpoint):
+        return messaging.get_batch_notification_listener(
+            transport,
+            [oslo_messaging.Target(topic=topic) for topic in topics],
+            [endpoint], False,
             self.conf.listener.batch_size,
             self.conf.listener.batch_timeout)
-        self.listener.start()
 
     def terminate(self):
-        self.listener.stop()
-        self.listener.wait()
+        for listener in self.listeners:
+            listener.stop()
+        for listener in self.listeners:
+            listener.wait()
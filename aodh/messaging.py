@@ -54,7 +54,8 @@ def get_batch_notification_listener(transport, targets, endpoints,
         batch_size=batch_size, batch_timeout=batch_timeout)
 
 
-def get_notifier(transport, publisher_id):
+def get_notifier(transport, publisher_id, topics=None):
     """Return a configured oslo_messaging notifier."""
-    notifier = oslo_messaging.Notifier(transport, serializer=_SERIALIZER)
+    notifier = oslo_messaging.Notifier(transport, serializer=_SERIALIZER,
+                                       topics=topics)
     return notifier.prepare(publisher_id=publisher_id)
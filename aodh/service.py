@@ -42,6 +42,250 @@ EVALUATOR_OPTS = [
                help='Period of evaluation cycle, should'
                ' be >= than configured pipeline interval for'
                ' collection of underlying meters.'),
+    cfg.BoolOpt('worker_sharding',
+                default=False,
+                help='Split the alarms between the workers of the evaluator '
+                     'service by hashing their ID, instead of having every '
+                     'worker consider every alarm. With a coordination '
+                     'backend, all the workers of the service are a single '
+                     'member of the partitioning group, only the first '
+                     'worker joins the group and sends heartbeats, so the '
+                     'service gets a single share of the alarms whatever '
+                     'its number of workers. Not used when alarms are '
+                     'claimed by blocks.'),
+    cfg.IntOpt('evaluation_threads',
+               default=1,
+               min=1,
+               help='Number of threads each evaluator worker uses to '
+                    'evaluate its assigned alarms concurrently during an '
+                    'evaluation cycle. Increase it when the evaluation of '
+                    'an alarm is dominated by the latency of the metric '
+                    'backend.'),
+    cfg.BoolOpt('spread_evaluations',
+                default=False,
+                help='Spread the evaluation of the assigned alarms over the '
+                     'evaluation interval instead of evaluating all of them '
+                     'at the beginning of each cycle. Each alarm is '
+                     'evaluated at a stable offset within the interval '
+                     'derived from its ID.'),
+    cfg.IntOpt('inventory_resync_interval',
+               default=0,
+               min=0,
+               help='When greater than 0, the evaluator keeps a local '
+                    'inventory of the alarms to evaluate and only loads the '
+                    'alarms changed since the previous cycle, the whole '
+                    'inventory being reloaded every '
+                    'inventory_resync_interval seconds. The inventory is '
+                    'only used when a coordination backend is configured. '
+                    'When 0, all the alarms are loaded at every cycle.'),
+    cfg.IntOpt('alarm_claim_batch_size',
+               default=0,
+               min=0,
+               help='When no coordination backend is configured, claim the '
+                    'alarms to evaluate by blocks of this size with a single '
+                    'database update per block, instead of one conditional '
+                    'update per alarm. spread_evaluations is ignored when '
+                    'alarms are claimed by blocks. 0 disables block '
+                    'claiming.'),
+    cfg.StrOpt('evaluation_engine',
+               default='threads',
+               choices=[('threads', 'Evaluate each alarm in a thread.'),
+                        ('asyncio', 'Evaluate the alarms as coroutines of '
+                                    'an event loop, with the requests to '
+                                    'each metric backend limited by '
+                                    'backend_concurrency and '
+                                    'backend_timeout.')],
+               help='Engine evaluating the alarms of an evaluation cycle. '
+                    'The metric backend clients being blocking, with the '
+                    'asyncio engine the requests to each metric backend are '
+                    'run in a dedicated pool of backend_concurrency threads, '
+                    'and the database requests in a pool of '
+                    'storage_concurrency threads.'),
+    cfg.IntOpt('backend_concurrency',
+               default=16,
+               min=1,
+               help='Maximum number of concurrent requests to each metric '
+                    'backend (Gnocchi, Prometheus, Octavia) with the asyncio '
+                    'evaluation engine. The requests abandoned after '
+                    'backend_timeout count until they complete.'),
+    cfg.IntOpt('storage_concurrency',
+               default=16,
+               min=1,
+               help='Maximum number of concurrent database requests of the '
+                    'evaluations (reservation of the alarms, state '
+                    'transitions) with the asyncio evaluation engine. It '
+                    'should not exceed the size of the database connection '
+                    'pool.'),
+    cfg.IntOpt('backend_timeout',
+               default=60,
+               min=0,
+               help='Number of seconds after which the evaluation of an alarm '
+                    'waiting for its metric backend is abandoned with the '
+                    'asyncio evaluation engine, the alarm then has '
+                    'insufficient data. 0 means no timeout.'),
+    cfg.PortOpt('metrics_port',
+                default=0,
+                help='Port on which each evaluator worker exposes its '
+                     'evaluation metrics in the Prometheus text format, the '
+                     'worker N listening on metrics_port + N. A worker whose '
+                     'port is out of range or already in use listens on a '
+                     'port picked by the system, which it logs. 0 disables '
+                     'the metrics endpoint.'),
+    cfg.HostAddressOpt('metrics_host',
+                       default='127.0.0.1',
+                       help='Address on which the evaluation metrics are '
+                            'exposed.'),
+    cfg.BoolOpt('schedule_by_rule_period',
+                default=False,
+                help='Evaluate the alarms whose rule period or granularity '
+                     'is longer than the evaluation interval only once per '
+                     'period, right after the end of each period (plus '
+                     'additional_ingestion_lag), instead of at every '
+                     'evaluation cycle. The aggregate of the period in '
+                     'progress is then not re-evaluated before the period '
+                     'is over. Not used when alarms are claimed by blocks.'),
+    cfg.IntOpt('schedule_ingestion_margin',
+               default=120,
+               min=0,
+               help='Number of seconds after the end of a rule period (plus '
+                    'additional_ingestion_lag) during which the alarms '
+                    'scheduled by rule period are still evaluated at every '
+                    'evaluation cycle, so that the measures of the closed '
+                    'period ingested late are taken into account.'),
+    cfg.BoolOpt('partition_by_bucket',
+                default=False,
+                help='Split the partition buckets of the alarms, instead of '
+                     'the alarms, between the members of the partitioning '
+                     'group and the workers sharding the alarms, so that '
+                     'each evaluator only queries the alarms of its '
+                     'buckets. All the evaluators of a group must use the '
+                     'same setting.'),
+    cfg.BoolOpt('write_behind',
+                default=False,
+                help='Buffer the alarm state transitions, history and '
+                     'evaluation counters, and write them with a single '
+                     'database transaction at the end of each evaluation '
+                     'cycle instead of several transactions per state '
+                     'transition. The alarm actions of a transition are '
+                     'only notified once it has been written. If the write '
+                     'fails, the transitions are detected again at the next '
+                     'evaluation and the buffered counters are lost.'),
+    cfg.IntOpt('write_behind_max_size',
+               default=500,
+               min=1,
+               help='Number of buffered results from which the write-behind '
+                    'buffer is written before the end of the evaluation '
+                    'cycle.'),
+    cfg.IntOpt('write_behind_max_delay',
+               default=1000,
+               min=0,
+               help='Delay in milliseconds after which buffered results are '
+                    'written before the end of the evaluation cycle. The '
+                    'delay is checked when a result is buffered.'),
+    cfg.IntOpt('gnocchi_batch_size',
+               default=0,
+               min=0,
+               help='Maximum number of resources whose measures are '
+                    'retrieved with a single Gnocchi request for the '
+                    'gnocchi_resources_threshold alarms of an evaluation '
+                    'cycle sharing the same resource type, metric, '
+                    'aggregation method, granularity and evaluation window. '
+                    'Not used when the evaluations are spread over the '
+                    'evaluation interval. 0 retrieves the measures of each '
+                    'alarm with its own request.'),
+    cfg.BoolOpt('query_memo',
+                default=False,
+                help='Run the identical metric backend queries of the alarms '
+                     'and composite sub-rules of an evaluation cycle only '
+                     'once, and share their statistics between the alarms. '
+                     'Queries are identical when they have the same '
+                     'evaluator type, query fields and evaluation window '
+                     'length. Not used when the evaluations are spread over '
+                     'the evaluation interval.'),
+    cfg.IntOpt('gnocchi_metric_cache_ttl',
+               default=0,
+               min=0,
+               help='Number of seconds during which the ID of the metric of '
+                    'a gnocchi_resources_threshold alarm, resolved from its '
+                    'resource and metric name, is cached. The measures of '
+                    'the metric are then retrieved by ID. 0 disables the '
+                    'cache.'),
+    cfg.IntOpt('gnocchi_metric_negative_ttl',
+               default=60,
+               min=1,
+               help='Number of seconds during which a missing resource or '
+                    'metric of a gnocchi_resources_threshold alarm is '
+                    'cached, doubled at each consecutive miss up to 32 '
+                    'times, when gnocchi_metric_cache_ttl is set. The alarm '
+                    'has insufficient data meanwhile.'),
+    cfg.IntOpt('gnocchi_search_refresh_interval',
+               default=0,
+               min=0,
+               help='When greater than 0, the resource search of a '
+                    'gnocchi_aggregation_by_resources_threshold alarm is '
+                    'resolved to the IDs of the metrics of the matching '
+                    'resources every gnocchi_search_refresh_interval '
+                    'seconds, and the alarm is evaluated with an aggregation '
+                    'of these metrics in between, instead of Gnocchi '
+                    'running the search at every evaluation. The resources '
+                    'starting to match the search are only aggregated after '
+                    'the next refresh. 0 runs the search at every '
+                    'evaluation.'),
+    cfg.FloatOpt('circuit_breaker_failure_ratio',
+                 default=0.0,
+                 min=0.0,
+                 max=1.0,
+                 help='Ratio of failed or slow requests among the last '
+                      'circuit_breaker_window requests to a metric backend '
+                      'from which the requests to the backend are suspended '
+                      'for circuit_breaker_open_duration seconds. The alarms '
+                      'of a suspended backend are skipped and keep their '
+                      'state, instead of each waiting for the request '
+                      'timeout. 0 disables the circuit breakers.'),
+    cfg.IntOpt('circuit_breaker_window',
+               default=20,
+               min=1,
+               help='Number of recent requests to a metric backend whose '
+                    'outcome is considered by its circuit breaker.'),
+    cfg.FloatOpt('circuit_breaker_slow_call',
+                 default=0.0,
+                 min=0.0,
+                 help='Number of seconds from which a successful request to '
+                      'a metric backend counts as a failure for its circuit '
+                      'breaker. 0 means that slow requests do not count as '
+                      'failures.'),
+    cfg.IntOpt('circuit_breaker_open_duration',
+               default=30,
+               min=1,
+               help='Number of seconds during which the requests to a '
+                    'failing metric backend are suspended, before a single '
+                    'request probes whether it is available again.'),
+    cfg.IntOpt('measure_cache_size',
+               default=0,
+               min=0,
+               help='Maximum number of Gnocchi series whose recent '
+                    'datapoints are cached by each evaluator, the least '
+                    'recently evaluated series being evicted first. The '
+                    'cached alarms only retrieve the datapoints newer than '
+                    'their last datapoint minus one granularity and '
+                    'additional_ingestion_lag. Not used for the '
+                    'gnocchi_aggregation_by_resources_threshold alarms, '
+                    'whose aggregated datapoints change with the resources '
+                    'matching their query. 0 disables the cache.'),
+    cfg.IntOpt('measure_cache_max_age',
+               default=3600,
+               min=0,
+               help='Number of seconds after which the cached datapoints of '
+                    'a series are retrieved again entirely, to catch up with '
+                    'the datapoints ingested later than the margin.'),
+    cfg.BoolOpt('gnocchi_downsampling',
+                default=False,
+                help='Compute the datapoints of the Gnocchi alarms whose '
+                     'metrics have no archive policy at their granularity '
+                     'from the coarsest granularity evenly dividing it, for '
+                     'the mean, min, max, sum, count, first and last '
+                     'aggregation methods. The means are averaged without '
+                     'weighting them by their number of measures.'),
 ]
 
 NOTIFIER_OPTS = [
@@ -93,6 +93,43 @@ class Connection:
         """Yields a lists of alarms that match filters."""
         raise aodh.NotImplementedError('Alarms not implemented')
 
+    @staticmethod
+    def get_alarms_for_evaluation(**kwargs):
+        """Return the evaluation view of the alarms that match filters."""
+        raise aodh.NotImplementedError('Alarms not implemented')
+
+    @staticmethod
+    def get_changed_alarms(since, **kwargs):
+        """Return the alarms updated or changing state since a timestamp.
+
+        :param since: Lower bound of the alarm timestamp or state_timestamp.
+        :returns: The evaluation view of the changed alarms.
+        """
+        raise aodh.NotImplementedError('Alarms not implemented')
+
+    @staticmethod
+    def get_alarm_ids(**kwargs):
+        """Return the IDs of the alarms that match filters."""
+        raise aodh.NotImplementedError('Alarms not implemented')
+
+    @staticmethod
+    def count_alarms(**kwargs):
+        """Return the number of alarms that match filters."""
+        raise aodh.NotImplementedError('Alarms not implemented')
+
+    @staticmethod
+    def claim_alarms(owner, claimed_at, before, limit, **kwargs):
+        """Claim a block of alarms not evaluated since a timestamp.
+
+        :param owner: ID of the evaluator claiming the alarms.
+        :param claimed_at: New evaluate_timestamp of the claimed alarms.
+        :param before: Only alarms evaluated before this are claimed.
+        :param limit: Maximum number of alarms to claim.
+        :returns: The evaluation view of the alarms claimed by owner, empty
+                  only if no alarm is left to claim.
+        """
+        raise aodh.NotImplementedError('Alarms not implemented')
+
     @staticmethod
     def create_alarm(alarm):
         """Create an alarm. Returns the alarm as created.
@@ -159,6 +196,20 @@ class Connection:
         """Record alarm change event."""
         raise aodh.NotImplementedError('Alarm history not implemented')
 
+    @staticmethod
+    def record_evaluation_results(states, changes, counters):
+        """Record the results of alarm evaluations in a single transaction.
+
+        :param states: List of dicts with the alarm_id, state, state_reason
+                       and state_timestamp of the alarms changing state.
+        :param changes: List of alarm change events to record.
+        :param counters: List of (alarm_id, project_id, state) tuples of
+                         the alarm counters to increment.
+        :returns: The IDs of the alarms which still exist. Nothing is
+                  recorded for the others.
+        """
+        raise aodh.NotImplementedError('Alarms not implemented')
+
     @staticmethod
     def clear():
         """Clear database."""
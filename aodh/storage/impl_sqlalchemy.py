@@ -25,6 +25,7 @@ from oslo_db.sqlalchemy import utils as oslo_sql_utils
 from oslo_log import log
 from oslo_utils import importutils
 from oslo_utils import timeutils
+from oslo_utils import uuidutils
 import sqlalchemy
 from sqlalchemy import asc
 from sqlalchemy import desc
@@ -228,6 +229,31 @@ class Connection(base.Connection):
             evaluate_timestamp=row.evaluate_timestamp
         )
 
+    @staticmethod
+    def _row_to_evaluation_model(row):
+        return alarm_api_models.AlarmEvaluationView(
+            alarm_id=row.alarm_id,
+            type=row.type,
+            enabled=row.enabled,
+            project_id=row.project_id,
+            state=row.state,
+            rule=row.rule,
+            time_constraints=row.time_constraints,
+            repeat_actions=row.repeat_actions,
+            timestamp=row.timestamp,
+            state_timestamp=row.state_timestamp,
+            evaluate_timestamp=row.evaluate_timestamp,
+            partition_bucket=row.partition_bucket
+        )
+
+    @staticmethod
+    def _evaluation_query(session, **kwargs):
+        query = session.query(models.Alarm)
+        query = apply_filters(query, models.Alarm, **kwargs)
+        return query.with_entities(
+            *[getattr(models.Alarm, field) for field in
+              alarm_api_models.AlarmEvaluationView.get_field_names()])
+
     def _retrieve_alarms(self, query):
         return [self._row_to_alarm_model(x) for x in query.all()]
 
@@ -288,13 +314,124 @@ class Connection(base.Connection):
 
         return alarms
 
+    def get_alarms_for_evaluation(self, **kwargs):
+        """Return the evaluation view of the alarms that match filters."""
+        with _session_for_read() as session:
+            query = self._evaluation_query(session, **kwargs)
+            return [self._row_to_evaluation_model(x) for x in query.all()]
+
+    def get_changed_alarms(self, since, **kwargs):
+        """Return the alarms updated or changing state since a timestamp.
+
+        :param since: Lower bound of the alarm timestamp or state_timestamp.
+        :returns: The evaluation view of the changed alarms.
+        """
+        with _session_for_read() as session:
+            query = self._evaluation_query(session, **kwargs).filter(
+                sqlalchemy.or_(models.Alarm.timestamp >= since,
+                               models.Alarm.state_timestamp >= since))
+            return [self._row_to_evaluation_model(x) for x in query.all()]
+
+    def get_alarm_ids(self, **kwargs):
+        """Return the IDs of the alarms that match filters."""
+        with _session_for_read() as session:
+            query = session.query(models.Alarm)
+            query = apply_filters(query, models.Alarm, **kwargs)
+            query = query.with_entities(models.Alarm.alarm_id)
+            return [row.alarm_id for row in query.all()]
+
+    def count_alarms(self, **kwargs):
+        """Return the number of alarms that match filters."""
+        with _session_for_read() as session:
+            query = session.query(models.Alarm)
+            query = apply_filters(query, models.Alarm, **kwargs)
+            return query.with_entities(
+                func.count(models.Alarm.alarm_id)).scalar()
+
+    @staticmethod
+    def _supports_skip_locked(dialect):
+        if dialect.name == 'postgresql':
+            return True
+        if dialect.name == 'mysql':
+            version = dialect.server_version_info or ()
+            if getattr(dialect, 'is_mariadb', False):
+                return version >= (10, 6)
+            return version >= (8, 0, 1)
+        return False
+
+    def claim_alarms(self, owner, claimed_at, before, limit, **kwargs):
+        """Claim a block of alarms not evaluated since a timestamp.
+
+        The evaluate_timestamp and lease_owner of up to limit alarms are
+        set with a single update statement. The candidate rows are locked,
+        skipping the rows locked by the other evaluators, where the backend
+        supports it. Otherwise, the update is conditional on
+        evaluate_timestamp so that an alarm is only claimed by one of the
+        evaluators racing for it, and the losing evaluator claims the next
+        candidates.
+
+        :param owner: ID of the evaluator claiming the alarms.
+        :param claimed_at: New evaluate_timestamp of the claimed alarms.
+        :param before: Only alarms evaluated before this are claimed.
+        :param limit: Maximum number of alarms to claim.
+        :returns: The evaluation view of the alarms claimed by owner, empty
+                  only if no alarm is left to claim.
+        """
+        while True:
+            claimed = self._claim_alarms(owner, claimed_at, before, limit,
+                                         **kwargs)
+            # NOTE: None means that all the candidates were claimed by
+            # other evaluators, the next candidates are claimed.
+            if claimed is not None:
+                return claimed
+
+    def _claim_alarms(self, owner, claimed_at, before, limit, **kwargs):
+        with _session_for_write() as session:
+            query = self._evaluation_query(session, **kwargs).filter(
+                models.Alarm.evaluate_timestamp < before).order_by(
+                    models.Alarm.evaluate_timestamp).limit(limit)
+            if self._supports_skip_locked(session.connection().dialect):
+                query = query.with_for_update(skip_locked=True)
+            candidates = {
+                row.alarm_id: self._row_to_evaluation_model(row)
+                for row in query}
+            if not candidates:
+                return []
+
+            claimed = session.query(models.Alarm).filter(
+                models.Alarm.alarm_id.in_(list(candidates)),
+                models.Alarm.evaluate_timestamp < before,
+            ).update({'evaluate_timestamp': claimed_at,
+                      'lease_owner': owner},
+                     synchronize_session=False)
+
+            if claimed != len(candidates):
+                # Some alarms have been claimed by another evaluator in the
+                # meantime, only keep ours. Rows not updated by this
+                # transaction may show a lease of a previous cycle.
+                owned = session.query(models.Alarm.alarm_id).filter(
+                    models.Alarm.alarm_id.in_(list(candidates)),
+                    models.Alarm.lease_owner == owner,
+                    models.Alarm.evaluate_timestamp >= before)
+                candidates = {row.alarm_id: candidates[row.alarm_id]
+                              for row in owned}
+                if not candidates:
+                    return None
+
+        for alarm in candidates.values():
+            alarm.evaluate_timestamp = claimed_at
+        return list(candidates.values())
+
     def create_alarm(self, alarm):
         """Create an alarm.
 
         :param alarm: The alarm to create.
         """
         with _session_for_write() as session:
-            alarm_row = models.Alarm(alarm_id=alarm.alarm_id)
+            alarm_row = models.Alarm(
+                alarm_id=alarm.alarm_id,
+                partition_bucket=alarm_api_models.partition_bucket(
+                    alarm.alarm_id))
             alarm_row.update(alarm.as_dict())
             session.add(alarm_row)
 
@@ -483,6 +620,80 @@ class Connection(base.Connection):
             alarm_change_row.update(alarm_change)
             session.add(alarm_change_row)
 
+    def record_evaluation_results(self, states, changes, counters):
+        """Record the results of alarm evaluations in a single transaction.
+
+        Only the state, state_reason and state_timestamp of the alarms are
+        updated, with one bulk update by primary key. The counter increments of an alarm
+        are aggregated. Nothing is recorded for the alarms deleted since
+        their evaluation.
+
+        :param states: List of dicts with the alarm_id, state, state_reason
+                       and state_timestamp of the alarms changing state.
+        :param changes: List of alarm change events to record.
+        :param counters: List of (alarm_id, project_id, state) tuples of
+                         the alarm counters to increment.
+        :returns: The IDs of the alarms which still exist.
+        """
+        alarm_ids = ({s['alarm_id'] for s in states} |
+                     {c['alarm_id'] for c in changes} |
+                     {c[0] for c in counters})
+        if not alarm_ids:
+            return set()
+
+        with _session_for_write() as session:
+            existing = {row.alarm_id for row in session.query(
+                models.Alarm.alarm_id).filter(
+                    models.Alarm.alarm_id.in_(list(alarm_ids)))}
+
+            states = [dict(alarm_id=s['alarm_id'], state=s['state'],
+                           state_reason=s['state_reason'],
+                           state_timestamp=s['state_timestamp'])
+                      for s in states if s['alarm_id'] in existing]
+            if states:
+                session.execute(sqlalchemy.update(models.Alarm), states)
+
+            changes = [c for c in changes if c['alarm_id'] in existing]
+            if changes:
+                session.execute(sqlalchemy.insert(models.AlarmChange),
+                                changes)
+
+            increments = {}
+            for key in counters:
+                if key[0] in existing:
+                    increments[key] = increments.get(key, 0) + 1
+            if increments:
+                rows = session.query(models.AlarmCounter).filter(
+                    models.AlarmCounter.alarm_id.in_(
+                        list({key[0] for key in increments})))
+                current = {(row.alarm_id, row.project_id, row.state):
+                           (row.id, row.value) for row in rows}
+                updates = []
+                inserts = []
+                for key, increment in increments.items():
+                    if key not in current:
+                        inserts.append(dict(id=uuidutils.generate_uuid(),
+                                            alarm_id=key[0],
+                                            project_id=key[1],
+                                            state=key[2],
+                                            value=increment))
+                        continue
+                    counter_id, value = current[key]
+                    if value >= COUNTER_RESET_AT_VALUE:
+                        LOG.debug("Resetting counter %(state)s for alarm "
+                                  "%(alarm_id)s",
+                                  {'alarm_id': key[0], 'state': key[2]})
+                        value = 0
+                    updates.append(dict(id=counter_id,
+                                        value=value + increment))
+                if updates:
+                    session.execute(sqlalchemy.update(models.AlarmCounter),
+                                    updates)
+                if inserts:
+                    session.execute(sqlalchemy.insert(models.AlarmCounter),
+                                    inserts)
+        return existing
+
     def clear_expired_alarm_history_data(self, ttl, max_count=100):
         """Clear expired alarm history data from the backend storage system.
 
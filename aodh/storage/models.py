@@ -16,10 +16,27 @@
 """
 
 import datetime
+import hashlib
+import struct
 
 from aodh.i18n import _
 from aodh.storage import base
 
+# Number of partition buckets of the alarms.
+PARTITION_BUCKETS = 1024
+
+
+def partition_bucket(alarm_id):
+    """Return the partition bucket of an alarm, stored with the alarm.
+
+    The evaluators partition the buckets between them and only query the
+    alarms of their buckets.
+    """
+    return struct.unpack_from(
+        '>I', hashlib.md5(str(alarm_id).encode(),
+                          usedforsecurity=False).digest())[0] % (
+        PARTITION_BUCKETS)
+
 
 class Alarm(base.Model):
     ALARM_INSUFFICIENT_DATA = 'insufficient data'
@@ -102,6 +119,48 @@ class Alarm(base.Model):
             evaluate_timestamp=evaluate_timestamp)
 
 
+class AlarmEvaluationView(base.Model):
+    """The subset of an alarm needed to evaluate it.
+
+    The description, state reason, name and actions of the alarm are left
+    out, the evaluator loads the complete alarm when its state changes or
+    its actions are repeated.
+
+    :param alarm_id: UUID of the alarm
+    :param type: type of the alarm
+    :param enabled: Is the alarm enabled
+    :param project_id: the project_id of the creator
+    :param state: Alarm state (ok/alarm/insufficient data)
+    :param rule: A rule that defines when the alarm fires
+    :param time_constraints: the list of the alarm's time constraints, if any
+    :param repeat_actions: Is the actions should be triggered on each
+                           alarm evaluation.
+    :param timestamp: the timestamp when the alarm was last updated
+    :param state_timestamp: the timestamp of the last state change
+    :param evaluate_timestamp: The timestamp when the alarm is finished
+                               evaluating.
+    :param partition_bucket: The partition bucket of the alarm, None if it
+                             has not been computed yet.
+    """
+    def __init__(self, alarm_id, type, enabled, project_id, state, rule,
+                 time_constraints, repeat_actions, timestamp,
+                 state_timestamp, evaluate_timestamp=None,
+                 partition_bucket=None):
+        super().__init__(
+            alarm_id=alarm_id,
+            type=type,
+            enabled=enabled,
+            project_id=project_id,
+            state=state,
+            rule=rule,
+            time_constraints=time_constraints,
+            repeat_actions=repeat_actions,
+            timestamp=timestamp,
+            state_timestamp=state_timestamp,
+            evaluate_timestamp=evaluate_timestamp,
+            partition_bucket=partition_bucket)
+
+
 class AlarmChange(base.Model):
     """Record of an alarm change.
 
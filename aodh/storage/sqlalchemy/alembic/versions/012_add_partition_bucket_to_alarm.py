@@ -0,0 +1,72 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""Add partition_bucket to alarm
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-17 14:03:51.620417
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+import collections
+import hashlib
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+
+# Maximum number of alarm IDs per update statement of the backfill.
+BATCH_SIZE = 1000
+
+# Number of partition buckets of the alarms, as of this revision.
+PARTITION_BUCKETS = 1024
+
+
+def partition_bucket(alarm_id):
+    # NOTE: a copy of aodh.storage.models.partition_bucket as of this
+    # revision, the migration must not change with the application code.
+    return struct.unpack_from(
+        '>I', hashlib.md5(str(alarm_id).encode(),
+                          usedforsecurity=False).digest())[0] % (
+        PARTITION_BUCKETS)
+
+
+def upgrade():
+    op.add_column(
+        'alarm',
+        sa.Column('partition_bucket', sa.Integer(), nullable=True)
+    )
+    op.create_index(
+        'ix_alarm_partition_bucket', 'alarm', ['partition_bucket'],
+        unique=False)
+
+    alarm = sa.sql.table('alarm',
+                         sa.Column('alarm_id', sa.String(128)),
+                         sa.Column('partition_bucket', sa.Integer()))
+    buckets = collections.defaultdict(list)
+    for row in op.get_bind().execute(sa.select(alarm.c.alarm_id)):
+        buckets[partition_bucket(row.alarm_id)].append(row.alarm_id)
+    for bucket, alarm_ids in buckets.items():
+        for i in range(0, len(alarm_ids), BATCH_SIZE):
+            op.execute(alarm.update().where(
+                alarm.c.alarm_id.in_(alarm_ids[i:i + BATCH_SIZE])
+            ).values(partition_bucket=bucket))
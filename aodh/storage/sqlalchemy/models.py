@@ -84,6 +84,7 @@ class Alarm(Base):
         Index('ix_alarm_project_id', 'project_id'),
         Index('ix_alarm_enabled', 'enabled'),
         Index('ix_alarm_type', 'type'),
+        Index('ix_alarm_partition_bucket', 'partition_bucket'),
     )
     alarm_id = Column(String(128), primary_key=True)
     enabled = Column(Boolean)
@@ -110,6 +111,8 @@ class Alarm(Base):
     time_constraints = Column(JSONEncodedDict)
 
     evaluate_timestamp = Column(DateTime, default=lambda: timeutils.utcnow())
+    lease_owner = Column(String(128))
+    partition_bucket = Column(Integer)
 
 
 class AlarmChange(Base):
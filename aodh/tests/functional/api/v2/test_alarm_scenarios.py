@@ -1377,6 +1377,36 @@ class TestAlarmsRuleGnocchi(TestAlarmsBase):
             jsonlib.dumps(expected_query))
         self._verify_alarm(json, alarms[0])
 
+    def test_post_gnocchi_resources_alarm_exclude_outliers(self):
+        json = {
+            'enabled': False,
+            'name': 'exclude_outliers',
+            'type': 'gnocchi_resources_threshold',
+            'gnocchi_resources_threshold_rule': {
+                'metric': 'ameter',
+                'comparison_operator': 'gt',
+                'aggregation_method': 'count',
+                'threshold': 50,
+                'evaluation_periods': 3,
+                'granularity': 180,
+                'resource_type': 'instance',
+                'resource_id': '209ef69c-c10c-4efb-90ff-46f4b2d90d2e',
+                'exclude_outliers': True,
+            }
+        }
+        with mock.patch('aodh.api.controllers.v2.alarm_rules.'
+                        'gnocchi.client') as clientlib:
+            c = clientlib.Client.return_value
+            c.capabilities.list.return_value = {
+                'aggregation_methods': ['count']}
+            self.post_json('/alarms', params=json, headers=self.auth_headers)
+
+        alarms = list(self.alarm_conn.get_alarms(enabled=False))
+        self.assertEqual(1, len(alarms))
+        self.assertTrue(alarms[0].rule['exclude_outliers'])
+        self.assertNotIn('exclude_outliers', list(self.alarm_conn.get_alarms(
+            name='name1'))[0].rule)
+
 
 class TestAlarmsRulePrometheus(TestAlarmsBase):
 
@@ -20,6 +20,9 @@ from unittest import mock
 
 from oslo_utils import timeutils
 
+from aodh import evaluator
+from aodh.evaluator import inventory
+from aodh import queue
 from aodh import storage
 from aodh.storage import models as alarm_models
 from aodh.tests import constants
@@ -176,6 +179,127 @@ class AlarmTest(AlarmTestBase):
         alarm_names = sorted([a.name for a in alarms])
         self.assertEqual(['orange-alert', 'red-alert'], alarm_names)
 
+    def test_count_alarms(self):
+        self.add_some_alarms()
+        self.assertEqual(3, self.alarm_conn.count_alarms())
+        self.assertEqual(2, self.alarm_conn.count_alarms(enabled=True))
+        self.assertEqual(0, self.alarm_conn.count_alarms(
+            type={'ne': ALARM_TYPE}))
+
+    def test_get_alarm_ids(self):
+        self.add_some_alarms()
+        self.assertEqual(['0r4ng3', 'r3d'],
+                         sorted(self.alarm_conn.get_alarm_ids(enabled=True)))
+
+    def test_get_alarms_for_evaluation(self):
+        self.add_some_alarms()
+        alarms = self.alarm_conn.get_alarms_for_evaluation(enabled=True)
+        self.assertEqual(['0r4ng3', 'r3d'],
+                         sorted(a.alarm_id for a in alarms))
+        full = {a.alarm_id: a for a in self.alarm_conn.get_alarms()}
+        for alarm in alarms:
+            self.assertIsInstance(alarm, alarm_models.AlarmEvaluationView)
+            for field in set(alarm.fields) - {'partition_bucket'}:
+                self.assertEqual(getattr(full[alarm.alarm_id], field),
+                                 getattr(alarm, field))
+            self.assertEqual(alarm_models.partition_bucket(alarm.alarm_id),
+                             alarm.partition_bucket)
+            self.assertFalse(hasattr(alarm, 'description'))
+
+    def test_get_alarms_for_evaluation_by_bucket(self):
+        self.add_some_alarms()
+        bucket = alarm_models.partition_bucket('r3d')
+        alarms = self.alarm_conn.get_alarms_for_evaluation(
+            partition_bucket={'in': [bucket]})
+        self.assertEqual(['r3d'], [a.alarm_id for a in alarms])
+        self.assertEqual([], self.alarm_conn.get_alarms_for_evaluation(
+            partition_bucket=None))
+
+    def test_get_changed_alarms(self):
+        self.add_some_alarms()
+        changed = self.alarm_conn.get_changed_alarms(
+            datetime.datetime(2015, 7, 2, 10, 20))
+        self.assertEqual(['0r4ng3', 'r3d'],
+                         sorted(a.alarm_id for a in changed))
+
+        yellow = list(self.alarm_conn.get_alarms(name='yellow-alert'))[0]
+        yellow.state = alarm_models.Alarm.ALARM_OK
+        yellow.state_timestamp = datetime.datetime(2015, 7, 2, 10, 30)
+        self.alarm_conn.update_alarm(yellow)
+        changed = self.alarm_conn.get_changed_alarms(
+            datetime.datetime(2015, 7, 2, 10, 30), enabled=False)
+        self.assertEqual(['y3ll0w'], [a.alarm_id for a in changed])
+
+    @mock.patch.object(queue, 'AlarmNotifier')
+    def test_evaluation_seen_by_other_inventory(self, notifier):
+        class EvaluatorSub(evaluator.Evaluator):
+            def evaluate(self, alarm):
+                pass
+
+        self.add_some_alarms()
+        mine = inventory.AlarmInventory(self.alarm_conn, 3600)
+        other = inventory.AlarmInventory(self.alarm_conn, 3600)
+        alarm = {a.alarm_id: a for a in mine.sync()}['r3d']
+        other.sync()
+
+        ev = EvaluatorSub(mock.MagicMock())
+        ev.storage_conn = self.alarm_conn
+        ev._record_change = mock.Mock()
+        self.mock_utcnow.return_value = datetime.datetime(2015, 7, 2, 10, 40)
+        ev._refresh(alarm, 'alarm', 'reason', {})
+
+        self.mock_utcnow.return_value = datetime.datetime(2015, 7, 2, 10, 41)
+        seen = {a.alarm_id: a for a in other.sync()}['r3d']
+        self.assertEqual('alarm', seen.state)
+        self.assertEqual(datetime.datetime(2015, 7, 2, 10, 40),
+                         seen.state_timestamp)
+
+    def test_claim_alarms(self):
+        self.add_some_alarms()
+        now = datetime.datetime(2015, 7, 2, 10, 41)
+        before = datetime.datetime(2015, 7, 2, 10, 40)
+
+        claimed = self.alarm_conn.claim_alarms('evaluator-1', now, before,
+                                               1, enabled=True)
+        self.assertEqual(1, len(claimed))
+        self.assertEqual(now, claimed[0].evaluate_timestamp)
+        claimed_id = claimed[0].alarm_id
+
+        claimed = self.alarm_conn.claim_alarms('evaluator-2', now, before,
+                                               10, enabled=True)
+        self.assertEqual(1, len(claimed))
+        self.assertNotEqual(claimed_id, claimed[0].alarm_id)
+
+        self.assertEqual([], self.alarm_conn.claim_alarms(
+            'evaluator-1', now, before, 10, enabled=True))
+
+    def test_claim_alarms_competing_owners(self):
+        self.add_some_alarms()
+        now = datetime.datetime(2015, 7, 2, 10, 41)
+        before = datetime.datetime(2015, 7, 2, 10, 40)
+        competing = []
+        raced = []
+        to_model = self.alarm_conn._row_to_evaluation_model
+
+        def claim_concurrently(row):
+            # NOTE: evaluator-2 claims the candidates of evaluator-1 between
+            # its select and its update.
+            if not raced:
+                raced.append(True)
+                competing.extend(self.alarm_conn.claim_alarms(
+                    'evaluator-2', now, before, 1, enabled=True))
+            return to_model(row)
+
+        with mock.patch.object(self.alarm_conn, '_row_to_evaluation_model',
+                               side_effect=claim_concurrently):
+            claimed = self.alarm_conn.claim_alarms('evaluator-1', now,
+                                                   before, 1, enabled=True)
+        self.assertEqual(1, len(competing))
+        # NOTE: the losing evaluator claims the next alarm instead of
+        # finding nothing to claim.
+        self.assertEqual(1, len(claimed))
+        self.assertNotEqual(competing[0].alarm_id, claimed[0].alarm_id)
+
     def test_add(self):
         self.add_some_alarms()
         alarms = list(self.alarm_conn.get_alarms())
@@ -530,6 +654,49 @@ class ComplexAlarmHistoryQueryTest(AlarmTestBase):
 
 
 class AlarmCounterTest(AlarmTestBase):
+    def test_record_evaluation_results(self):
+        self.add_some_alarms()
+        self.alarm_conn.increment_alarm_counter('r3d', 'and-da-boys', 'ok')
+        change = {
+            "event_id": "3d22800c-a3ca-4991-b34b-d97efb6047d9",
+            "alarm_id": "r3d",
+            "type": alarm_models.AlarmChange.STATE_TRANSITION,
+            "detail": "{}",
+            "user_id": "me",
+            "project_id": "and-da-boys",
+            "on_behalf_of": "and-da-boys",
+            "severity": "low",
+            "timestamp": datetime.datetime(2014, 4, 7, 7, 34)
+        }
+        deleted_change = dict(change, alarm_id='deleted',
+                              event_id='6e46a6ab-8a47-4b70-a5fa-ac1c5e8a7d0d')
+
+        now = datetime.datetime(2015, 7, 2, 10, 45)
+        existing = self.alarm_conn.record_evaluation_results(
+            [{'alarm_id': 'r3d', 'state': 'alarm', 'state_reason': 'why',
+              'state_timestamp': now},
+             {'alarm_id': 'deleted', 'state': 'alarm',
+              'state_reason': 'why', 'state_timestamp': now}],
+            [change, deleted_change],
+            [('r3d', 'and-da-boys', 'ok'), ('r3d', 'and-da-boys', 'ok'),
+             ('0r4ng3', 'and-da-boys', 'alarm'),
+             ('deleted', 'and-da-boys', 'ok')])
+
+        self.assertEqual({'r3d', '0r4ng3'}, existing)
+        alarm = list(self.alarm_conn.get_alarms(alarm_id='r3d'))[0]
+        self.assertEqual('alarm', alarm.state)
+        self.assertEqual('why', alarm.state_reason)
+        self.assertEqual(now, alarm.state_timestamp)
+        self.assertEqual('red-alert', alarm.name)
+        history = list(self.alarm_conn.query_alarm_history())
+        self.assertEqual([change['event_id']], [h.event_id for h in history])
+        self.assertEqual(3, self.alarm_conn.get_alarm_counters(
+            'r3d', 'and-da-boys', 'ok')[0].value)
+        self.assertEqual(1, self.alarm_conn.get_alarm_counters(
+            '0r4ng3', 'and-da-boys', 'alarm')[0].value)
+        self.assertEqual([], self.alarm_conn.get_alarm_counters(
+            'deleted', 'and-da-boys', 'ok'))
+
     def test_get_value_of_empty_counter(self):
         counter_name = "some_empty_unused_counter"
         self.assertEqual([], self.alarm_conn.get_alarm_counters(
@@ -12,7 +12,10 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import asyncio
 import datetime
+import threading
+import time
 from unittest import mock
 
 from oslo_utils import timeutils
@@ -20,6 +23,7 @@ from oslotest import base
 
 from aodh import evaluator
 from aodh import queue
+from aodh.storage import models
 
 
 class TestEvaluatorBaseClass(base.BaseTestCase):
@@ -49,6 +53,85 @@ class TestEvaluatorBaseClass(base.BaseTestCase):
         ev._record_change.assert_called_once_with(mock.ANY, mock.ANY)
         self.assertTrue(self.called)
 
+    @mock.patch.object(queue, 'AlarmNotifier')
+    def test_refresh_loads_evaluation_view(self, notifier):
+        class EvaluatorSub(evaluator.Evaluator):
+            def evaluate(self, alarm):
+                pass
+
+        ev = EvaluatorSub(mock.MagicMock())
+        ev.notifier = notifier
+        ev.storage_conn = mock.MagicMock()
+        ev._record_change = mock.MagicMock()
+        view = models.AlarmEvaluationView(
+            alarm_id='alarm_id1', type='threshold', enabled=True,
+            project_id='project', state='ok', rule={}, time_constraints=[],
+            repeat_actions=False, timestamp=None, state_timestamp=None)
+        full = mock.Mock(state='ok', state_reason='')
+        ev.storage_conn.get_alarms.return_value = [full]
+
+        ev._refresh(view, 'alarm', 'reason', {})
+        ev.storage_conn.get_alarms.assert_called_once_with(
+            alarm_id='alarm_id1')
+        ev.storage_conn.update_alarm.assert_called_once_with(full)
+        self.assertEqual('alarm', full.state)
+        self.assertEqual('reason', full.state_reason)
+        notifier.notify.assert_called_once_with(full, 'ok', 'reason', {})
+
+        ev.storage_conn.get_alarms.reset_mock()
+        ev._refresh(view, 'alarm', 'reason', {})
+        ev.storage_conn.get_alarms.assert_not_called()
+
+    @mock.patch.object(queue, 'AlarmNotifier')
+    def test_refresh_deleted_evaluation_view(self, notifier):
+        class EvaluatorSub(evaluator.Evaluator):
+            def evaluate(self, alarm):
+                pass
+
+        ev = EvaluatorSub(mock.MagicMock())
+        ev.notifier = notifier
+        ev.storage_conn = mock.MagicMock()
+        ev.storage_conn.get_alarms.return_value = []
+        view = models.AlarmEvaluationView(
+            alarm_id='alarm_id1', type='threshold', enabled=True,
+            project_id='project', state='ok', rule={}, time_constraints=[],
+            repeat_actions=False, timestamp=None, state_timestamp=None)
+
+        ev._refresh(view, 'alarm', 'reason', {})
+        ev.storage_conn.update_alarm.assert_not_called()
+        notifier.notify.assert_not_called()
+
+    @mock.patch.object(queue, 'AlarmNotifier')
+    def test_refresh_update_failure(self, notifier):
+        class EvaluatorSub(evaluator.Evaluator):
+            def evaluate(self, alarm):
+                pass
+
+        ev = EvaluatorSub(mock.MagicMock())
+        ev.notifier = notifier
+        ev.storage_conn = mock.MagicMock()
+        ev.storage_conn.get_alarms.return_value = [
+            mock.Mock(state='ok', state_reason='')]
+        ev.storage_conn.update_alarm.side_effect = Exception('boom')
+        ev._record_change = mock.MagicMock()
+        view = models.AlarmEvaluationView(
+            alarm_id='alarm_id1', type='threshold', enabled=True,
+            project_id='project', state='ok', rule={}, time_constraints=[],
+            repeat_actions=False, timestamp=None, state_timestamp=None)
+        view.state_reason = 'previous reason'
+
+        ev._refresh(view, 'alarm', 'reason', {})
+        notifier.notify.assert_not_called()
+        # NOTE: the alarm kept in the inventory transitions again at the
+        # next evaluation.
+        self.assertEqual('ok', view.state)
+        self.assertEqual('previous reason', view.state_reason)
+
+        ev.storage_conn.update_alarm.side_effect = None
+        ev._refresh(view, 'alarm', 'reason', {})
+        self.assertEqual(2, ev.storage_conn.update_alarm.call_count)
+        notifier.notify.assert_called_once_with(mock.ANY, 'ok', 'reason', {})
+
     @mock.patch.object(timeutils, 'utcnow')
     def test_base_time_constraints(self, mock_utcnow):
         alarm = mock.MagicMock()
@@ -157,3 +240,142 @@ class TestEvaluatorBaseClass(base.BaseTestCase):
              'timezone': 'US/Eastern'}
         ]
         self.assertFalse(cls.within_time_constraint(alarm))
+
+
+class TestBackendLimits(base.BaseTestCase):
+    def test_concurrency(self):
+        limits = evaluator.BackendLimits(2, 0)
+        lock = threading.Lock()
+        running = {'gnocchi': 0, 'prometheus': 0}
+        peak = {'gnocchi': 0, 'prometheus': 0}
+
+        def request(backend):
+            with lock:
+                running[backend] += 1
+                peak[backend] = max(peak[backend], running[backend])
+            time.sleep(0.05)
+            with lock:
+                running[backend] -= 1
+            return backend
+
+        async def evaluate():
+            return await asyncio.gather(*[
+                limits.call(backend, request, backend)
+                for backend in ['gnocchi', 'prometheus'] * 5])
+
+        results = asyncio.run(evaluate())
+        self.assertEqual(['gnocchi', 'prometheus'] * 5, results)
+        self.assertEqual({'gnocchi': 2, 'prometheus': 2}, peak)
+
+    def test_timeout(self):
+        limits = evaluator.BackendLimits(1, 0.01)
+        self.addCleanup(limits.shutdown)
+        self.assertRaises(TimeoutError, asyncio.run,
+                          limits.call('gnocchi', time.sleep, 0.5))
+
+    def test_timeout_keeps_slot(self):
+        limits = evaluator.BackendLimits(1, 0.05)
+        self.addCleanup(limits.shutdown)
+        slow_done = threading.Event()
+        started = []
+
+        def slow():
+            time.sleep(0.2)
+            slow_done.set()
+
+        def request():
+            started.append(slow_done.is_set())
+            return 'ok'
+
+        async def evaluate():
+            with self.assertRaises(TimeoutError):
+                await limits.call('gnocchi', slow)
+            # NOTE: the abandoned request still runs, the next one waits
+            # for its thread, while the other backends do not.
+            self.assertEqual('ok', await limits.call('prometheus', request))
+            with self.assertRaises(TimeoutError):
+                await limits.call('gnocchi', request)
+            limits.timeout = None
+            return await limits.call('gnocchi', request)
+
+        self.assertEqual('ok', asyncio.run(evaluate()))
+        self.assertEqual([False, True], started)
+
+
+class TestCircuitBreaker(base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch('time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = evaluator.CircuitBreaker('gnocchi', 0.5, 4, 1.0, 30)
+
+    def _fail(self):
+        self.assertRaises(ValueError, self.breaker.call, lambda e: True,
+                          mock.Mock(side_effect=ValueError('Boom!')))
+
+    def _succeed(self, duration=0):
+        def request():
+            self.now += duration
+            return 'ok'
+        return self.breaker.call(lambda e: True, request)
+
+    def test_open_on_failure_ratio(self):
+        self._fail()
+        self._succeed()
+        self._fail()
+        self.assertEqual('closed', self.breaker.state)
+        self._succeed()
+        self.assertEqual('open', self.breaker.state)
+        request = mock.Mock()
+        self.assertRaises(evaluator.BackendUnavailable, self.breaker.call,
+                          lambda e: True, request)
+        request.assert_not_called()
+
+    def test_not_a_failure(self):
+        for _ in range(4):
+            self.assertRaises(
+                ValueError, self.breaker.call, lambda e: False,
+                mock.Mock(side_effect=ValueError('Not found')))
+        self.assertEqual('closed', self.breaker.state)
+
+    def test_slow_calls(self):
+        self._succeed(duration=2)
+        self._succeed(duration=2)
+        self._succeed()
+        self.assertEqual('closed', self.breaker.state)
+        self.assertEqual('ok', self._succeed(duration=2))
+        self.assertEqual('open', self.breaker.state)
+
+    def test_half_open(self):
+        for _ in range(4):
+            self._fail()
+        self.assertEqual('open', self.breaker.state)
+
+        self.now += 30
+        self._fail()
+        self.assertEqual('open', self.breaker.state)
+        self.assertRaises(evaluator.BackendUnavailable, self._succeed)
+
+        self.now += 30
+        probe_started = []
+
+        def probe():
+            probe_started.append(self.breaker.state)
+            # NOTE: the other requests fail fast while probing.
+            self.assertRaises(evaluator.BackendUnavailable, self._succeed)
+            return 'ok'
+
+        self.assertEqual('ok', self.breaker.call(lambda e: True, probe))
+        self.assertEqual(['half-open'], probe_started)
+        self.assertEqual('closed', self.breaker.state)
+        self._fail()
+        self.assertEqual('closed', self.breaker.state)
+
+    def test_breakers_per_backend(self):
+        breakers = evaluator.CircuitBreakers(0.5, 4, 0, 30)
+        self.assertIs(breakers.get('gnocchi'), breakers.get('gnocchi'))
+        self.assertIsNot(breakers.get('gnocchi'),
+                         breakers.get('prometheus'))
+        self.assertEqual('prometheus', breakers.get('prometheus').backend)
@@ -0,0 +1,150 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/batch.py
+"""
+import datetime
+from unittest import mock
+
+from oslo_utils import timeutils
+from oslotest import base
+
+from aodh import evaluator
+from aodh.evaluator import batch
+from aodh import queue
+from aodh.storage import models
+
+
+class EvaluatorSub(evaluator.Evaluator):
+    def evaluate(self, alarm):
+        pass
+
+
+class TestWriteBehindBuffer(base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(queue, 'AlarmNotifier')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage_conn = mock.MagicMock()
+        self.buffer = batch.WriteBehindBuffer(self.storage_conn, 100, 60)
+        conf = mock.MagicMock()
+        conf.record_history = True
+        conf.enable_evaluation_results_metrics = True
+        self.evaluator = EvaluatorSub(conf)
+        self.evaluator.storage_conn = self.storage_conn
+        self.evaluator.write_buffer = self.buffer
+        self.evaluator._ks_client = mock.Mock(user_id='user',
+                                              project_id='project')
+        self.evaluator._alarm_change_notifier = mock.Mock()
+
+    @staticmethod
+    def _view(alarm_id, state='ok'):
+        return models.AlarmEvaluationView(
+            alarm_id=alarm_id, type='threshold', enabled=True,
+            project_id='project', state=state, rule={}, time_constraints=[],
+            repeat_actions=False, timestamp=None, state_timestamp=None)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_flush(self, utcnow):
+        now = datetime.datetime(2015, 7, 26, 3, 33, 21)
+        utcnow.return_value = now
+        views = [self._view('a1'), self._view('a2')]
+        full = [mock.Mock(alarm_id='a1', project_id='project',
+                          severity='low'),
+                mock.Mock(alarm_id='a2', project_id='project',
+                          severity='low')]
+        self.storage_conn.get_alarms.return_value = full
+        self.storage_conn.record_evaluation_results.return_value = {'a1',
+                                                                    'a2'}
+
+        for view in views:
+            self.evaluator._refresh(view, 'alarm', 'reason', {})
+            self.evaluator._increment_evaluation_result(
+                view.alarm_id, view.project_id, 'alarm')
+        self.assertEqual(4, len(self.buffer))
+        self.storage_conn.update_alarm.assert_not_called()
+        self.storage_conn.increment_alarm_counter.assert_not_called()
+        self.evaluator.notifier.notify.assert_not_called()
+
+        self.buffer.flush()
+        self.assertEqual(0, len(self.buffer))
+        self.storage_conn.get_alarms.assert_called_once_with(
+            alarm_id={'in': ['a1', 'a2']})
+        states, changes, counters = (
+            self.storage_conn.record_evaluation_results.call_args[0])
+        self.assertEqual([{'alarm_id': 'a1', 'state': 'alarm',
+                           'state_reason': 'reason', 'state_timestamp': now},
+                          {'alarm_id': 'a2', 'state': 'alarm',
+                           'state_reason': 'reason', 'state_timestamp': now}],
+                         states)
+        self.assertEqual(['a1', 'a2'], [c['alarm_id'] for c in changes])
+        self.assertEqual([('a1', 'project', 'alarm'),
+                          ('a2', 'project', 'alarm')], counters)
+        self.assertEqual(
+            [mock.call(full[0], 'ok', 'reason', {}),
+             mock.call(full[1], 'ok', 'reason', {})],
+            self.evaluator.notifier.notify.call_args_list)
+        self.assertEqual(
+            2, self.evaluator.alarm_change_notifier.info.call_count)
+
+        self.storage_conn.record_evaluation_results.reset_mock()
+        self.buffer.flush()
+        self.storage_conn.record_evaluation_results.assert_not_called()
+
+    def test_flush_failure(self):
+        view = self._view('a1')
+        then = datetime.datetime(2015, 7, 26, 3, 0, 0)
+        view.state_reason = 'previous reason'
+        view.state_timestamp = then
+        self.storage_conn.get_alarms.return_value = [
+            mock.Mock(alarm_id='a1')]
+        self.storage_conn.record_evaluation_results.side_effect = Exception(
+            'Boom!')
+
+        self.evaluator._refresh(view, 'alarm', 'reason', {})
+        self.assertEqual('alarm', view.state)
+        self.assertEqual('reason', view.state_reason)
+        self.assertNotEqual(then, view.state_timestamp)
+        self.buffer.flush()
+        self.assertEqual('ok', view.state)
+        self.assertEqual('previous reason', view.state_reason)
+        self.assertEqual(then, view.state_timestamp)
+        self.evaluator.notifier.notify.assert_not_called()
+        self.evaluator.alarm_change_notifier.info.assert_not_called()
+        self.assertEqual(0, len(self.buffer))
+
+    def test_deleted_alarms(self):
+        self.storage_conn.get_alarms.return_value = []
+        self.storage_conn.record_evaluation_results.return_value = set()
+
+        self.evaluator._refresh(self._view('a1'), 'alarm', 'reason', {})
+        self.buffer.flush()
+        self.storage_conn.record_evaluation_results.assert_called_once_with(
+            [], [], [])
+        self.evaluator.notifier.notify.assert_not_called()
+
+    def test_flush_when_full(self):
+        self.buffer.max_size = 2
+        self.storage_conn.record_evaluation_results.return_value = {'a1'}
+        self.evaluator._increment_evaluation_result('a1', 'project', 'ok')
+        self.storage_conn.record_evaluation_results.assert_not_called()
+        self.evaluator._increment_evaluation_result('a1', 'project', 'ok')
+        self.storage_conn.record_evaluation_results.assert_called_once_with(
+            [], [], [('a1', 'project', 'ok'), ('a1', 'project', 'ok')])
+        self.assertEqual(0, len(self.buffer))
+
+    def test_flush_when_late(self):
+        self.buffer.max_delay = 0
+        self.evaluator._increment_evaluation_result('a1', 'project', 'ok')
+        self.storage_conn.record_evaluation_results.assert_called_once_with(
+            [], [], [('a1', 'project', 'ok')])
@@ -0,0 +1,32 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/comparison.py
+"""
+from oslotest import base
+
+from aodh.evaluator import comparison
+
+
+class TestComparison(base.BaseTestCase):
+
+    def test_compare_window(self):
+        self.assertEqual(('alarm', None, 3), comparison.compare_window(
+            [81.0, 82.0, 83.0], 'gt', 80.0))
+        self.assertEqual(('ok', None, 0), comparison.compare_window(
+            [79.0, 80.0, 78.0], 'gt', 80.0))
+        self.assertEqual((None, 'alarm', 2), comparison.compare_window(
+            [79.0, 81.0, 83.0], 'gt', 80.0))
+        self.assertEqual((None, 'ok', 1), comparison.compare_window(
+            [79.0, 80.0, 78.0], 'ge', 80.0))
+        self.assertEqual((None, 'alarm', 1), comparison.compare_window(
+            [81.0, 80.0], 'ne', 81.0))
@@ -21,6 +21,7 @@ from oslo_utils import uuidutils
 
 from aodh import evaluator
 from aodh.evaluator import composite
+from aodh.evaluator import memo
 from aodh.storage import models
 from aodh.tests import constants
 from aodh.tests.unit.evaluator import base
@@ -505,6 +506,14 @@ class OtherCompositeTest(BaseCompositeEvaluate):
                          ),
         ]
 
+    def test_evaluation_period(self):
+        rule = {"or": [self.sub_rule1,
+                       {"and": [self.sub_rule2,
+                                dict(self.sub_rule2, granularity=30)]}]}
+        self.assertEqual(30, self.evaluator.evaluation_period(rule))
+        rule = {"or": [self.sub_rule1, {"type": "unknown"}]}
+        self.assertIsNone(self.evaluator.evaluation_period(rule))
+
     def test_simple_ok(self):
         self._set_all_alarms('alarm')
 
@@ -535,3 +544,14 @@ class OtherCompositeTest(BaseCompositeEvaluate):
                                             ((1, self.sub_rule1),
                                              (2, self.sub_rule2))))]
         self.assertEqual(expected, self.notifier.notify.call_args_list)
+
+    def test_query_memo(self):
+        self.evaluator.query_memo = memo.QueryMemo()
+        self.alarms[0].rule = {"and": [self.sub_rule1, {
+            "or": [self.sub_rule2, dict(self.sub_rule1, threshold=1.0)]}]}
+        self.client.metric.get_measures.return_value = []
+        self._evaluate_all_alarms()
+        self.assertEqual(
+            ['alarm-resource-1', 'alarm-resource-2'],
+            [c[1]['resource_id']
+             for c in self.client.metric.get_measures.call_args_list])
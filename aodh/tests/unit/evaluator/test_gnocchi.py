@@ -13,10 +13,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import asyncio
 import copy
 import datetime
 import fixtures
 import json
+import time
 from unittest import mock
 import zoneinfo
 
@@ -24,9 +26,12 @@ from gnocchiclient import exceptions
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
+from aodh import evaluator
 from aodh.evaluator import gnocchi
+from aodh.evaluator import memo
 from aodh import messaging
 from aodh.storage import models
+from aodh.tests import base as tests_base
 from aodh.tests import constants
 from aodh.tests.unit.evaluator import base
 
@@ -190,6 +195,10 @@ class TestGnocchiResourceThresholdEvaluate(TestGnocchiEvaluatorBase):
             exceptions.ClientException(501, "error2"), means]
         self._test_retry_transient()
 
+    def test_evaluation_period(self):
+        self.assertEqual(60, self.evaluator.evaluation_period(
+            self.alarms[0].rule))
+
     def test_simple_insufficient(self):
         self.client.metric.get_measures.return_value = []
         self._test_simple_insufficient()
@@ -218,6 +227,27 @@ class TestGnocchiResourceThresholdEvaluate(TestGnocchiEvaluatorBase):
         expected = mock.call(self.alarms[0], 'ok', reason, reason_data)
         self.assertEqual(expected, self.notifier.notify.call_args)
 
+    def test_simple_alarm_trip_async(self):
+        self._set_all_alarms('ok')
+        avgs = self._get_stats(60, [self.alarms[0].rule['threshold'] + v
+                                    for v in range(1, 6)])
+        self.client.metric.get_measures.side_effect = [avgs]
+        self.evaluator.backend_limits = evaluator.BackendLimits(1, 10)
+        asyncio.run(self.evaluator.evaluate_async(self.alarms[0]))
+        self._assert_all_alarms('alarm')
+        self.assertEqual(1, self.notifier.notify.call_count)
+
+    def test_backend_timeout_async(self):
+        self._set_all_alarms('ok')
+        self.client.metric.get_measures.side_effect = (
+            lambda **kwargs: time.sleep(0.5))
+        self.evaluator.backend_limits = evaluator.BackendLimits(1, 0.01)
+        asyncio.run(self.evaluator.evaluate_async(self.alarms[0]))
+        self._assert_all_alarms('insufficient data')
+        self.assertEqual(
+            'alarm statistics retrieval from gnocchi timed out',
+            self.notifier.notify.call_args[0][2])
+
     def test_simple_alarm_clear(self):
         self._set_all_alarms('alarm')
         avgs = self._get_stats(60, [self.alarms[0].rule['threshold'] - v
@@ -437,9 +467,406 @@ class TestGnocchiResourceThresholdEvaluate(TestGnocchiEvaluatorBase):
         for alarm in original_alarms:
             alarm.state = 'alarm'
             alarm.state_reason = mock.ANY
+            alarm.state_timestamp = utcnow.return_value
         primitive_original_alarms = [a.as_dict() for a in original_alarms]
         self.assertEqual(primitive_original_alarms, primitive_alarms)
 
+    def _batched_alarms(self, resource_ids):
+        alarms = []
+        for resource_id in resource_ids:
+            alarm = copy.deepcopy(self.alarms[0])
+            alarm.alarm_id = uuidutils.generate_uuid()
+            alarm.rule['resource_id'] = resource_id
+            alarm.state = 'ok'
+            alarms.append(alarm)
+        return alarms
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_batched_measures(self, utcnow):
+        utcnow.return_value = datetime.datetime(2015, 1, 26, 12, 57, 0, 0)
+        self.conf.set_override('gnocchi_batch_size', 2, 'evaluator')
+        self.alarms = self._batched_alarms(['r1', 'r2', 'r3', 'r4'])
+        avgs = self._get_stats(60, [self.alarms[0].rule['threshold'] + v
+                                    for v in range(1, 6)])
+        self.client.aggregates.fetch.side_effect = [
+            {'measures': {'r1': {'cpu_util': {'mean': avgs}},
+                          'r2': {'cpu_util': {'mean': avgs}}}},
+            {'measures': {'r3': {'cpu_util': {'mean': avgs}}}},
+        ]
+        self.client.metric.get_measures.side_effect = [avgs]
+
+        self.evaluator.prefetch(self.alarms)
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+
+        self.assertEqual(
+            [mock.call(operations=['metric', 'cpu_util', 'mean'],
+                       granularity=60,
+                       search={'in': {'id': ['r1', 'r2']}},
+                       resource_type='instance',
+                       start='2015-01-26T12:51:00',
+                       stop='2015-01-26T12:57:00'),
+             mock.call(operations=['metric', 'cpu_util', 'mean'],
+                       granularity=60,
+                       search={'in': {'id': ['r3', 'r4']}},
+                       resource_type='instance',
+                       start='2015-01-26T12:51:00',
+                       stop='2015-01-26T12:57:00')],
+            self.client.aggregates.fetch.call_args_list)
+        # NOTE: the resource missing from the batch is retrieved alone.
+        self.client.metric.get_measures.assert_called_once_with(
+            aggregation='mean', metric='cpu_util', granularity=60,
+            resource_id='r4', start='2015-01-26T12:51:00',
+            stop='2015-01-26T12:57:00')
+
+    def test_batched_measures_failure(self):
+        self.conf.set_override('gnocchi_batch_size', 10, 'evaluator')
+        self.alarms = self._batched_alarms(['r1', 'r2'])
+        avgs = self._get_stats(60, [self.alarms[0].rule['threshold'] + v
+                                    for v in range(1, 6)])
+        self.client.aggregates.fetch.side_effect = (
+            exceptions.ClientException(500, "error"))
+        self.client.metric.get_measures.return_value = avgs
+
+        self.evaluator.prefetch(self.alarms)
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+        self.assertEqual(2, self.client.metric.get_measures.call_count)
+
+    def test_batched_measures_disabled(self):
+        self.alarms = self._batched_alarms(['r1', 'r2'])
+        self.evaluator.prefetch(self.alarms)
+        self.client.aggregates.fetch.assert_not_called()
+
+    def test_batched_measures_not_shared(self):
+        self.conf.set_override('gnocchi_batch_size', 10, 'evaluator')
+        self.alarms = self._batched_alarms(['r1', 'r2'])
+        self.alarms[1].rule['granularity'] = 300
+        self.evaluator.prefetch(self.alarms)
+        self.client.aggregates.fetch.assert_not_called()
+
+    def test_query_memo(self):
+        self.evaluator.query_memo = memo.QueryMemo()
+        self.alarms = self._batched_alarms(['r1', 'r1', 'r2'])
+        avgs = self._get_stats(60, [self.alarms[0].rule['threshold'] + v
+                                    for v in range(1, 6)])
+        self.client.metric.get_measures.return_value = avgs
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+        self.assertEqual(
+            ['r1', 'r2'],
+            [c[1]['resource_id']
+             for c in self.client.metric.get_measures.call_args_list])
+
+        # NOTE: the queries are run again at the next cycle.
+        self.evaluator.query_memo.reset()
+        self._evaluate_all_alarms()
+        self.assertEqual(4, self.client.metric.get_measures.call_count)
+
+    def test_query_memo_different_window(self):
+        self.evaluator.query_memo = memo.QueryMemo()
+        self.alarms = self._batched_alarms(['r1', 'r1'])
+        self.alarms[1].rule['evaluation_periods'] = 3
+        self.client.metric.get_measures.return_value = []
+        self._evaluate_all_alarms()
+        self.assertEqual(2, self.client.metric.get_measures.call_count)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_window_cache(self, utcnow):
+        self.conf.set_override('measure_cache_size', 10, 'evaluator')
+        self.evaluator = self.EVALUATOR(self.conf)
+        self.evaluator.notifier = self.notifier
+        self.evaluator.storage_conn = self.storage_conn
+        self._set_all_alarms('ok')
+        utcnow.return_value = datetime.datetime(2015, 1, 26, 12, 57, 0, 0)
+        threshold = self.alarms[0].rule['threshold']
+        points = [['2015-01-26T12:%02d:00+00:00' % minute, 60.0,
+                   threshold + 1] for minute in range(51, 57)]
+        self.client.metric.get_measures.side_effect = [
+            points,
+            [['2015-01-26T12:56:00+00:00', 60.0, threshold + 2],
+             ['2015-01-26T12:57:00+00:00', 60.0, threshold + 3]]]
+
+        self.evaluator.evaluate(self.alarms[0])
+        self._assert_all_alarms('alarm')
+        self.alarms[0].repeat_actions = True
+        utcnow.return_value = datetime.datetime(2015, 1, 26, 12, 58, 0, 0)
+        self.evaluator.evaluate(self.alarms[0])
+        # NOTE: the alarm is evaluated with the cached datapoints of 12:53
+        # to 12:55 and the refreshed datapoints of 12:56 and 12:57.
+        self.assertEqual(
+            mock.call(self.alarms[0], 'alarm',
+                      'Remaining as alarm due to 5 samples outside '
+                      'threshold, most recent: %s' % (threshold + 3),
+                      self._reason_data('outside', 5, threshold + 3)),
+            self.notifier.notify.call_args)
+
+        self.assertEqual(
+            [mock.call(aggregation='mean', metric='cpu_util',
+                       granularity=60, resource_id='my_instance',
+                       start='2015-01-26T12:51:00',
+                       stop='2015-01-26T12:57:00'),
+             mock.call(aggregation='mean', metric='cpu_util',
+                       granularity=60, resource_id='my_instance',
+                       start='2015-01-26T12:55:00',
+                       stop='2015-01-26T12:58:00')],
+            self.client.metric.get_measures.call_args_list)
+
+    def test_circuit_breaker(self):
+        self.evaluator.circuit_breakers = evaluator.CircuitBreakers(
+            1.0, 2, 0, 30)
+        self._set_all_alarms('ok')
+        self.client.metric.get_measures.side_effect = (
+            exceptions.MetricNotFound(404))
+        self._evaluate_all_alarms()
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+
+        # NOTE: a missing metric does not open the breaker, server errors
+        # do.
+        self._set_all_alarms('ok')
+        self.client.metric.get_measures.side_effect = (
+            exceptions.ClientException(503, "unavailable"))
+        self._evaluate_all_alarms()
+        self._evaluate_all_alarms()
+        self.assertEqual(4, self.client.metric.get_measures.call_count)
+        self._set_all_alarms('ok')
+        self.notifier.notify.reset_mock()
+        self.assertRaises(evaluator.BackendUnavailable,
+                          self.evaluator.evaluate, self.alarms[0])
+        self.assertEqual(4, self.client.metric.get_measures.call_count)
+        self._assert_all_alarms('ok')
+        self.notifier.notify.assert_not_called()
+
+    def _metric_cache_evaluator(self):
+        self.conf.set_override('gnocchi_metric_cache_ttl', 600, 'evaluator')
+        self.evaluator = self.EVALUATOR(self.conf)
+        self.evaluator.notifier = self.notifier
+        self.evaluator.storage_conn = self.storage_conn
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_metric_id_cache(self, utcnow):
+        utcnow.return_value = datetime.datetime(2015, 1, 26, 12, 57, 0, 0)
+        self._metric_cache_evaluator()
+        self._set_all_alarms('ok')
+        self.client.resource.get.return_value = {
+            'id': 'my_instance', 'metrics': {'cpu_util': 'metric-id'}}
+        avgs = self._get_stats(60, [self.alarms[0].rule['threshold'] + v
+                                    for v in range(1, 6)])
+        self.client.metric.get_measures.return_value = avgs
+        self._evaluate_all_alarms()
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+
+        self.client.resource.get.assert_called_once_with(
+            'instance', 'my_instance')
+        self.assertEqual(
+            [mock.call(aggregation='mean', metric='metric-id',
+                       granularity=60, start='2015-01-26T12:51:00',
+                       stop='2015-01-26T12:57:00')] * 2,
+            self.client.metric.get_measures.call_args_list)
+
+        # NOTE: a deleted metric is resolved again.
+        self.client.metric.get_measures.side_effect = (
+            exceptions.MetricNotFound(404))
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self._evaluate_all_alarms()
+        self.assertEqual(2, self.client.resource.get.call_count)
+
+    def test_metric_id_cache_missing_resource(self):
+        self._metric_cache_evaluator()
+        self._set_all_alarms('ok')
+        self.client.resource.get.side_effect = (
+            exceptions.ResourceNotFound(404))
+        self._evaluate_all_alarms()
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self.assertEqual('resource my_instance does not exists',
+                         self.alarms[0].state_reason)
+        self.client.resource.get.assert_called_once_with(
+            'instance', 'my_instance')
+        self.client.metric.get_measures.assert_not_called()
+
+    def test_metric_id_cache_missing_metric(self):
+        self._metric_cache_evaluator()
+        self._set_all_alarms('ok')
+        self.client.resource.get.return_value = {'id': 'my_instance',
+                                                 'metrics': {}}
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self.assertEqual(
+            'metric cpu_util for resource my_instance does not exists',
+            self.alarms[0].state_reason)
+        self.client.metric.get_measures.assert_not_called()
+
+    def test_metric_id_cache_resolution_failure(self):
+        self._metric_cache_evaluator()
+        self.client.resource.get.side_effect = (
+            exceptions.ClientException(500, 'error'))
+        self.client.metric.get_measures.return_value = []
+        self._evaluate_all_alarms()
+        self.client.metric.get_measures.assert_called_once_with(
+            aggregation='mean', metric='cpu_util', granularity=60,
+            resource_id='my_instance', start=mock.ANY, stop=mock.ANY)
+
+    @staticmethod
+    def _fine_stats(threshold):
+        # NOTE: the means of the periods of 5 minutes are threshold + 3.
+        return [['2015-01-26T12:%02d:00+00:00' % minute, 60.0,
+                 threshold + minute % 5 + 1] for minute in range(35, 60)]
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_downsampling(self, utcnow):
+        utcnow.return_value = datetime.datetime(2015, 1, 26, 13, 0, 0, 0)
+        self.conf.set_override('gnocchi_downsampling', True, 'evaluator')
+        self._set_all_alarms('ok')
+        self._set_all_rules('granularity', 300)
+        threshold = self.alarms[0].rule['threshold']
+        fine = self._fine_stats(threshold)
+        self.client.metric.get_measures.side_effect = [
+            exceptions.NotFound(404),
+            fine + [['2015-01-26T12:00:00+00:00', 3600.0, 0.0]],
+            fine]
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+        self.assertEqual(
+            mock.call(self.alarms[0], 'ok',
+                      'Transition to alarm due to 5 samples outside '
+                      'threshold, most recent: %s' % (threshold + 3),
+                      self._reason_data('outside', 5, threshold + 3)),
+            self.notifier.notify.call_args)
+
+        # NOTE: only the datapoints of the finer granularity are retrieved
+        # next.
+        self._evaluate_all_alarms()
+        self.assertEqual(
+            [300, None, 60.0],
+            [c.kwargs['granularity']
+             for c in self.client.metric.get_measures.call_args_list])
+
+    def test_downsampling_disabled(self):
+        self._set_all_alarms('ok')
+        self._set_all_rules('granularity', 300)
+        self.client.metric.get_measures.side_effect = (
+            exceptions.NotFound(404))
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self.assertEqual(1, self.client.metric.get_measures.call_count)
+
+    def test_downsampling_incompatible_method(self):
+        self.conf.set_override('gnocchi_downsampling', True, 'evaluator')
+        self._set_all_alarms('ok')
+        self._set_all_rules('granularity', 300)
+        self._set_all_rules('aggregation_method', 'std')
+        self.client.metric.get_measures.side_effect = (
+            exceptions.NotFound(404))
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self.assertEqual(1, self.client.metric.get_measures.call_count)
+
+    def test_downsampling_no_finer_granularity(self):
+        self.conf.set_override('gnocchi_downsampling', True, 'evaluator')
+        self._set_all_alarms('ok')
+        self._set_all_rules('granularity', 300)
+        self.client.metric.get_measures.side_effect = [
+            exceptions.NotFound(404),
+            [['2015-01-26T12:00:00+00:00', 3600.0, 0.0]]]
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self.assertEqual(
+            'aggregation mean does not exist for metric cpu_util of '
+            'resource my_instance', self.alarms[0].state_reason)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_exclude_outliers(self, utcnow):
+        utcnow.return_value = datetime.datetime(2015, 1, 26, 12, 57, 0, 0)
+        self._set_all_alarms('alarm')
+        self._set_all_rules('exclude_outliers', True)
+        # NOTE: the spike is further than 2 standard deviations from the
+        # mean of the window, twice as long as the evaluation periods.
+        self.client.metric.get_measures.return_value = self._get_stats(
+            60, [50.0] * 9 + [95.0])
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('ok')
+        self.assertEqual(
+            'Transition to ok due to 5 samples inside threshold, most '
+            'recent: 50.0', self.alarms[0].state_reason)
+        self.client.metric.get_measures.assert_called_once_with(
+            aggregation='mean', metric='cpu_util', granularity=60,
+            resource_id='my_instance', start='2015-01-26T12:47:00',
+            stop='2015-01-26T12:57:00')
+
+    def test_exclude_outliers_disabled(self):
+        self._set_all_alarms('alarm')
+        self.client.metric.get_measures.return_value = self._get_stats(
+            60, [50.0] * 9 + [95.0])
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+
+    def test_sanitize_downsampling(self):
+        self.conf.set_override('gnocchi_downsampling', True, 'evaluator')
+        rule = dict(self.alarms[0].rule, granularity=300,
+                    evaluation_periods=2)
+        fine = self._fine_stats(0.0)
+        for method, expected in (('mean', [3.0, 3.0]), ('max', [5.0, 5.0]),
+                                 ('sum', [15.0, 15.0]),
+                                 ('last', [5.0, 5.0])):
+            rule['aggregation_method'] = method
+            self.assertEqual(expected, self.evaluator._sanitize(rule, fine))
+        # NOTE: the datapoints of the alarm granularity are preferred.
+        self.assertEqual([42.0], self.evaluator._sanitize(
+            rule, fine + [['2015-01-26T12:55:00+00:00', 300.0, 42.0]]))
+
+
+class TestMetricIdCache(tests_base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch('time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = gnocchi.MetricIdCache(600, 60)
+
+    def test_ttl(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.put('key', 'metric-id')
+        self.now += 599
+        self.assertEqual(('metric-id', None), self.cache.get('key'))
+        self.now += 1
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_negative_backoff(self):
+        ttls = []
+        for _ in range(8):
+            self.cache.put_missing('key', 'missing')
+            start = self.now
+            while self.cache.get('key') is not None:
+                self.assertEqual((None, 'missing'), self.cache.get('key'))
+                self.now += 60
+            ttls.append(self.now - start)
+        self.assertEqual([60, 120, 240, 480, 960, 1920, 1920, 1920], ttls)
+
+        self.cache.put('key', 'metric-id')
+        self.cache.put_missing('key', 'missing')
+        self.now += 60
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_invalidate(self):
+        self.cache.put('key', 'metric-id')
+        self.cache.invalidate('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_prune(self):
+        for i in range(4):
+            self.cache.put_missing(i, 'missing')
+        self.now += 60 * 2 ** 7
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, 'metric-id')
+        # NOTE: the cache is pruned when its size doubled since the last
+        # pruning.
+        self.assertEqual(3, len(self.cache))
+
 
 class TestGnocchiAggregationMetricsThresholdEvaluate(TestGnocchiEvaluatorBase):
     EVALUATOR = gnocchi.GnocchiAggregationMetricsThresholdEvaluator
@@ -669,3 +1096,111 @@ class TestGnocchiAggregationResourcesThresholdEvaluate(
             [],
             self.storage_conn.update_alarm.call_args_list)
         self.assertEqual([], self.notifier.notify.call_args_list)
+
+    def test_query_memo_canonical_search(self):
+        self.evaluator.query_memo = memo.QueryMemo()
+        alarm = copy.deepcopy(self.alarms[0])
+        alarm.alarm_id = uuidutils.generate_uuid()
+        alarm.rule['query'] = ('{"=":{"server_group":'
+                               '"my_autoscaling_group"}}')
+        self.alarms.append(alarm)
+        self.client.aggregates.fetch.return_value = self._get_stats(
+            50, [self.alarms[0].rule['threshold'] + v for v in range(1, 7)],
+            aggregated=True)
+        self._set_all_alarms('ok')
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+        self.client.aggregates.fetch.assert_called_once()
+
+    def test_window_cache_not_used(self):
+        self.conf.set_override('measure_cache_size', 10, 'evaluator')
+        self.assertIsNone(self.EVALUATOR(self.conf)._window_cache)
+
+    def _search_evaluator(self):
+        self.conf.set_override('gnocchi_search_refresh_interval', 300,
+                               'evaluator')
+        self.evaluator = self.EVALUATOR(self.conf)
+        self.evaluator.notifier = self.notifier
+        self.evaluator.storage_conn = self.storage_conn
+
+    @staticmethod
+    def _by_metrics_call(metric_ids):
+        return mock.call(
+            operations=['aggregate', 'rate:mean'] + [
+                ['metric', metric_id, 'mean'] for metric_id in metric_ids],
+            granularity=50, start=mock.ANY, stop=mock.ANY,
+            needed_overlap=0)
+
+    @mock.patch('time.monotonic')
+    def test_resolved_search(self, monotonic):
+        monotonic.return_value = 1000
+        self._search_evaluator()
+        self._set_all_alarms('ok')
+        self.client.resource.search.return_value = [
+            {'id': 'r1', 'metrics': {'cpu': 'm1'}},
+            {'id': 'r2', 'metrics': {'cpu': 'm2'}},
+            {'id': 'r3', 'metrics': {'memory': 'm3'}}]
+        self.client.aggregates.fetch.return_value = self._get_stats(
+            50, [self.alarms[0].rule['threshold'] + v for v in range(1, 7)],
+            aggregated=True)
+
+        self._evaluate_all_alarms()
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+        self.client.resource.search.assert_called_once_with(
+            resource_type='instance',
+            query={"=": {"server_group": "my_autoscaling_group"}},
+            limit=gnocchi.SEARCH_PAGE_SIZE, marker=None, sorts=['id:asc'])
+        self.assertEqual([self._by_metrics_call(['m1', 'm2'])] * 2,
+                         self.client.aggregates.fetch.call_args_list)
+
+        monotonic.return_value = 1300
+        self._evaluate_all_alarms()
+        self.assertEqual(2, self.client.resource.search.call_count)
+
+    def test_resolved_search_pages(self):
+        self._search_evaluator()
+        self.useFixture(fixtures.MockPatchObject(
+            gnocchi, 'SEARCH_PAGE_SIZE', 2))
+        self.client.resource.search.side_effect = [
+            [{'id': 'r1', 'metrics': {'cpu': 'm1'}},
+             {'id': 'r2', 'metrics': {'cpu': 'm2'}}],
+            [{'id': 'r3', 'metrics': {'cpu': 'm3'}}]]
+        self.client.aggregates.fetch.return_value = []
+        self._evaluate_all_alarms()
+        self.assertEqual(
+            [None, 'r2'],
+            [c[1]['marker']
+             for c in self.client.resource.search.call_args_list])
+        self.assertEqual([self._by_metrics_call(['m1', 'm2', 'm3'])],
+                         self.client.aggregates.fetch.call_args_list)
+
+    def test_resolved_search_deleted_metric(self):
+        self._search_evaluator()
+        self._set_all_alarms('ok')
+        self.client.resource.search.return_value = [
+            {'id': 'r1', 'metrics': {'cpu': 'm1'}}]
+        avgs = self._get_stats(
+            50, [self.alarms[0].rule['threshold'] + v for v in range(1, 7)],
+            aggregated=True)
+        self.client.aggregates.fetch.side_effect = [
+            exceptions.MetricNotFound(404), avgs, avgs]
+
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('alarm')
+        # NOTE: the search is run by Gnocchi, then resolved again.
+        self.assertEqual(
+            {"=": {"server_group": "my_autoscaling_group"}},
+            self.client.aggregates.fetch.call_args_list[1][1]['search'])
+        self._evaluate_all_alarms()
+        self.assertEqual(2, self.client.resource.search.call_count)
+        self.assertEqual(self._by_metrics_call(['m1']),
+                         self.client.aggregates.fetch.call_args)
+
+    def test_resolved_search_no_resource(self):
+        self._search_evaluator()
+        self._set_all_alarms('ok')
+        self.client.resource.search.return_value = []
+        self._evaluate_all_alarms()
+        self._assert_all_alarms('insufficient data')
+        self.client.aggregates.fetch.assert_not_called()
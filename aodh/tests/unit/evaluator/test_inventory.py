@@ -0,0 +1,107 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/inventory.py
+"""
+import datetime
+from unittest import mock
+
+from oslo_utils import timeutils
+from oslotest import base
+
+from aodh.evaluator import inventory
+
+
+class TestAlarmInventory(base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage_conn = mock.Mock()
+        self.inventory = inventory.AlarmInventory(
+            self.storage_conn, 3600, type={'ne': 'event'})
+        self.now = datetime.datetime(2015, 7, 2, 10, 39)
+        patcher = mock.patch.object(timeutils, 'utcnow',
+                                    side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _alarm(alarm_id, enabled=True):
+        return mock.Mock(alarm_id=alarm_id, enabled=enabled)
+
+    def _advance(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+
+    def test_full_sync(self):
+        alarms = [self._alarm('a'), self._alarm('b')]
+        self.storage_conn.get_alarms_for_evaluation.return_value = alarms
+        self.assertEqual(alarms, self.inventory.sync())
+        self.storage_conn.get_alarms_for_evaluation.assert_called_once_with(
+            enabled=True, type={'ne': 'event'})
+        self.storage_conn.get_changed_alarms.assert_not_called()
+
+    def test_incremental_sync(self):
+        a, b = self._alarm('a'), self._alarm('b')
+        self.storage_conn.get_alarms_for_evaluation.return_value = [a, b]
+        self.inventory.sync()
+
+        b2, c = self._alarm('b'), self._alarm('c')
+        self.storage_conn.get_changed_alarms.return_value = [
+            b2, c, self._alarm('a', enabled=False)]
+        self.storage_conn.count_alarms.return_value = 2
+        self._advance(60)
+        self.assertEqual([b2, c], self.inventory.sync())
+
+        self.assertEqual(
+            1, self.storage_conn.get_alarms_for_evaluation.call_count)
+        self.storage_conn.get_changed_alarms.assert_called_once_with(
+            datetime.datetime(2015, 7, 2, 10, 38, 55), type={'ne': 'event'})
+        self.storage_conn.get_alarm_ids.assert_not_called()
+
+    def test_incremental_sync_deleted_alarm(self):
+        a, b = self._alarm('a'), self._alarm('b')
+        self.storage_conn.get_alarms_for_evaluation.return_value = [a, b]
+        self.inventory.sync()
+
+        self.storage_conn.get_changed_alarms.return_value = []
+        self.storage_conn.count_alarms.return_value = 1
+        self.storage_conn.get_alarm_ids.return_value = ['b']
+        self._advance(60)
+        self.assertEqual([b], self.inventory.sync())
+
+    def test_incremental_sync_missed_alarm(self):
+        a, b = self._alarm('a'), self._alarm('b')
+        self.storage_conn.get_alarms_for_evaluation.return_value = [a]
+        self.inventory.sync()
+
+        self.storage_conn.get_changed_alarms.return_value = []
+        self.storage_conn.count_alarms.return_value = 2
+        self.storage_conn.get_alarm_ids.return_value = ['a', 'b']
+        self.storage_conn.get_alarms_for_evaluation.return_value = [b]
+        self._advance(60)
+        self.assertEqual([a, b], self.inventory.sync())
+        self.storage_conn.get_alarms_for_evaluation.assert_called_with(
+            alarm_id={'in': ['b']})
+
+    def test_periodic_full_sync(self):
+        self.storage_conn.get_alarms_for_evaluation.return_value = [
+            self._alarm('a')]
+        self.inventory.sync()
+        self.storage_conn.get_changed_alarms.return_value = []
+        self.storage_conn.count_alarms.return_value = 1
+        self._advance(1800)
+        self.inventory.sync()
+        self.assertEqual(
+            1, self.storage_conn.get_alarms_for_evaluation.call_count)
+        self._advance(1800)
+        self.inventory.sync()
+        self.assertEqual(
+            2, self.storage_conn.get_alarms_for_evaluation.call_count)
@@ -0,0 +1,72 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/memo.py
+"""
+from concurrent import futures
+import threading
+from unittest import mock
+
+from oslotest import base
+
+from aodh.evaluator import memo
+
+
+class TestQueryMemo(base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.memo = memo.QueryMemo()
+
+    def test_call_once_per_key(self):
+        func = mock.Mock(side_effect=lambda x: x * 2)
+        self.assertEqual(2, self.memo.call('a', func, 1))
+        self.assertEqual(2, self.memo.call('a', func, 1))
+        self.assertEqual(4, self.memo.call('b', func, 2))
+        self.assertEqual([mock.call(1), mock.call(2)], func.call_args_list)
+        self.assertEqual(2, len(self.memo))
+        self.assertEqual(1, self.memo.hits)
+
+    def test_shared_failure(self):
+        func = mock.Mock(side_effect=ValueError('Boom!'))
+        self.assertRaises(ValueError, self.memo.call, 'a', func)
+        self.assertRaises(ValueError, self.memo.call, 'a', func)
+        func.assert_called_once_with()
+
+    def test_reset(self):
+        func = mock.Mock(return_value=1)
+        self.memo.call('a', func)
+        self.memo.reset()
+        self.assertEqual(0, len(self.memo))
+        self.assertEqual(0, self.memo.hits)
+        self.memo.call('a', func)
+        self.assertEqual(2, func.call_count)
+
+    def test_concurrent_calls(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def query():
+            calls.append(1)
+            started.set()
+            release.wait(10)
+            return 'result'
+
+        with futures.ThreadPoolExecutor(max_workers=4) as executor:
+            first = executor.submit(self.memo.call, 'a', query)
+            started.wait(10)
+            others = [executor.submit(self.memo.call, 'a', query)
+                      for _ in range(3)]
+            release.set()
+            results = [f.result(10) for f in [first] + others]
+        self.assertEqual(['result'] * 4, results)
+        self.assertEqual(1, len(calls))
@@ -0,0 +1,124 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/metrics.py
+"""
+import socket
+from unittest import mock
+import urllib.error
+import urllib.request
+
+from oslo_reports import guru_meditation_report as gmr
+from oslotest import base
+
+from aodh.evaluator import metrics
+
+
+class TestRegistry(base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('evaluated_total', 'Evaluated.',
+                                        ['type'])
+        counter.inc(type='composite')
+        counter.inc(2, type='composite')
+        counter.inc(type='prometheus')
+        self.assertEqual(3, counter.get(type='composite'))
+        self.assertEqual(0, counter.get(type='gnocchi'))
+        self.assertEqual('# HELP evaluated_total Evaluated.\n'
+                         '# TYPE evaluated_total counter\n'
+                         'evaluated_total{type="composite"} 3.0\n'
+                         'evaluated_total{type="prometheus"} 1.0\n',
+                         self.registry.render())
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('duration_seconds', 'Duration.',
+                                            buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(1)
+        histogram.observe(4)
+        self.assertEqual((4, 5.55), histogram.get())
+        self.assertEqual('# HELP duration_seconds Duration.\n'
+                         '# TYPE duration_seconds histogram\n'
+                         'duration_seconds_bucket{le="0.1"} 1\n'
+                         'duration_seconds_bucket{le="1.0"} 3\n'
+                         'duration_seconds_bucket{le="+Inf"} 4\n'
+                         'duration_seconds_sum 5.55\n'
+                         'duration_seconds_count 4\n',
+                         self.registry.render())
+
+    def test_label_escaping(self):
+        gauge = self.registry.gauge('info', 'Info.', ['name'])
+        gauge.set(1, name='a "quoted"\nname')
+        self.assertIn('info{name="a \\"quoted\\"\\nname"} 1.0',
+                      self.registry.render())
+
+    @mock.patch.dict(metrics._REPORT_SECTIONS)
+    @mock.patch.object(gmr.TextGuruMeditation, 'register_section')
+    def test_report_registered_once(self, register_section):
+        other = metrics.Registry()
+        metrics.report('Alarm Evaluation', self.registry)
+        metrics.report('Alarm Evaluation', other)
+        register_section.assert_called_once_with(
+            'Alarm Evaluation', metrics._REPORT_SECTIONS['Alarm Evaluation'])
+        self.assertIs(other,
+                      metrics._REPORT_SECTIONS['Alarm Evaluation'].registry)
+
+    def test_report_section(self):
+        self.registry.counter('cycles_total', 'Cycles.').inc()
+        self.registry.histogram('duration_seconds', 'Duration.').observe(2)
+        model = metrics.ReportGenerator(self.registry)()
+        model.set_current_view_type('text')
+        self.assertEqual('cycles_total = 1\n'
+                         'duration_seconds = count=1 sum=2.000 mean=2.000',
+                         str(model))
+
+
+class TestMetricsServer(base.BaseTestCase):
+    def test_scrape(self):
+        registry = metrics.EvaluationMetrics()
+        registry.cycles.inc()
+        server = metrics.MetricsServer(registry, '127.0.0.1', 0)
+        server.start()
+        self.addCleanup(server.stop)
+
+        url = 'http://127.0.0.1:%d' % server.port
+        with urllib.request.urlopen(url + '/metrics') as response:
+            self.assertEqual(metrics.CONTENT_TYPE,
+                             response.headers['Content-Type'])
+            body = response.read().decode()
+        self.assertIn('aodh_evaluator_cycles_total 1.0\n', body)
+
+        e = self.assertRaises(urllib.error.HTTPError,
+                              urllib.request.urlopen, url + '/other')
+        self.assertEqual(404, e.code)
+        e.close()
+
+    def _check_system_port(self, port):
+        server = metrics.MetricsServer(metrics.EvaluationMetrics(),
+                                       '127.0.0.1', port)
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertNotIn(server.port, (0, port))
+
+    def test_port_out_of_range(self):
+        self._check_system_port(metrics.MAX_PORT + 1)
+
+    def test_port_in_use(self):
+        sock = socket.socket()
+        self.addCleanup(sock.close)
+        sock.bind(('127.0.0.1', 0))
+        sock.listen()
+        self._check_system_port(sock.getsockname()[1])
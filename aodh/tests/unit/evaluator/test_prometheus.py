@@ -13,11 +13,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
 import fixtures
 from unittest import mock
 
+from observabilityclient import prometheus_client
 from oslo_utils import uuidutils
 
+from aodh import evaluator
+from aodh.evaluator import memo
 from aodh.evaluator import prometheus
 from aodh.storage import models
 from aodh.tests import constants
@@ -140,3 +144,34 @@ class TestPrometheusEvaluator(base.TestEvaluatorBase):
 
         mock_modify_query.assert_called_once_with(
             'ceilometer_cpu')
+
+    def test_query_memo(self):
+        self.evaluator.query_memo = memo.QueryMemo()
+        self.alarms = self.prepared_alarms
+        self.alarms.append(copy.deepcopy(self.prepared_alarms[0]))
+        self.client.query.query.return_value = []
+        self._evaluate_all_alarms()
+        self.assertEqual(
+            [mock.call('ceilometer_cpu'), mock.call('ceilometer_memory')],
+            self.client.query.query.call_args_list)
+
+    def test_circuit_breaker(self):
+        self.evaluator.circuit_breakers = evaluator.CircuitBreakers(
+            1.0, 2, 0, 30)
+        self.client.query.query.side_effect = (
+            prometheus_client.PrometheusAPIClientError(
+                mock.Mock(status_code=400)))
+        # NOTE: an invalid query does not open the breaker, server errors
+        # do.
+        for _ in range(3):
+            self.assertRaises(prometheus_client.PrometheusAPIClientError,
+                              self.evaluator.evaluate, self.alarms[0])
+        self.client.query.query.side_effect = (
+            prometheus_client.PrometheusAPIClientError(
+                mock.Mock(status_code=503)))
+        for _ in range(2):
+            self.assertRaises(prometheus_client.PrometheusAPIClientError,
+                              self.evaluator.evaluate, self.alarms[0])
+        self.assertRaises(evaluator.BackendUnavailable,
+                          self.evaluator.evaluate, self.alarms[0])
+        self.assertEqual(5, self.client.query.query.call_count)
@@ -0,0 +1,54 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/utils.py
+"""
+import statistics
+
+from oslotest import base
+
+from aodh.evaluator import utils
+
+
+class TestUtils(base.BaseTestCase):
+
+    values = [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0]
+
+    def test_mean(self):
+        self.assertEqual(5.0, utils.mean(self.values))
+        self.assertEqual(0.0, utils.mean([]))
+
+    def test_stddev(self):
+        key = abs
+        self.assertEqual(2.0, utils.stddev(self.values, key))
+        self.assertEqual(2.0, utils.stddev(self.values, key, 5.0))
+        self.assertEqual(0.0, utils.stddev([], key))
+        # NOTE: a mean of 0 is not computed again.
+        self.assertAlmostEqual(
+            statistics.pstdev(self.values, 0.0),
+            utils.stddev(self.values, key, 0.0))
+
+    def test_mean_stddev(self):
+        self.assertEqual((5.0, 2.0), utils.mean_stddev(self.values))
+        self.assertEqual((5.0, 2.0), utils.mean_stddev(
+            [{'v': v} for v in self.values], key=lambda x: x['v']))
+        self.assertEqual((0.0, 0.0), utils.mean_stddev([]))
+
+    def test_mean_stddev_large_offset(self):
+        values = [1e9 + v for v in self.values]
+        mean, stddev = utils.mean_stddev(values)
+        self.assertEqual(1e9 + 5.0, mean)
+        self.assertAlmostEqual(2.0, stddev)
+
+    def test_anomalies(self):
+        self.assertEqual(([2.0, 4.0], [9.0]), utils.anomalies(
+            [2.0, 9.0, 4.0], abs, 1.0, 5.0))
@@ -0,0 +1,76 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for aodh/evaluator/window.py
+"""
+import datetime
+from unittest import mock
+
+from oslotest import base
+
+from aodh.evaluator import window
+
+
+class TestWindow(base.BaseTestCase):
+
+    def test_parse_timestamp(self):
+        expected = datetime.datetime(2016, 11, 24, 10, 1)
+        self.assertEqual(expected, window.parse_timestamp(
+            '2016-11-24T10:01:00+00:00'))
+        self.assertEqual(expected, window.parse_timestamp(
+            '2016-11-24T11:01:00+01:00'))
+        self.assertEqual(expected, window.parse_timestamp(
+            str(expected.replace(tzinfo=datetime.timezone.utc).timestamp())))
+        self.assertEqual(expected, window.parse_timestamp(
+            datetime.datetime(2016, 11, 24, 10, 1,
+                              tzinfo=datetime.timezone.utc)))
+        self.assertEqual(expected, window.parse_timestamp(expected))
+
+    def test_merge(self):
+        cached = window.merge([], [
+            ['2016-11-24T10:01:00+00:00', 60.0, 1.0],
+            ['2016-11-24T10:02:00+00:00', 60.0, 2.0],
+            ['2016-11-24T10:03:00+00:00', 60.0, 3.0]],
+            datetime.datetime(2016, 11, 24, 10, 0))
+        merged = window.merge(cached, [
+            ['2016-11-24T10:03:00+00:00', 60.0, 3.5],
+            ['2016-11-24T10:04:00+00:00', 60.0, 4.0]],
+            datetime.datetime(2016, 11, 24, 10, 2))
+        self.assertEqual([['2016-11-24T10:02:00+00:00', 60.0, 2.0],
+                          ['2016-11-24T10:03:00+00:00', 60.0, 3.5],
+                          ['2016-11-24T10:04:00+00:00', 60.0, 4.0]],
+                         [point for _, point in merged])
+
+
+class TestWindowCache(base.BaseTestCase):
+
+    def test_lru(self):
+        cache = window.WindowCache(2, 60)
+        cache.put('a', 0, [])
+        cache.put('b', 0, [])
+        with mock.patch('time.monotonic', return_value=10):
+            cache.get('a')
+        cache.put('c', 0, [])
+        self.assertEqual(2, len(cache))
+        with mock.patch('time.monotonic', return_value=10):
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual((0, []), cache.get('a'))
+            self.assertEqual((0, []), cache.get('c'))
+
+    def test_max_age(self):
+        cache = window.WindowCache(2, 60)
+        cache.put('a', 100, [])
+        with mock.patch('time.monotonic', return_value=160):
+            self.assertEqual((100, []), cache.get('a'))
+        with mock.patch('time.monotonic', return_value=161):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, len(cache))
@@ -27,6 +27,7 @@ class MockToozCoordinator:
     def __init__(self, member_id, shared_storage):
         self._member_id = member_id
         self._groups = shared_storage
+        self._watchers = {}
         self.is_started = False
 
     def start(self):
@@ -67,6 +68,56 @@ class MockToozCoordinator:
                 tooz.coordination.GroupNotCreated(group_id))
         return MockAsyncResult(self._groups[group_id])
 
+    def _watch(self, group_id):
+        return self._watchers.setdefault(
+            group_id, {'join': [], 'leave': [],
+                       'members': set(self._groups.get(group_id, {}))})
+
+    def watch_join_group(self, group_id, callback):
+        self._watch(group_id)['join'].append(callback)
+
+    def watch_leave_group(self, group_id, callback):
+        self._watch(group_id)['leave'].append(callback)
+
+    def unwatch_join_group(self, group_id, callback):
+        self._watchers[group_id]['join'].remove(callback)
+
+    def unwatch_leave_group(self, group_id, callback):
+        self._watchers[group_id]['leave'].remove(callback)
+
+    def run_watchers(self):
+        for group_id, watch in self._watchers.items():
+            members = set(self._groups.get(group_id, {}))
+            for member in members - watch['members']:
+                for callback in watch['join']:
+                    callback(tooz.coordination.MemberJoinedGroup(group_id,
+                                                                 member))
+            for member in watch['members'] - members:
+                for callback in watch['leave']:
+                    callback(tooz.coordination.MemberLeftGroup(group_id,
+                                                               member))
+            watch['members'] = members
+
+    def update_capabilities(self, group_id, capabilities):
+        self._groups[group_id][self._member_id][
+            'capabilities'] = capabilities
+        return MockAsyncResult(None)
+
+    def get_member_capabilities(self, group_id, member_id):
+        if member_id not in self._groups.get(group_id, {}):
+            return MockAsyncError(
+                tooz.coordination.MemberNotJoined(group_id, member_id))
+        return MockAsyncResult(
+            self._groups[group_id][member_id]['capabilities'])
+
+    def get_members_with_capabilities(self, group_id):
+        if group_id not in self._groups:
+            return MockAsyncError(
+                tooz.coordination.GroupNotCreated(group_id))
+        return MockAsyncResult(
+            {member: info['capabilities']
+             for member, info in self._groups[group_id].items()})
+
 
 class MockToozCoordExceptionRaiser(MockToozCoordinator):
     def start(self):
@@ -140,6 +191,63 @@ class TestHashRing(base.BaseTestCase):
         reassigned = len([c for c in assignments if c != 0])
         self.assertLess(reassigned, num_keys / num_nodes)
 
+    def test_memoized_nodes(self):
+        hr = coordination.HashRing(['a', 'b'])
+        node = hr.get_node('key')
+        with mock.patch.object(hr, '_get_position_on_ring') as position:
+            self.assertEqual(node, hr.get_node('key'))
+            position.assert_not_called()
+
+        for k in range(10):
+            hr.get_node(str(k))
+        hr.retain(['key', '1'])
+        self.assertEqual({'key', '1'}, set(hr._memo))
+
+
+class TestPartitioners(base.BaseTestCase):
+    def test_partitioner_is_abstract(self):
+        self.assertRaises(TypeError, coordination.Partitioner, ['node-1'])
+
+    def _assignments(self, partitioner_cls, nodes, keys, weights=None):
+        partitioner = partitioner_cls(nodes, weights=weights)
+        return {key: partitioner.get_node(key) for key in keys}
+
+    def _check_partitioner(self, partitioner_cls):
+        keys = [str(k) for k in range(2000)]
+        nodes = ['node-%d' % n for n in range(10)]
+        assignments = self._assignments(partitioner_cls, nodes, keys)
+
+        loads = [list(assignments.values()).count(n) for n in nodes]
+        self.assertLess(max(loads), 1.3 * len(keys) / len(nodes))
+        self.assertEqual(assignments,
+                         self._assignments(partitioner_cls,
+                                           list(reversed(nodes)), keys))
+
+        joined = self._assignments(partitioner_cls, nodes + ['node-z'], keys)
+        moved = [k for k in keys if assignments[k] != joined[k]]
+        self.assertEqual({'node-z'}, {joined[k] for k in moved})
+        self.assertLess(len(moved), 1.5 * len(keys) / (len(nodes) + 1))
+
+    def test_jump(self):
+        self._check_partitioner(coordination.JumpHash)
+
+    def test_rendezvous(self):
+        self._check_partitioner(coordination.RendezvousHash)
+
+    def test_weighted(self):
+        self._check_partitioner(coordination.WeightedRendezvousHash)
+
+        keys = [str(k) for k in range(2000)]
+        assignments = self._assignments(
+            coordination.WeightedRendezvousHash, ['a', 'b'], keys,
+            weights={'a': 3.0})
+        share = list(assignments.values()).count('a') / len(keys)
+        self.assertAlmostEqual(0.75, share, delta=0.05)
+
+    def test_no_nodes(self):
+        for partitioner_cls in coordination.PARTITIONERS.values():
+            self.assertIsNone(partitioner_cls([]).get_node('key'))
+
 
 class TestPartitioning(base.BaseTestCase):
 
@@ -150,14 +258,15 @@ class TestPartitioning(base.BaseTestCase):
         self.shared_storage = {}
 
     def _get_new_started_coordinator(self, shared_storage, agent_id=None,
-                                     coordinator_cls=None):
+                                     coordinator_cls=None, passive=False):
         coordinator_cls = coordinator_cls or MockToozCoordinator
         self.CONF.set_override('backend_url', 'xxx://yyy',
                                group='coordination')
         with mock.patch('tooz.coordination.get_coordinator',
                         lambda _, member_id:
                         coordinator_cls(member_id, shared_storage)):
-            pc = coordination.PartitionCoordinator(self.CONF, agent_id)
+            pc = coordination.PartitionCoordinator(self.CONF, agent_id,
+                                                   passive=passive)
             pc.start()
             return pc
 
@@ -217,6 +326,248 @@ class TestPartitioning(base.BaseTestCase):
                                  expected_resources=expected_resources[i]))
         self._usage_simulation(*agents_kwargs)
 
+    def test_ring_cached(self):
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        resources = ['resource_%s' % i for i in range(10)]
+        self.assertEqual(resources,
+                         coord.extract_my_subset('group', resources))
+        ring = coord._partitioners['group'][2]
+
+        self.assertEqual(resources,
+                         coord.extract_my_subset('group', resources))
+        self.assertIs(ring, coord._partitioners['group'][2])
+
+        other = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent2')
+        other.join_group('group')
+        self.assertEqual(resources,
+                         coord.extract_my_subset('group', resources))
+        coord.heartbeat()
+        subset = coord.extract_my_subset('group', resources)
+        self.assertIsNot(ring, coord._partitioners['group'][2])
+        self.assertEqual(('agent1', 'agent2'),
+                         coord._partitioners['group'][0])
+        self.assertEqual(
+            sorted(resources),
+            sorted(subset + other.extract_my_subset('group', resources)))
+
+    def test_weighted_partitioner(self):
+        self.CONF.set_override('partitioner', 'weighted',
+                               group='coordination')
+        self.CONF.set_override('partitioning_weight', 3.0,
+                               group='coordination')
+        heavy = self._get_new_started_coordinator(self.shared_storage,
+                                                  'heavy')
+        heavy.join_group('group')
+        self.CONF.set_override('partitioning_weight', 1.0,
+                               group='coordination')
+        light = self._get_new_started_coordinator(self.shared_storage,
+                                                  'light')
+        light.join_group('group')
+
+        resources = ['resource_%s' % i for i in range(1000)]
+        heavy_subset = heavy.extract_my_subset('group', resources)
+        light_subset = light.extract_my_subset('group', resources)
+        self.assertEqual(sorted(resources),
+                         sorted(heavy_subset + light_subset))
+        self.assertGreater(len(heavy_subset), 2 * len(light_subset))
+        partitioner = light._partitioners['group'][2]
+        self.assertEqual({'heavy': 3.0, 'light': 1.0},
+                         dict(zip(partitioner._nodes, partitioner._weights)))
+
+    def test_capabilities_watched(self):
+        self.CONF.set_override('partitioner', 'weighted',
+                               group='coordination')
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        coord.extract_my_subset('group', ['resource'])
+        coord.heartbeat()
+
+        self.shared_storage['group']['agent2'] = {
+            'capabilities': {'weight': 3.0}}
+        coord.heartbeat()
+        self.assertEqual({'agent1': {'weight': 1.0},
+                          'agent2': {'weight': 3.0}},
+                         coord._capabilities['group'])
+        with mock.patch.object(coord._coordinator,
+                               'get_member_capabilities') as get:
+            coord.extract_my_subset('group', ['resource'])
+            get.assert_not_called()
+        self.assertEqual({'agent1': 1.0, 'agent2': 3.0},
+                         coord._partitioners['group'][1])
+
+        del self.shared_storage['group']['agent2']
+        coord.heartbeat()
+        self.assertEqual({'agent1': {'weight': 1.0}},
+                         coord._capabilities['group'])
+
+    def test_capabilities_batched(self):
+        self.CONF.set_override('partitioner', 'weighted',
+                               group='coordination')
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        self.shared_storage['group']['agent2'] = {
+            'capabilities': {'weight': 3.0}}
+        with mock.patch.object(coord._coordinator,
+                               'get_member_capabilities') as get:
+            coord.extract_my_subset('group', ['resource'])
+            get.assert_not_called()
+        self.assertEqual({'agent1': 1.0, 'agent2': 3.0},
+                         coord._partitioners['group'][1])
+
+        coord._capabilities = {}
+        with mock.patch.object(coord._coordinator,
+                               'get_members_with_capabilities',
+                               side_effect=tooz.NotImplemented):
+            self.assertEqual(
+                {'agent1': {'weight': 1.0}, 'agent2': {'weight': 3.0}},
+                coord._get_capabilities('group', ['agent1', 'agent2']))
+
+    def test_cost_partitioner(self):
+        self.CONF.set_override('partitioner', 'cost', group='coordination')
+        busy = self._get_new_started_coordinator(self.shared_storage, 'busy')
+        busy.join_group('group')
+        idle = self._get_new_started_coordinator(self.shared_storage, 'idle')
+        idle.join_group('group')
+        resources = ['resource_%s' % i for i in range(1000)]
+
+        busy_subset = busy.extract_my_subset('group', resources)
+        idle.extract_my_subset('group', resources)
+        self.assertEqual(0, idle._partitioners['group'][3])
+        idle.publish_load('group', 10.0)
+        self.assertEqual({'weight': 1.0, 'load': 10.0, 'load_generation': 0},
+                         self.shared_storage['group']['idle']['capabilities'])
+
+        # the leader, with the lowest member ID, adjusts the weights from
+        # the loads read at once
+        with mock.patch.object(busy._coordinator,
+                               'get_member_capabilities') as get:
+            busy.publish_load('group', 90.0)
+            get.assert_not_called()
+        capabilities = self.shared_storage['group']['busy']['capabilities']
+        self.assertEqual(1, capabilities['generation'])
+        self.assertAlmostEqual((50 / 90) ** 0.5,
+                               capabilities['weights']['busy'])
+        self.assertAlmostEqual(5 ** 0.5, capabilities['weights']['idle'])
+
+        # the members partition the alarms with the published generation
+        new_busy_subset = busy.extract_my_subset('group', resources)
+        new_idle_subset = idle.extract_my_subset('group', resources)
+        self.assertEqual(1, idle._partitioners['group'][3])
+        self.assertEqual(busy._partitioners['group'][1],
+                         idle._partitioners['group'][1])
+        self.assertEqual(sorted(resources),
+                         sorted(new_busy_subset + new_idle_subset))
+        self.assertGreater(len(busy_subset), 0.4 * len(resources))
+        self.assertLess(len(new_busy_subset), 0.4 * len(resources))
+
+        # the weights are not adjusted again before all the loads are
+        # measured with the current generation
+        busy.publish_load('group', 90.0)
+        self.assertEqual(
+            1, self.shared_storage['group']['busy']['capabilities'][
+                'generation'])
+        weights = busy._generations['group'][1]
+
+        # balanced loads keep the weights
+        idle.publish_load('group', 48.0)
+        busy.publish_load('group', 52.0)
+        self.assertEqual((1, weights), busy._generations['group'])
+
+        # the next leader goes on with the last weights
+        busy.leave_group('group')
+        del self.shared_storage['group']['busy']
+        idle.heartbeat()
+        idle.extract_my_subset('group', resources)
+        idle.publish_load('group', 40.0)
+        self.assertEqual(
+            {'generation': 1, 'weights': {'idle': weights['idle']}},
+            {key: self.shared_storage['group']['idle']['capabilities'][key]
+             for key in ('generation', 'weights')})
+
+    def test_membership_watchers(self):
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        self.assertEqual(['agent1'], list(coord._get_members('group')))
+        with mock.patch.object(coord._coordinator, 'get_members') as get:
+            self.assertEqual({'agent1'}, coord._get_members('group'))
+            get.assert_not_called()
+
+        self.shared_storage['group']['agent2'] = {'capabilities': b''}
+        coord.heartbeat()
+        self.assertEqual({'agent1', 'agent2'}, coord._get_members('group'))
+
+        del self.shared_storage['group']['agent2']
+        coord.heartbeat()
+        self.assertEqual({'agent1'}, coord._get_members('group'))
+
+        coord.leave_group('group')
+        self.assertEqual({}, coord._members)
+        self.assertEqual([], coord._coordinator._watchers['group']['join'])
+
+    def test_membership_watched_before_read(self):
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        get_members = coord._coordinator.get_members
+
+        def get_members_then_join(group_id):
+            members = set(get_members(group_id).get())
+            self.shared_storage['group']['agent2'] = {'capabilities': b''}
+            return MockAsyncResult(members)
+
+        with mock.patch.object(coord._coordinator, 'get_members',
+                               side_effect=get_members_then_join):
+            self.assertEqual(['agent1'], list(coord._get_members('group')))
+        coord.heartbeat()
+        self.assertEqual({'agent1', 'agent2'}, coord._get_members('group'))
+
+    @mock.patch('time.monotonic')
+    def test_membership_refresh(self, now):
+        now.return_value = 1000.0
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        coord._get_members('group')
+        coord.heartbeat()
+        # a member joined unseen by the watchers
+        self.shared_storage['group']['agent2'] = {'capabilities': b''}
+        coord._coordinator._watchers['group']['members'].add('agent2')
+        now.return_value = 1050.0
+        coord.heartbeat()
+        self.assertEqual({'agent1'}, coord._get_members('group'))
+
+        now.return_value = 1060.0
+        coord.heartbeat()
+        self.assertEqual({'agent1', 'agent2'}, coord._get_members('group'))
+
+    def test_membership_not_watchable(self):
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        with mock.patch.object(coord._coordinator, 'watch_join_group',
+                               side_effect=tooz.NotImplemented):
+            coord._get_members('group')
+            self.assertEqual({'group'}, coord._polled_groups)
+            self.assertEqual({}, coord._members)
+            self.shared_storage['group']['agent2'] = {'capabilities': b''}
+            self.assertEqual(['agent1', 'agent2'],
+                             sorted(coord._get_members('group')))
+
+    def test_publish_load_not_balanced(self):
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent1')
+        coord.join_group('group')
+        coord.publish_load('group', 10.0)
+        self.assertEqual(b'',
+                         self.shared_storage['group']['agent1'][
+                             'capabilities'])
+
     @mock.patch.object(coordination.LOG, 'exception')
     def test_coordination_backend_offline(self, mocked_exception):
         agents = [dict(agent_id='agent1',
@@ -267,3 +618,31 @@ class TestPartitioning(base.BaseTestCase):
         coord.stop()
         self.assertEqual(0, len(coord._groups))
         self.assertIsNone(coord._coordinator)
+
+    def test_passive(self):
+        all_resources = ['resource_%s' % i for i in range(100)]
+        passive = self._get_new_started_coordinator(
+            self.shared_storage, 'agent1', passive=True)
+        self.assertNotEqual('agent1', passive._coordinator._member_id)
+        passive.join_group('group')
+        self.assertEqual({}, self.shared_storage)
+        self.assertEqual([], passive.extract_my_subset('group',
+                                                       all_resources))
+
+        active = self._get_new_started_coordinator(
+            self.shared_storage, 'agent1')
+        active.join_group('group')
+        other = self._get_new_started_coordinator(
+            self.shared_storage, 'agent2')
+        other.join_group('group')
+        self.assertEqual(['agent1', 'agent2'],
+                         sorted(self.shared_storage['group']))
+        self.assertEqual(active.extract_my_subset('group', all_resources),
+                         passive.extract_my_subset('group', all_resources))
+
+        with mock.patch.object(passive._coordinator, 'heartbeat') as hb:
+            passive.heartbeat()
+            hb.assert_not_called()
+        passive.stop()
+        self.assertEqual(['agent1', 'agent2'],
+                         sorted(self.shared_storage['group']))
@@ -14,16 +14,21 @@
 # under the License.
 """Tests for aodh.evaluator.AlarmEvaluationService.
 """
+import asyncio
+import datetime
 import fixtures
+import threading
 import time
 from unittest import mock
 
 from observabilityclient import prometheus_client
 from oslo_config import fixture as fixture_config
+from oslo_utils import timeutils
 from stevedore import extension
 
 from aodh import evaluator
 from aodh import service
+from aodh.storage import models as storage_models
 
 from aodh.evaluator import prometheus
 from aodh.tests import base as tests_base
@@ -39,7 +44,7 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
 
         self.threshold_eval = mock.MagicMock()
         self._fake_conn = mock.Mock()
-        self._fake_conn.get_alarms.return_value = []
+        self._fake_conn.get_alarms_for_evaluation.return_value = []
         self._fake_pc = mock.Mock()
         self._fake_em = extension.ExtensionManager.make_test_instance(
             [
@@ -99,7 +104,7 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
                           alarm_id="alarm_id1")
         self._fake_pc.extract_my_subset.return_value = ["alarm_id1"]
         self._fake_pc.is_active.side_effect = [False, False, True, True]
-        self._fake_conn.get_alarms.return_value = [alarm]
+        self._fake_conn.get_alarms_for_evaluation.return_value = [alarm]
         self.threshold_eval.evaluate.side_effect = [Exception('Boom!'), None]
 
         svc = evaluator.AlarmEvaluationService(0, self.CONF)
@@ -110,6 +115,68 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
                                        ["alarm_id1"])
         self.threshold_eval.evaluate.assert_called_once_with(alarm)
 
+    def test_evaluation_cycle_prefetch(self):
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id='a'),
+            mock.Mock(type='unknown', alarm_id='b'),
+        ]
+        self._fake_pc.is_active.return_value = False
+        self._fake_conn.get_alarms_for_evaluation.return_value = alarms
+        self.threshold_eval.prefetch.side_effect = Exception('Boom!')
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        time.sleep(1)
+        self.threshold_eval.prefetch.assert_called_once_with([alarms[0]])
+        self.threshold_eval.evaluate.assert_called_once_with(alarms[0])
+
+    def test_evaluation_cycle_query_memo(self):
+        self.CONF.set_override('query_memo', True, 'evaluator')
+        alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                          alarm_id='a')
+        self._fake_pc.is_active.return_value = False
+        self._fake_conn.get_alarms_for_evaluation.return_value = [alarm]
+        memos = []
+        self.threshold_eval.evaluate.side_effect = (
+            lambda alarm: memos.append(len(svc.query_memo)))
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertIs(svc.query_memo, self.threshold_eval.query_memo)
+        svc.query_memo.call('key', mock.Mock())
+        svc._evaluate_assigned_alarms()
+        # NOTE: the memo is emptied at each cycle.
+        self.assertEqual(0, memos[-1])
+        self.assertEqual(0, len(svc.query_memo))
+
+    def test_query_memo_not_spread(self):
+        self.CONF.set_override('query_memo', True, 'evaluator')
+        self.CONF.set_override('spread_evaluations', True, 'evaluator')
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertIsNone(svc.query_memo)
+
+    def test_evaluation_cycle_backend_unavailable(self):
+        self.CONF.set_override('circuit_breaker_failure_ratio', 0.5,
+                               'evaluator')
+        alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                          alarm_id='a')
+        self._fake_pc.is_active.return_value = False
+        self.threshold_eval.evaluate.side_effect = (
+            evaluator.BackendUnavailable('gnocchi'))
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertIsInstance(self.threshold_eval.circuit_breakers,
+                              evaluator.CircuitBreakers)
+        svc._evaluate_alarms([alarm])
+        self.assertEqual(
+            1, svc.metrics.skipped.get(reason='backend_unavailable'))
+        self.assertEqual(0, svc.metrics.errors.get(
+            type='gnocchi_aggregation_by_metrics_threshold'))
+        self.assertNotIn('a', svc._costs)
+
     def test_evaluation_cycle_with_bad_alarm(self):
 
         alarms = [
@@ -122,13 +189,220 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
 
         self._fake_pc.is_active.side_effect = [False, False, True, True, True]
         self._fake_pc.extract_my_subset.return_value = ['a', 'b']
-        self._fake_conn.get_alarms.return_value = alarms
+        self._fake_conn.get_alarms_for_evaluation.return_value = alarms
 
         svc = evaluator.AlarmEvaluationService(0, self.CONF)
         self.addCleanup(svc.terminate)
         time.sleep(1)
         self.assertEqual([mock.call(alarms[0]), mock.call(alarms[1])],
                          self.threshold_eval.evaluate.call_args_list)
+        alarm_type = 'gnocchi_aggregation_by_metrics_threshold'
+        self.assertEqual(2, svc.metrics.evaluated.get(type=alarm_type))
+        self.assertEqual(1, svc.metrics.errors.get(type=alarm_type))
+        self.assertEqual(
+            2, svc.metrics.evaluation_duration.get(type=alarm_type)[0])
+        self.assertEqual(1, svc.metrics.cycles.get())
+        self.assertEqual(2, svc.metrics.cycle_alarms.get())
+
+    def test_evaluation_cycle_concurrent(self):
+        self.CONF.set_override('evaluation_threads', 4, 'evaluator')
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id=str(i)) for i in range(10)
+        ]
+        self.threshold_eval.evaluate.side_effect = (
+            [Exception('Boom!')] + [None] * 9)
+
+        self._fake_pc.is_active.return_value = False
+        self._fake_conn.get_alarms_for_evaluation.return_value = alarms
+        self._fake_conn.conditional_update.return_value = True
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        time.sleep(1)
+        self.assertIsNotNone(svc.evaluation_executor)
+        self.assertEqual(
+            sorted(alarms, key=id),
+            sorted([c[0][0] for c in
+                    self.threshold_eval.evaluate.call_args_list], key=id))
+
+    def test_evaluation_cycle_spread(self):
+        self.CONF.set_override('spread_evaluations', True, 'evaluator')
+        self.CONF.set_override('evaluation_interval', 1, 'evaluator')
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id=str(i), evaluate_timestamp=None)
+            for i in range(10)
+        ]
+        self._fake_pc.is_active.return_value = False
+        self._fake_conn.conditional_update.return_value = True
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        start = time.monotonic()
+        svc._evaluate_spread(alarms, start)
+        self.assertLess(time.monotonic() - start, 1)
+
+        offsets = [svc._evaluation_offset(a.alarm_id) for a in alarms]
+        self.assertTrue(all(0 <= o < 0.9 for o in offsets))
+        self.assertEqual(offsets,
+                         [svc._evaluation_offset(a.alarm_id) for a in alarms])
+        self.assertEqual(
+            sorted(alarms, key=lambda a: svc._evaluation_offset(a.alarm_id)),
+            [c[0][0] for c in self.threshold_eval.evaluate.call_args_list])
+
+    def test_evaluation_spread_recently_evaluated(self):
+        self.CONF.set_override('spread_evaluations', True, 'evaluator')
+        alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                          alarm_id='a', evaluate_timestamp=timeutils.utcnow())
+        self._fake_pc.is_active.return_value = False
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        svc._evaluate_alarm(alarm)
+        self.assertEqual(0, self._fake_conn.conditional_update.call_count)
+        self.assertEqual(0, self.threshold_eval.evaluate.call_count)
+
+    def test_evaluation_cycle_overrun(self):
+        self.CONF.set_override('evaluation_interval', 10, 'evaluator')
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+
+        svc._record_cycle_duration(4)
+        self.assertEqual(0, svc.metrics.cycle_overruns.get())
+        svc._record_cycle_duration(12.5)
+        self.assertEqual(1, svc.metrics.cycle_overruns.get())
+        self.assertEqual(2.5, svc.metrics.last_cycle_overrun.get())
+        self.assertEqual((2, 16.5), svc.metrics.cycle_duration.get())
+
+    def test_evaluation_cycle_asyncio(self):
+        self.CONF.set_override('evaluation_engine', 'asyncio', 'evaluator')
+        self.CONF.set_override('evaluation_threads', 4, 'evaluator')
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id=str(i)) for i in range(10)
+        ]
+        self._fake_pc.is_active.return_value = True
+        self._fake_pc.extract_my_subset.return_value = [
+            a.alarm_id for a in alarms]
+        self.threshold_eval.evaluate_async = mock.AsyncMock(
+            side_effect=[None, Exception('boom')] + [None] * 8)
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertIsNone(svc.evaluation_executor)
+        self.assertIsInstance(self.threshold_eval.backend_limits,
+                              evaluator.BackendLimits)
+        self.assertEqual(16, self.threshold_eval.backend_limits.concurrency)
+        self.assertEqual(16, svc.storage_executor._max_workers)
+
+        reserve = svc._reserve_alarm
+        threads = []
+
+        def reserve_alarm(alarm, claimed):
+            threads.append(threading.current_thread().name)
+            return reserve(alarm, claimed)
+
+        with mock.patch.object(svc, '_reserve_alarm',
+                               side_effect=reserve_alarm):
+            svc._evaluate_alarms(alarms)
+        self.assertEqual([mock.call(a) for a in alarms],
+                         self.threshold_eval.evaluate_async.call_args_list)
+        self.threshold_eval.evaluate.assert_not_called()
+        self.assertTrue(all(name.startswith('aodh-storage')
+                            for name in threads))
+        alarm_type = 'gnocchi_aggregation_by_metrics_threshold'
+        self.assertEqual(10, svc.metrics.evaluated.get(type=alarm_type))
+        self.assertEqual(1, svc.metrics.errors.get(type=alarm_type))
+
+    def test_evaluation_cost_published(self):
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id=str(i)) for i in range(3)
+        ]
+        # NOTE: the first evaluation cycle is delayed by the coordination,
+        # so that it does not publish its own load.
+        self._fake_pc.is_active.return_value = True
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+
+        svc._record_evaluation(alarms[0], 2.0)
+        svc._record_evaluation(alarms[0], 1.0)
+        svc._record_evaluation(alarms[1], 1.0)
+        svc._record_evaluation(mock.Mock(alarm_id='gone'), 10.0)
+        self.assertEqual(1.8, svc._costs['0'])
+
+        svc._publish_load(alarms)
+        self.assertEqual({'0': 1.8, '1': 1.0}, svc._costs)
+        self._fake_pc.publish_load.assert_called_once_with(
+            svc.PARTITIONING_GROUP_NAME, 1.8 + 1.0 + 1.4)
+        self.assertEqual(4.2, round(svc.metrics.partition_cost.get(), 6))
+
+    def test_evaluation_cycle_worker_sharding(self):
+        self.CONF.set_override('worker_sharding', True, 'evaluator')
+        self.CONF.set_override('workers', 2, 'evaluator')
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id=str(i)) for i in range(20)
+        ]
+        self._fake_pc.is_active.return_value = True
+        self._fake_pc.extract_my_subset.return_value = [
+            a.alarm_id for a in alarms]
+        self._fake_conn.get_alarms_for_evaluation.return_value = alarms
+
+        pc_cls = self.useFixture(fixtures.MockPatch(
+            'aodh.coordination.PartitionCoordinator',
+            return_value=self._fake_pc)).mock
+        shards = []
+        for worker_id in range(2):
+            svc = evaluator.AlarmEvaluationService(worker_id, self.CONF,
+                                                   b'member')
+            self.addCleanup(svc.terminate)
+            shards.append(svc._assigned_alarms())
+        self.assertEqual([mock.call(self.CONF, b'member', passive=False),
+                          mock.call(self.CONF, b'member', passive=True)],
+                         pc_cls.call_args_list)
+        self.assertTrue(all(shards))
+        self.assertEqual(sorted(a.alarm_id for a in alarms),
+                         sorted(a.alarm_id for s in shards for a in s))
+
+    def test_evaluation_cycle_partition_by_bucket(self):
+        self.CONF.set_override('partition_by_bucket', True, 'evaluator')
+        bucketed = mock.Mock(alarm_id='a', partition_bucket=4)
+        legacy = [mock.Mock(alarm_id='legacy-%d' % i, partition_bucket=None)
+                  for i in range(2)]
+        my_buckets = [4, storage_models.partition_bucket('legacy-0')]
+        self._fake_pc.is_active.return_value = True
+        self._fake_pc.extract_my_subset.return_value = my_buckets
+        self._fake_conn.get_alarms_for_evaluation.side_effect = (
+            lambda partition_bucket, **kwargs:
+            list(legacy) if partition_bucket is None else [bucketed])
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        selected = svc._assigned_alarms()
+        self._fake_pc.extract_my_subset.assert_called_with(
+            svc.PARTITIONING_GROUP_NAME,
+            list(range(storage_models.PARTITION_BUCKETS)))
+        calls = self._fake_conn.get_alarms_for_evaluation.call_args_list
+        self.assertEqual([{'in': sorted(my_buckets)}, None],
+                         [c[1]['partition_bucket'] for c in calls[-2:]])
+        self.assertEqual([bucketed, legacy[0]], selected)
+
+    def test_partition_by_bucket_worker_sharding(self):
+        self.CONF.set_override('partition_by_bucket', True, 'evaluator')
+        self.CONF.set_override('worker_sharding', True, 'evaluator')
+        self.CONF.set_override('workers', 2, 'evaluator')
+        self._fake_pc.is_active.return_value = False
+
+        buckets = []
+        for worker_id in range(2):
+            svc = evaluator.AlarmEvaluationService(worker_id, self.CONF,
+                                                   b'member')
+            self.addCleanup(svc.terminate)
+            buckets.append(svc._assigned_buckets())
+        self.assertEqual(set(range(0, 1024, 2)), buckets[0])
+        self.assertEqual(set(range(1, 1024, 2)), buckets[1])
 
     def test_unknown_extension_skipped(self):
         alarms = [
@@ -139,15 +413,17 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
 
         self._fake_pc.is_active.return_value = False
         self._fake_pc.extract_my_subset.return_value = ['a', 'b']
-        self._fake_conn.get_alarms.return_value = alarms
+        self._fake_conn.get_alarms_for_evaluation.return_value = alarms
 
         svc = evaluator.AlarmEvaluationService(0, self.CONF)
         self.addCleanup(svc.terminate)
         time.sleep(1)
         self.threshold_eval.evaluate.assert_called_once_with(alarms[1])
+        self.assertEqual(
+            1, svc.metrics.skipped.get(reason='unsupported_type'))
 
     def test_check_alarm_query_constraints(self):
-        self._fake_conn.get_alarms.return_value = []
+        self._fake_conn.get_alarms_for_evaluation.return_value = []
         self._fake_pc.extract_my_subset.return_value = []
         self._fake_pc.is_active.return_value = False
 
@@ -155,17 +431,105 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
         self.addCleanup(svc.terminate)
         time.sleep(1)
 
-        child = {'enabled': True, 'type': {'ne': 'event'}}
+        child = {'enabled': True,
+                 'type': {'in': ['gnocchi_aggregation_by_metrics_threshold']}}
         self.assertLessEqual(
             child.items(),
-            svc.storage_conn.get_alarms.call_args[1].items())
+            svc.storage_conn.get_alarms_for_evaluation.call_args[1].items())
+
+    def test_evaluation_cycle_inventory(self):
+        self.CONF.set_override('inventory_resync_interval', 3600,
+                               'evaluator')
+        alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                          alarm_id="alarm_id1",
+                          evaluate_timestamp=datetime.datetime(2015, 1, 1))
+        self._fake_pc.extract_my_subset.return_value = ["alarm_id1"]
+        self._fake_pc.is_active.return_value = True
+        self._fake_conn.get_alarms_for_evaluation.return_value = [alarm]
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        svc._evaluate_assigned_alarms()
+        self._fake_conn.get_alarms_for_evaluation.assert_called_once_with(
+            enabled=True,
+            type={'in': ['gnocchi_aggregation_by_metrics_threshold']})
+        self.threshold_eval.evaluate.assert_called_once_with(alarm)
+
+        self._fake_conn.get_changed_alarms.return_value = []
+        self._fake_conn.count_alarms.return_value = 1
+        svc._evaluate_assigned_alarms()
+        self.assertEqual(
+            1, self._fake_conn.get_alarms_for_evaluation.call_count)
+        self.assertEqual(1, self._fake_conn.get_changed_alarms.call_count)
+        self.assertEqual(2, self.threshold_eval.evaluate.call_count)
+
+    def test_evaluation_cycle_scheduled_by_rule_period(self):
+        self.CONF.set_override('schedule_by_rule_period', True, 'evaluator')
+        self.CONF.set_override('additional_ingestion_lag', 10)
+        self.CONF.set_override('schedule_ingestion_margin', 0, 'evaluator')
+        ts = datetime.datetime(2015, 1, 1)
+        long_alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                               alarm_id="alarm_id1", timestamp=ts,
+                               state_timestamp=ts, rule={'granularity': 3600})
+        short_alarm = mock.Mock(
+            type='gnocchi_aggregation_by_metrics_threshold',
+            alarm_id="alarm_id2", timestamp=ts, state_timestamp=ts,
+            rule={'granularity': 60})
+        alarms = [long_alarm, short_alarm]
+        self.threshold_eval.evaluation_period.side_effect = (
+            lambda rule: rule['granularity'])
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=7300):
+            self.assertEqual(alarms, svc._scheduled_alarms(alarms))
+        self.assertEqual({'alarm_id1': (10810, (ts, ts))}, svc._schedule)
+
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=7360):
+            self.assertEqual([short_alarm], svc._scheduled_alarms(alarms))
+
+        long_alarm.state_timestamp = datetime.datetime(2015, 1, 2)
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=7420):
+            self.assertEqual(alarms, svc._scheduled_alarms(alarms))
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=10810):
+            self.assertEqual(alarms, svc._scheduled_alarms(alarms))
+
+    def test_evaluation_cycle_scheduled_after_ingestion_margin(self):
+        self.CONF.set_override('schedule_by_rule_period', True, 'evaluator')
+        self.CONF.set_override('additional_ingestion_lag', 10)
+        ts = datetime.datetime(2015, 1, 1)
+        alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                          alarm_id="alarm_id1", timestamp=ts,
+                          state_timestamp=ts, rule={'granularity': 3600})
+        self.threshold_eval.evaluation_period.side_effect = (
+            lambda rule: rule['granularity'])
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        # NOTE: the closed period is checked again until the margin of 120
+        # seconds after its end and additional_ingestion_lag elapsed.
+        for now in (7210, 7270, 7320):
+            with mock.patch.object(timeutils, 'utcnow_ts', return_value=now):
+                self.assertEqual([alarm], svc._scheduled_alarms([alarm]))
+            self.assertEqual({}, svc._schedule)
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=7330):
+            self.assertEqual([alarm], svc._scheduled_alarms([alarm]))
+        self.assertEqual({'alarm_id1': (10810, (ts, ts))}, svc._schedule)
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=7390):
+            self.assertEqual([], svc._scheduled_alarms([alarm]))
+
+        # NOTE: the period ends after additional_ingestion_lag.
+        svc._schedule = {}
+        with mock.patch.object(timeutils, 'utcnow_ts', return_value=10805):
+            self.assertEqual([alarm], svc._scheduled_alarms([alarm]))
+        self.assertEqual({'alarm_id1': (10810, (ts, ts))}, svc._schedule)
 
     def test_evaluation_cycle_no_coordination(self):
         alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
                           alarm_id="alarm_id1")
 
         self._fake_pc.is_active.return_value = False
-        self._fake_conn.get_alarms.return_value = [alarm]
+        self._fake_conn.get_alarms_for_evaluation.return_value = [alarm]
         self._fake_conn.conditional_update.return_value = True
 
         svc = evaluator.AlarmEvaluationService(0, self.CONF)
@@ -178,12 +542,42 @@ class TestAlarmEvaluationService(tests_base.BaseTestCase):
 
         self.threshold_eval.evaluate.assert_called_once_with(alarm)
 
+    def test_evaluation_cycle_claimed_blocks(self):
+        self.CONF.set_override('alarm_claim_batch_size', 2, 'evaluator')
+        alarms = [
+            mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
+                      alarm_id=str(i)) for i in range(3)
+        ]
+        self._fake_pc.is_active.return_value = False
+        self._fake_conn.claim_alarms.side_effect = [alarms[:2], alarms[2:],
+                                                    []]
+
+        svc = evaluator.AlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        time.sleep(1)
+
+        self.assertEqual(3, self._fake_conn.claim_alarms.call_count)
+        owner, now, before, limit = (
+            self._fake_conn.claim_alarms.call_args[0])
+        self.assertEqual(svc._claim_owner, owner)
+        self.assertEqual(datetime.timedelta(seconds=30), now - before)
+        self.assertEqual(2, limit)
+        self.assertEqual(
+            {'enabled': True,
+             'type': {'in': ['gnocchi_aggregation_by_metrics_threshold']}},
+            self._fake_conn.claim_alarms.call_args[1])
+        self.assertEqual(0, self._fake_conn.conditional_update.call_count)
+        self.assertEqual(
+            0, self._fake_conn.get_alarms_for_evaluation.call_count)
+        self.assertEqual([mock.call(a) for a in alarms],
+                         self.threshold_eval.evaluate.call_args_list)
+
     def test_evaluation_cycle_no_coordination_alarm_modified(self):
         alarm = mock.Mock(type='gnocchi_aggregation_by_metrics_threshold',
                           alarm_id="alarm_id1")
 
         self._fake_pc.is_active.return_value = False
-        self._fake_conn.get_alarms.return_value = [alarm]
+        self._fake_conn.get_alarms_for_evaluation.return_value = [alarm]
         self._fake_conn.conditional_update.return_value = False
 
         svc = evaluator.AlarmEvaluationService(0, self.CONF)
@@ -230,6 +624,12 @@ class TestPrometheusEvaluator(tests_base.BaseTestCase):
             self.assertEqual('alarm', state)
             self.assertEqual(6, outside)
 
+            state, trend, stats, outside, reason = asyncio.run(
+                ev.evaluate_rule_async({'query': 'mtr', 'threshold': 9,
+                                        'comparison_operator': 'gt'}))
+            self.assertEqual('alarm', state)
+            self.assertEqual(6, outside)
+
             # test transfer to ok state
             state, trend, stats, outside, reason = ev.evaluate_rule(
                 {'query': 'mtr', 'threshold': 31,
@@ -60,3 +60,90 @@ class TestEventAlarmEvaluationService(tests_base.BaseTestCase):
         time.sleep(1)
         self.assertEqual(1, len(received_events))
         self.assertEqual(2, len(received_events[0]))
+
+    @mock.patch('aodh.storage.get_connection_from_config',
+                mock.MagicMock())
+    @mock.patch('aodh.evaluator.event.EventAlarmEvaluator.evaluate_events')
+    def test_partitioned_event_listener(self, mocked):
+        self.CONF.set_override("batch_size", 1, 'listener')
+        self.CONF.set_override("event_partitions", 2, 'listener')
+        msg_notifier = oslo_messaging.Notifier(
+            self.transport, topics=['alarm.all'], driver='messaging',
+            publisher_id='test-publisher')
+
+        received_events = []
+        mocked.side_effect = lambda events: received_events.extend(events)
+        events = [{'event_type': 'compute.instance.update',
+                   'traits': [['project_id', 1, project]],
+                   'message_id': '20d03d17-4aba-4900-a179-dba1281a345%d' % i,
+                   'generated': '2016-04-23T06:50:21.622739'}
+                  for i, project in enumerate(['p1', 'p2', 'p3', 'p4'])]
+        msg_notifier.sample({}, 'event', events)
+
+        svc = event.EventAlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertEqual(2, len(svc.listeners))
+
+        for _ in range(50):
+            if len(received_events) == len(events):
+                break
+            time.sleep(0.1)
+        self.assertEqual(sorted(e['message_id'] for e in events),
+                         sorted(e['message_id'] for e in received_events))
+
+    @mock.patch('aodh.storage.get_connection_from_config',
+                mock.MagicMock())
+    def test_partitioned_event_listener_routing_only(self):
+        self.CONF.set_override("event_partitions", 2, 'listener')
+        self.CONF.set_override("workers", 4, 'listener')
+        svc = event.EventAlarmEvaluationService(3, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertEqual([svc.listener], svc.listeners)
+
+    @mock.patch('aodh.storage.get_connection_from_config',
+                mock.MagicMock())
+    @mock.patch('aodh.messaging.get_notifier')
+    def test_single_event_partition(self, get_notifier):
+        self.CONF.set_override("event_partitions", 1, 'listener')
+        svc = event.EventAlarmEvaluationService(0, self.CONF)
+        self.addCleanup(svc.terminate)
+        self.assertEqual([svc.listener], svc.listeners)
+        self.assertIsInstance(svc.listener.dispatcher.endpoints[0],
+                              event.EventAlarmEndpoint)
+        get_notifier.assert_not_called()
+
+
+class TestEventAlarmRoutingEndpoint(tests_base.BaseTestCase):
+
+    def test_project_partition(self):
+        self.assertEqual(event.project_partition('p1', 16),
+                         event.project_partition('p1', 16))
+        partitions = {event.project_partition('project-%d' % i, 4)
+                      for i in range(100)}
+        self.assertEqual({0, 1, 2, 3}, partitions)
+
+    def test_route_by_project(self):
+        notifiers = [mock.Mock(), mock.Mock(), mock.Mock()]
+        endpoint = event.EventAlarmRoutingEndpoint(notifiers)
+        events = [{'event_type': 'compute.instance.update',
+                   'traits': [['project_id', 1, project]],
+                   'message_id': str(i)}
+                  for i, project in enumerate(['p1', 'p2', 'p3', 'p1'])]
+        invalid = {'event_type': 'compute.instance.update'}
+        endpoint.sample([{'ctxt': {}, 'event_type': 'event',
+                          'payload': events},
+                         {'ctxt': {}, 'event_type': 'event',
+                          'payload': invalid}])
+
+        routed = {}
+        for partition, notifier in enumerate(notifiers):
+            for call in notifier.sample.call_args_list:
+                self.assertEqual('event', call[0][1])
+                for e in call[0][2]:
+                    routed[e.get('message_id')] = partition
+        self.assertEqual(event.project_partition('', 3), routed[None])
+        for e in events:
+            self.assertEqual(
+                event.project_partition(e['traits'][0][2], 3),
+                routed[e['message_id']])
+        self.assertEqual(routed['0'], routed['3'])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Compare the partitioners of the alarm evaluator group.
+
+For each partitioner and number of members, report:
+
+* the time to assign all the alarm IDs, without memoization;
+* the balance of the assignment, as the maximum over the mean member load;
+* the share of the alarms moved when a member joins and when one leaves.
+
+Usage: python tools/partitioner_benchmark.py [--alarms N]
+       [--members 10 25 50 100] [--partitioners ring jump ...]
+"""
+
+import argparse
+import collections
+import time
+
+from oslo_utils import uuidutils
+
+from aodh import coordination
+
+
+def assign(partitioner_cls, members, keys):
+    partitioner = partitioner_cls(members)
+    start = time.monotonic()
+    # NOTE: bypass the memo, each key is only looked up once.
+    assignments = [partitioner._get_node(key) for key in keys]
+    return assignments, time.monotonic() - start
+
+
+def moved(before, after):
+    return sum(1 for a, b in zip(before, after) if a != b) / len(before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alarms', type=int, default=1000000)
+    parser.add_argument('--members', type=int, nargs='+',
+                        default=[10, 25, 50, 100])
+    parser.add_argument('--partitioners', nargs='+',
+                        default=sorted(coordination.PARTITIONERS),
+                        choices=sorted(coordination.PARTITIONERS))
+    args = parser.parse_args()
+
+    keys = [uuidutils.generate_uuid() for _ in range(args.alarms)]
+    print('%-12s %8s %10s %9s %9s %9s' % (
+        'partitioner', 'members', 'assign(s)', 'max/mean', 'joined',
+        'left'))
+    for name in args.partitioners:
+        partitioner_cls = coordination.PARTITIONERS[name]
+        for count in args.members:
+            members = [uuidutils.generate_uuid() for _ in range(count)]
+            assignments, duration = assign(partitioner_cls, members, keys)
+            loads = collections.Counter(assignments)
+            balance = max(loads.values()) / (len(keys) / count)
+            joined, _ = assign(partitioner_cls,
+                               members + [uuidutils.generate_uuid()], keys)
+            left, _ = assign(partitioner_cls, members[1:], keys)
+            print('%-12s %8d %10.2f %9.3f %8.2f%% %8.2f%%' % (
+                name, count, duration, balance,
+                100 * moved(assignments, joined),
+                100 * moved(assignments, left)))
+
+
+if __name__ == '__main__':
+    main()
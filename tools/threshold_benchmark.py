@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Compare the threshold comparisons of the datapoints of many alarms.
+
+For each number of alarms, report the time ThresholdEvaluator takes to
+compare their datapoints to their threshold, debug logs included:
+
+* with the former closure called for each datapoint;
+* with aodh.evaluator.comparison.compare_window.
+
+Usage: python tools/threshold_benchmark.py [--alarms 1000 100000]
+       [--datapoints 5] [--rounds 3]
+"""
+
+import argparse
+import random
+import time
+
+from aodh import evaluator
+from aodh.evaluator import comparison
+from aodh.evaluator import threshold
+
+
+class Evaluator(threshold.ThresholdEvaluator):
+    # NOTE: only the comparison of the datapoints is timed.
+    def __init__(self):
+        pass
+
+
+class ClosureEvaluator(Evaluator):
+    def _process_statistics(self, alarm_rule, statistics):
+        # NOTE: ThresholdEvaluator._process_statistics before the comparison
+        # module.
+        def _compare(value):
+            op = comparison.COMPARATORS[alarm_rule['comparison_operator']]
+            limit = alarm_rule['threshold']
+            threshold.LOG.debug('comparing value %(value)s against threshold'
+                                ' %(limit)s', {'value': value, 'limit': limit})
+            return op(value, limit)
+
+        compared = list(map(_compare, statistics))
+        distilled = all(compared)
+        unequivocal = distilled or not any(compared)
+        number_outside = len([c for c in compared if c])
+
+        if unequivocal:
+            state = evaluator.ALARM if distilled else evaluator.OK
+            return state, None, statistics, number_outside, None
+        trending_state = evaluator.ALARM if compared[-1] else evaluator.OK
+        return None, trending_state, statistics, number_outside, None
+
+
+def evaluate(evaluator):
+    def compare_windows(windows):
+        return [evaluator._process_statistics(rule, statistics)
+                for rule, statistics in windows]
+    return compare_windows
+
+
+def timed(func, windows, rounds):
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(windows)
+        durations.append(time.perf_counter() - start)
+    return result, min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alarms', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--datapoints', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    kernels = [('closure', evaluate(ClosureEvaluator())),
+               ('window', evaluate(Evaluator()))]
+
+    rand = random.Random(42)
+    print('%-8s %8s %10s %9s' % ('kernel', 'alarms', 'time(s)', 'speedup'))
+    for count in args.alarms:
+        windows = [({'comparison_operator': rand.choice(
+                        sorted(comparison.COMPARATORS)),
+                     'threshold': rand.uniform(0, 100)},
+                    [rand.uniform(0, 100) for _ in range(args.datapoints)])
+                   for _ in range(count)]
+        reference = None
+        for name, kernel in kernels:
+            result, duration = timed(kernel, windows, args.rounds)
+            if reference is None:
+                expected, reference = result, duration
+            elif result != expected:
+                raise AssertionError('%s compared differently' % name)
+            print('%-8s %8d %10.4f %8.2fx' % (
+                name, count, duration, reference / duration))
+
+
+if __name__ == '__main__':
+    main()